@@ -0,0 +1,482 @@
+"""
+GPU 없이 handler / client 오버헤드를 재기 위한 ComfyUI 대역 서버.
+
+- /prompt, /history, /ws, /queue, /interrupt, /object_info 를 ComfyUI 와 같은 형식으로 제공
+- prompt 는 한 번에 하나씩 실행하고, 실제 ComfyUI 와 같은 순서로 이벤트를 보냄
+  (status -> execution_start -> execution_cached -> executing / progress / 미리보기 바이너리 -> executed -> executing(None) -> execution_success)
+- 노드 실행 시간은 클래스 이름으로 흉내냄: *Loader* 는 처음 한 번만 로드 시간, *Sampler* 는 스텝 수 x 스텝 시간,
+  *Decode* 는 디코드 시간. 입력이 같은 노드는 다음 prompt 에서 execution_cached 로 보냄
+- 출력 노드 (*VideoCombine* / *SaveVideo* / *SaveImage*) 는 지정한 크기의 합성 mp4 / png 를 출력 디렉토리에 씀.
+  --video ffmpeg 이면 워크플로우의 프레임 수 / 해상도대로 실제 H.264 mp4 를 만듦 (세그먼트 생성처럼 ffmpeg 로 다시 읽는 기능 확인용)
+- POST /bench/config 로 실행 중에 출력 크기와 시간 설정을 바꿀 수 있음
+
+사용: python benchmark/fake_comfyui.py --port 8188 --output-dir /tmp/bench/output
+(aiohttp 필요: pip install -r benchmark/requirements.txt)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+import uuid
+import zlib
+
+from aiohttp import WSMsgType, web
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCHEMA_WORKFLOWS = [
+    os.path.join(REPO_DIR, "new_Wan22_api.json"),
+    os.path.join(REPO_DIR, "new_Wan22_flf2v_api.json"),
+]
+# 합성 출력 파일을 채우는 블록 (매번 난수를 만들지 않도록 재사용)
+FILL_BLOCK = os.urandom(1024 * 1024)
+
+
+def synthetic_mp4(path: str, size: int):
+    """ftyp + mdat 박스로 된 지정 크기의 mp4 모양 파일"""
+    ftyp = struct.pack(">I4s4sI8s", 24, b"ftyp", b"isom", 0x200, b"isomiso2")
+    body = max(size - len(ftyp) - 8, 0)
+    with open(path, "wb") as f:
+        f.write(ftyp)
+        f.write(struct.pack(">I4s", body + 8, b"mdat"))
+        while body > 0:
+            n = min(body, len(FILL_BLOCK))
+            f.write(FILL_BLOCK[:n])
+            body -= n
+
+
+def synthetic_png(path: str, size: int):
+    """1x1 PNG 에 보조 청크를 붙여 지정 크기로 맞춘 파일"""
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    head = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+    head += chunk(b"IDAT", zlib.compress(b"\x00\x80\x80\x80"))
+    tail = chunk(b"IEND", b"")
+    pad = max(size - len(head) - len(tail) - 12, 0)
+    with open(path, "wb") as f:
+        f.write(head)
+        if pad:
+            f.write(chunk(b"bnCh", (FILL_BLOCK * (pad // len(FILL_BLOCK) + 1))[:pad]))
+        f.write(tail)
+
+
+def find_ffmpeg() -> str | None:
+    path = os.getenv("FFMPEG_BIN") or shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+
+def rendered_mp4(path: str, frames: int, width: int, height: int, fps: int = 16):
+    """ffmpeg 테스트 패턴으로 만든 실제 H.264 mp4 (프레임 수 / 해상도는 워크플로우 값)"""
+    ffmpeg = find_ffmpeg()
+    if ffmpeg is None:
+        raise RuntimeError("--video ffmpeg 에는 ffmpeg 가 필요합니다.")
+    subprocess.run(
+        [
+            ffmpeg, "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}",
+            "-frames:v", str(frames), "-c:v", "libx264", "-pix_fmt", "yuv420p", path,
+        ],
+        check=True,
+    )
+
+
+def is_output_class(class_type: str) -> bool:
+    return any(key in class_type for key in ("VideoCombine", "SaveVideo", "SaveImage"))
+
+
+def permissive_schema(workflow_paths: list[str]) -> dict:
+    """워크플로우 파일에 나오는 노드 클래스를 모든 입력 / 타입을 허용하는 스키마로 만듦 (검증 단계 측정용)"""
+    schema = {}
+    for path in workflow_paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                workflow = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        for node in workflow.values():
+            entry = schema.setdefault(
+                node["class_type"],
+                {"input": {"required": {}, "optional": {}}, "output": ["*"] * 8, "output_node": is_output_class(node["class_type"])},
+            )
+            for name in node.get("inputs", {}):
+                entry["input"]["optional"][name] = ["*"]
+    return schema
+
+
+class FakeComfyUI:
+    def __init__(self, args):
+        self.output_dir = args.output_dir
+        self.config = {
+            "output_mb": args.output_mb,
+            "load_time": args.load_time,
+            "step_time": args.step_time,
+            "decode_time": args.decode_time,
+            "node_time": args.node_time,
+            "preview_kb": args.preview_kb,
+        }
+        self.video = args.video
+        self.schema = (
+            json.load(open(args.object_info, "r", encoding="utf-8"))
+            if args.object_info
+            else permissive_schema(DEFAULT_SCHEMA_WORKFLOWS)
+        )
+        self.clients: dict[str, web.WebSocketResponse] = {}
+        self.pending: list[tuple[int, str, dict, str]] = []
+        self.running: tuple[int, str, dict, str] | None = None
+        self.history: dict[str, dict] = {}
+        self.loaded: set[str] = set()
+        self.cache: set[str] = set()
+        self.counter = 0
+        self.number = 0
+        self.interrupted = False
+        self.wakeup = asyncio.Event()
+
+    # ---- WebSocket ----
+
+    async def send(self, client_id: str, message: dict):
+        ws = self.clients.get(client_id)
+        if ws is not None and not ws.closed:
+            await ws.send_str(json.dumps(message))
+
+    async def send_bytes(self, client_id: str, data: bytes):
+        ws = self.clients.get(client_id)
+        if ws is not None and not ws.closed:
+            await ws.send_bytes(data)
+
+    def queue_status(self) -> dict:
+        remaining = len(self.pending) + (1 if self.running else 0)
+        return {"type": "status", "data": {"status": {"exec_info": {"queue_remaining": remaining}}}}
+
+    async def broadcast_status(self):
+        for client_id in list(self.clients):
+            await self.send(client_id, self.queue_status())
+
+    async def ws_handler(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        client_id = request.query.get("clientId") or uuid.uuid4().hex
+        self.clients[client_id] = ws
+        status = self.queue_status()
+        status["data"]["sid"] = client_id
+        await ws.send_str(json.dumps(status))
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            if self.clients.get(client_id) is ws:
+                del self.clients[client_id]
+        return ws
+
+    # ---- HTTP ----
+
+    async def post_prompt(self, request):
+        body = await request.json()
+        prompt = body.get("prompt")
+        if not isinstance(prompt, dict) or not prompt:
+            return web.json_response({"error": {"type": "invalid_prompt", "message": "no prompt"}}, status=400)
+        prompt_id = body.get("prompt_id") or str(uuid.uuid4())
+        number = self.number
+        self.number += 1
+        self.pending.append((number, prompt_id, prompt, body.get("client_id", "")))
+        self.wakeup.set()
+        await self.broadcast_status()
+        return web.json_response({"prompt_id": prompt_id, "number": number, "node_errors": {}})
+
+    async def get_history(self, request):
+        prompt_id = request.match_info.get("prompt_id")
+        if prompt_id is None:
+            return web.json_response(self.history)
+        return web.json_response({prompt_id: self.history[prompt_id]} if prompt_id in self.history else {})
+
+    async def post_history(self, request):
+        body = await request.json()
+        if body.get("clear"):
+            self.history.clear()
+        for prompt_id in body.get("delete", []):
+            self.history.pop(prompt_id, None)
+        return web.json_response({})
+
+    async def get_queue(self, request):
+        def row(item):
+            number, prompt_id, prompt, client_id = item
+            return [number, prompt_id, prompt, {"client_id": client_id}, []]
+
+        return web.json_response(
+            {
+                "queue_running": [row(self.running)] if self.running else [],
+                "queue_pending": [row(item) for item in self.pending],
+            }
+        )
+
+    async def post_queue(self, request):
+        body = await request.json()
+        if body.get("clear"):
+            self.pending.clear()
+        delete = set(body.get("delete", []))
+        self.pending = [item for item in self.pending if item[1] not in delete]
+        await self.broadcast_status()
+        return web.json_response({})
+
+    async def post_interrupt(self, request):
+        # ComfyUI 와 같이 prompt_id 를 주면 그 prompt 가 실행 중일 때만 중단
+        body = await request.json() if request.can_read_body else {}
+        prompt_id = (body or {}).get("prompt_id")
+        if self.running is not None and prompt_id in (None, self.running[1]):
+            self.interrupted = True
+        return web.json_response({})
+
+    async def get_object_info(self, request):
+        return web.json_response(self.schema)
+
+    async def get_system_stats(self, request):
+        return web.json_response({"system": {"os": sys.platform, "python_version": sys.version}, "devices": []})
+
+    async def post_config(self, request):
+        body = await request.json()
+        for key, value in body.items():
+            if key in self.config:
+                self.config[key] = float(value)
+        return web.json_response(self.config)
+
+    async def post_reset(self, request):
+        """모델 로드 / 노드 캐시 상태 초기화 (cold start 재현)"""
+        self.loaded.clear()
+        self.cache.clear()
+        return web.json_response({})
+
+    # ---- 실행 ----
+
+    @staticmethod
+    def order_nodes(prompt: dict) -> list[str]:
+        """링크 의존 순서 (ComfyUI 와 같이 위에서 아래로)"""
+        order, seen = [], set()
+
+        def visit(node_id: str):
+            if node_id in seen or node_id not in prompt:
+                return
+            seen.add(node_id)
+            for value in prompt[node_id].get("inputs", {}).values():
+                if isinstance(value, list) and len(value) == 2:
+                    visit(str(value[0]))
+            order.append(node_id)
+
+        for node_id in prompt:
+            visit(node_id)
+        return order
+
+    @staticmethod
+    def resolve_int(prompt: dict, value, default: int) -> int:
+        """정수 입력 값 (INTConstant 등으로 연결돼 있으면 따라감)"""
+        for _ in range(8):
+            if isinstance(value, list) and len(value) == 2:
+                value = prompt.get(str(value[0]), {}).get("inputs", {}).get("value", default)
+                continue
+            break
+        return value if isinstance(value, int) and not isinstance(value, bool) else default
+
+    @staticmethod
+    def signatures(prompt: dict, order: list[str]) -> dict[str, str]:
+        """노드 입력 (연결된 노드의 서명 포함) 으로 만든 캐시 서명"""
+        sigs = {}
+        for node_id in order:
+            node = prompt[node_id]
+            inputs = {
+                name: sigs.get(str(value[0]), "?") + f":{value[1]}" if isinstance(value, list) and len(value) == 2 else value
+                for name, value in node.get("inputs", {}).items()
+            }
+            sigs[node_id] = json.dumps([node.get("class_type"), inputs], sort_keys=True, default=str)
+        return sigs
+
+    async def sleep(self, seconds: float) -> bool:
+        """실행 시간 흉내. 중단되면 False"""
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if self.interrupted:
+                return False
+            await asyncio.sleep(min(0.05, deadline - time.monotonic()))
+        return not self.interrupted
+
+    def video_shape(self, prompt: dict) -> tuple[int, int, int]:
+        """워크플로우의 (프레임 수, 너비, 높이). 렌더링 속도를 위해 해상도는 최대 128 로 줄임"""
+        frames, width, height = 81, 64, 64
+        for node in prompt.values():
+            inputs = node.get("inputs", {})
+            for name in ("num_frames", "length"):
+                if name in inputs:
+                    frames = self.resolve_int(prompt, inputs[name], frames)
+            if "num_frames" in inputs and "width" in inputs:
+                width = self.resolve_int(prompt, inputs["width"], width)
+                height = self.resolve_int(prompt, inputs["height"], height)
+        scale = max(width, height) / 128
+        if scale > 1:
+            width, height = int(width / scale), int(height / scale)
+        return frames, max(16, width // 2 * 2), max(16, height // 2 * 2)
+
+    def write_output(self, class_type: str, prompt: dict) -> tuple[str, dict]:
+        self.counter += 1
+        size = int(self.config["output_mb"] * 1024 * 1024)
+        if "SaveImage" in class_type:
+            filename = f"ComfyUI_{self.counter:05d}_.png"
+            synthetic_png(os.path.join(self.output_dir, filename), size)
+            return "images", {"filename": filename, "subfolder": "", "type": "output"}
+        filename = f"wan22_{self.counter:05d}.mp4"
+        path = os.path.join(self.output_dir, filename)
+        if self.video == "ffmpeg":
+            rendered_mp4(path, *self.video_shape(prompt))
+        else:
+            synthetic_mp4(path, size)
+        return "gifs", {"filename": filename, "subfolder": "", "type": "output", "format": "video/h264-mp4", "fullpath": path}
+
+    async def execute(self, number: int, prompt_id: str, prompt: dict, client_id: str):
+        started = time.time()
+        order = self.order_nodes(prompt)
+        sigs = self.signatures(prompt, order)
+        is_output = {n: is_output_class(prompt[n].get("class_type", "")) for n in order}
+        cached = [n for n in order if sigs[n] in self.cache and not is_output[n]]
+        messages = [["execution_start", {"prompt_id": prompt_id, "timestamp": int(started * 1000)}]]
+
+        await self.send(client_id, {"type": "execution_start", "data": messages[0][1]})
+        await self.send(client_id, {"type": "execution_cached", "data": {"nodes": cached, "prompt_id": prompt_id}})
+
+        outputs = {}
+        error = None
+        for node_id in order:
+            if node_id in cached:
+                continue
+            class_type = prompt[node_id].get("class_type", "")
+            await self.send(client_id, {"type": "executing", "data": {"node": node_id, "display_node": node_id, "prompt_id": prompt_id}})
+
+            ok = True
+            if "Loader" in class_type:
+                if sigs[node_id] not in self.loaded:
+                    ok = await self.sleep(self.config["load_time"])
+                    self.loaded.add(sigs[node_id])
+            elif "Sampler" in class_type:
+                inputs = prompt[node_id].get("inputs", {})
+                steps = self.resolve_int(prompt, inputs.get("steps"), 10)
+                start = self.resolve_int(prompt, inputs.get("start_step"), 0)
+                end = self.resolve_int(prompt, inputs.get("end_step"), -1)
+                steps = max(1, (steps if end < 0 else min(end, steps)) - start)
+                preview = FILL_BLOCK[: int(self.config["preview_kb"] * 1024)]
+                for step in range(1, steps + 1):
+                    ok = await self.sleep(self.config["step_time"])
+                    if not ok:
+                        break
+                    await self.send(client_id, {"type": "progress", "data": {"value": step, "max": steps, "prompt_id": prompt_id, "node": node_id}})
+                    if preview:
+                        # 미리보기 이미지 (바이너리, 형식 1 = JPEG)
+                        await self.send_bytes(client_id, struct.pack(">II", 1, 1) + preview)
+            elif "Decode" in class_type:
+                ok = await self.sleep(self.config["decode_time"])
+            else:
+                ok = await self.sleep(self.config["node_time"])
+
+            if not ok:
+                error = "interrupted"
+                break
+            if is_output[node_id]:
+                key, item = await asyncio.to_thread(self.write_output, class_type, prompt)
+                outputs[node_id] = {key: [item]}
+                await self.send(
+                    client_id,
+                    {"type": "executed", "data": {"node": node_id, "display_node": node_id, "output": outputs[node_id], "prompt_id": prompt_id}},
+                )
+            else:
+                self.cache.add(sigs[node_id])
+
+        if error == "interrupted":
+            self.interrupted = False
+            data = {"prompt_id": prompt_id, "node_id": node_id, "node_type": class_type, "executed": list(outputs), "timestamp": int(time.time() * 1000)}
+            messages.append(["execution_interrupted", data])
+            await self.send(client_id, {"type": "execution_interrupted", "data": data})
+            status = {"status_str": "error", "completed": False, "messages": messages}
+        else:
+            await self.send(client_id, {"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+            data = {"prompt_id": prompt_id, "timestamp": int(time.time() * 1000)}
+            messages.append(["execution_success", data])
+            await self.send(client_id, {"type": "execution_success", "data": data})
+            status = {"status_str": "success", "completed": True, "messages": messages}
+
+        self.history[prompt_id] = {
+            "prompt": [number, prompt_id, prompt, {"client_id": client_id}, list(outputs)],
+            "outputs": outputs,
+            "status": status,
+            "meta": {n: {"node_id": n, "display_node": n} for n in outputs},
+        }
+
+    async def worker(self):
+        while True:
+            while not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            self.running = self.pending.pop(0)
+            await self.broadcast_status()
+            try:
+                await self.execute(*self.running)
+            finally:
+                self.running = None
+                await self.broadcast_status()
+
+
+def build_app(args) -> web.Application:
+    fake = FakeComfyUI(args)
+    app = web.Application(client_max_size=1024 ** 3)
+    app.router.add_get("/ws", fake.ws_handler)
+    app.router.add_post("/prompt", fake.post_prompt)
+    app.router.add_get("/history", fake.get_history)
+    app.router.add_get("/history/{prompt_id}", fake.get_history)
+    app.router.add_post("/history", fake.post_history)
+    app.router.add_get("/queue", fake.get_queue)
+    app.router.add_post("/queue", fake.post_queue)
+    app.router.add_post("/interrupt", fake.post_interrupt)
+    app.router.add_get("/object_info", fake.get_object_info)
+    app.router.add_get("/system_stats", fake.get_system_stats)
+    app.router.add_get("/", fake.get_system_stats)
+    app.router.add_post("/bench/config", fake.post_config)
+    app.router.add_post("/bench/reset", fake.post_reset)
+
+    async def start_worker(app):
+        app["worker"] = asyncio.create_task(fake.worker())
+
+    async def stop_worker(app):
+        app["worker"].cancel()
+
+    app.on_startup.append(start_worker)
+    app.on_cleanup.append(stop_worker)
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ComfyUI 대역 서버 (benchmark 용)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--output-dir", required=True, help="출력 파일을 쓸 디렉토리 (handler 의 COMFY_OUTPUT_DIR)")
+    parser.add_argument("--output-mb", type=float, default=8.0, help="출력 파일 하나의 크기 (MB)")
+    parser.add_argument("--load-time", type=float, default=0.5, help="*Loader* 노드 첫 실행 시간 (초)")
+    parser.add_argument("--step-time", type=float, default=0.02, help="*Sampler* 노드 스텝당 시간 (초)")
+    parser.add_argument("--decode-time", type=float, default=0.1, help="*Decode* 노드 실행 시간 (초)")
+    parser.add_argument("--node-time", type=float, default=0.002, help="그 밖의 노드 실행 시간 (초)")
+    parser.add_argument("--preview-kb", type=float, default=16, help="스텝마다 보내는 미리보기 바이너리 크기 (KB, 0 이면 안 보냄)")
+    parser.add_argument("--video", choices=("synthetic", "ffmpeg"), default="synthetic", help="출력 비디오: 지정 크기의 합성 파일 / ffmpeg 로 만든 실제 mp4")
+    parser.add_argument("--object-info", help="/object_info 로 돌려줄 JSON 파일 (없으면 템플릿에서 만든 허용 스키마)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+    web.run_app(build_app(args), host=args.host, port=args.port, print=None)
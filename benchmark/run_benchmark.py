@@ -0,0 +1,305 @@
+"""
+handler 오버헤드 benchmark (GPU 없이 fake_comfyui.py 로 실행).
+
+입력 크기 x 출력 크기 x 동시 job 수 조합마다 새 프로세스에서 handler 를 import 하고 job 을 돌려서
+- job 지연 시간 (handler() 호출부터 결과까지) p50 / p95 / 평균 / 최대
+- handler 단계별 시간 (timings.phases 평균)
+- 처리량 (jobs/s), 최대 RSS
+를 재고 결과를 JSON 파일로 저장함. --compare 로 이전 결과와 비교 (커밋 간 회귀 확인).
+
+사용:
+    python benchmark/run_benchmark.py --input-mb 0.5 4 --output-mb 1 16 --concurrency 1 2 4 --jobs 8 \\
+        --out benchmark/results.json --compare benchmark/baseline.json
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import zlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+# 비교할 지표: (이름, 클수록 나쁜지)
+COMPARE_METRICS = (("latency_p50", True), ("latency_p95", True), ("throughput", False), ("peak_rss_mb", True))
+
+
+def synthetic_png(size: int, salt: int) -> bytes:
+    """지정 크기의 PNG (job 마다 내용이 달라서 입력 캐시에 걸리지 않음)"""
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    head = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+    head += chunk(b"IDAT", zlib.compress(b"\x00\x80\x80\x80"))
+    tail = chunk(b"IEND", b"")
+    pad = max(size - len(head) - len(tail) - 12, 8)
+    block = os.urandom(min(pad, 1024 * 1024))
+    data = struct.pack(">Q", salt) + (block * (pad // len(block) + 1))[: pad - 8]
+    return head + chunk(b"bnCh", data) + tail
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+    return values[index]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def post_json(url: str, payload: dict) -> dict:
+    request = urllib.request.Request(url, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)
+
+
+def git_info() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=REPO_DIR, capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+# ---- 자식 프로세스: handler 를 import 해서 job 실행 ----
+
+
+def run_scenario(args) -> dict:
+    """이 프로세스에서 handler 로 job 을 돌리고 측정값 반환 (환경 변수는 부모가 설정)"""
+    sys.path.insert(0, REPO_DIR)
+    import handler
+
+    rss_baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    images = [
+        base64.b64encode(synthetic_png(int(args.input_mb * 1024 * 1024), i)).decode()
+        for i in range(args.jobs + 1)
+    ]
+
+    def make_job(i: int) -> dict:
+        return {
+            "id": f"bench-{i}",
+            "input": {"image_base64": images[i], "prompt": "benchmark", "seed": i, "steps": args.steps, "length": args.length},
+        }
+
+    async def timed(job: dict, semaphore: asyncio.Semaphore) -> tuple[float, dict]:
+        async with semaphore:
+            t0 = time.monotonic()
+            result = await handler.handler(job)
+            return time.monotonic() - t0, result
+
+    async def main():
+        # 첫 job: ComfyUI 연결 / 스키마 조회 / 모델 로드가 들어가므로 따로 기록
+        first_latency, first = await timed(make_job(args.jobs), asyncio.Semaphore(1))
+        semaphore = asyncio.Semaphore(args.concurrency)
+        t0 = time.monotonic()
+        runs = await asyncio.gather(*(timed(make_job(i), semaphore) for i in range(args.jobs)))
+        return first_latency, first, runs, time.monotonic() - t0
+
+    first_latency, first, runs, wall = asyncio.run(main())
+
+    latencies = [latency for latency, result in runs if "error" not in result]
+    errors = [result["error"] for _, result in runs if "error" in result]
+    phases: dict[str, list[float]] = {}
+    for _, result in runs:
+        for name, seconds in (result.get("timings") or {}).get("phases", {}).items():
+            phases.setdefault(name, []).append(seconds)
+    output_bytes = [len(result.get("videoUrl", "")) for _, result in runs if "error" not in result]
+
+    return {
+        "jobs": args.jobs,
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "first_job_seconds": round(first_latency, 4),
+        "first_job_error": first.get("error"),
+        "wall_seconds": round(wall, 4),
+        "throughput": round(len(latencies) / wall, 4) if wall else None,
+        "latency_mean": round(statistics.mean(latencies), 4) if latencies else None,
+        "latency_p50": round(percentile(latencies, 0.5), 4) if latencies else None,
+        "latency_p95": round(percentile(latencies, 0.95), 4) if latencies else None,
+        "latency_max": round(max(latencies), 4) if latencies else None,
+        "phases_mean": {name: round(statistics.mean(values), 4) for name, values in phases.items()},
+        "response_mb": round(statistics.mean(output_bytes) / (1024 * 1024), 3) if output_bytes else None,
+        # Linux 의 ru_maxrss 는 KB
+        "baseline_rss_mb": round(rss_baseline / 1024, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+# ---- 부모 프로세스: fake ComfyUI 를 띄우고 조합마다 자식 프로세스 실행 ----
+
+
+def start_fake(args, port: int, output_dir: str) -> subprocess.Popen:
+    cmd = [
+        sys.executable, os.path.join(BENCH_DIR, "fake_comfyui.py"),
+        "--port", str(port), "--output-dir", output_dir,
+        "--load-time", str(args.load_time), "--step-time", str(args.step_time),
+        "--decode-time", str(args.decode_time), "--preview-kb", str(args.preview_kb),
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"fake ComfyUI 시작 실패: {proc.stderr.read().decode(errors='replace')}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/system_stats", timeout=1):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("fake ComfyUI 가 응답하지 않습니다.")
+
+
+def run_child(args, port: int, work_dir: str, input_mb: float, concurrency: int) -> dict:
+    env = dict(os.environ)
+    env.update(
+        {
+            "SERVER_ADDRESS": "127.0.0.1",
+            "SERVER_PORT": str(port),
+            "COMFY_INPUT_DIR": os.path.join(work_dir, "input"),
+            "COMFY_OUTPUT_DIR": os.path.join(work_dir, "output"),
+            "COMFY_TEMP_DIR": os.path.join(work_dir, "temp"),
+            "RESULT_CACHE_MAX_MB": "0",
+            "MAX_CONCURRENCY": str(concurrency),
+            "STREAM_PROGRESS": "false",
+            "WARMUP": "false",
+        }
+    )
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--child",
+        "--input-mb", str(input_mb), "--concurrency", str(concurrency),
+        "--jobs", str(args.jobs), "--steps", str(args.steps), "--length", str(args.length),
+    ]
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=args.timeout)
+    if proc.returncode != 0:
+        raise RuntimeError(f"benchmark 프로세스 실패 ({proc.returncode}): {proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def scenario_key(scenario: dict) -> tuple:
+    return (scenario["input_mb"], scenario["output_mb"], scenario["concurrency"])
+
+
+def compare(previous: dict, current: dict, threshold: float) -> list[str]:
+    """이전 결과 대비 threshold 이상 나빠진 지표 목록 (표도 출력)"""
+    before = {scenario_key(s): s for s in previous.get("scenarios", [])}
+    regressions = []
+    print(f"\n비교 대상: {previous.get('meta', {}).get('git', {}).get('commit')}")
+    print(f"{'input_mb':>8} {'output_mb':>9} {'conc':>4}  " + "  ".join(f"{name:>22}" for name, _ in COMPARE_METRICS))
+    for scenario in current["scenarios"]:
+        old = before.get(scenario_key(scenario))
+        if old is None:
+            continue
+        cells = []
+        for name, higher_is_worse in COMPARE_METRICS:
+            a, b = old.get(name), scenario.get(name)
+            if not a or b is None:
+                cells.append(f"{'-':>22}")
+                continue
+            change = (b - a) / a
+            cells.append(f"{a:.3f} -> {b:.3f} ({change:+.0%})".rjust(22))
+            if (change if higher_is_worse else -change) > threshold:
+                regressions.append(f"{scenario_key(scenario)} {name}: {a} -> {b} ({change:+.1%})")
+        print(f"{scenario['input_mb']:>8} {scenario['output_mb']:>9} {scenario['concurrency']:>4}  " + "  ".join(cells))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="handler benchmark (fake ComfyUI)")
+    parser.add_argument("--input-mb", type=float, nargs="+", default=[0.5, 4.0], help="입력 이미지 크기 (MB)")
+    parser.add_argument("--output-mb", type=float, nargs="+", default=[1.0, 16.0], help="출력 비디오 크기 (MB)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4], help="동시 job 수")
+    parser.add_argument("--jobs", type=int, default=8, help="조합마다 측정하는 job 수 (첫 job 은 별도)")
+    parser.add_argument("--steps", type=int, default=4, help="job 의 샘플링 스텝 수")
+    parser.add_argument("--length", type=int, default=81, help="job 의 프레임 수")
+    parser.add_argument("--load-time", type=float, default=0.5)
+    parser.add_argument("--step-time", type=float, default=0.02)
+    parser.add_argument("--decode-time", type=float, default=0.1)
+    parser.add_argument("--preview-kb", type=float, default=16)
+    parser.add_argument("--timeout", type=float, default=1800, help="조합 하나의 제한 시간 (초)")
+    parser.add_argument("--out", default=os.path.join(BENCH_DIR, "results.json"), help="결과 JSON 파일")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON 파일")
+    parser.add_argument("--threshold", type=float, default=0.1, help="회귀로 볼 변화율 (기본 10%%)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        args.input_mb, args.concurrency = args.input_mb[0], args.concurrency[0]
+        print(json.dumps(run_scenario(args)))
+        return 0
+
+    work_root = tempfile.mkdtemp(prefix="wan22-bench-")
+    port = free_port()
+    fake = start_fake(args, port, os.path.join(work_root, "output"))
+    scenarios = []
+    try:
+        for output_mb in args.output_mb:
+            post_json(f"http://127.0.0.1:{port}/bench/config", {"output_mb": output_mb})
+            for input_mb in args.input_mb:
+                for concurrency in args.concurrency:
+                    # 조합마다 모델 로드 상태와 입출력 디렉토리를 비움 (첫 job 이 cold start)
+                    post_json(f"http://127.0.0.1:{port}/bench/reset", {})
+                    for sub in ("input", "temp"):
+                        shutil.rmtree(os.path.join(work_root, sub), ignore_errors=True)
+                    for name in os.listdir(os.path.join(work_root, "output")):
+                        os.remove(os.path.join(work_root, "output", name))
+                    result = run_child(args, port, work_root, input_mb, concurrency)
+                    scenario = {"input_mb": input_mb, "output_mb": output_mb, "concurrency": concurrency, **result}
+                    scenarios.append(scenario)
+                    print(
+                        f"input {input_mb}MB / output {output_mb}MB / concurrency {concurrency}: "
+                        f"p50 {scenario['latency_p50']}s, p95 {scenario['latency_p95']}s, "
+                        f"{scenario['throughput']} jobs/s, peak RSS {scenario['peak_rss_mb']}MB, errors {scenario['errors']}",
+                        flush=True,
+                    )
+    finally:
+        fake.terminate()
+        fake.wait(timeout=10)
+        shutil.rmtree(work_root, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git": git_info(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("child", "out", "compare")},
+        },
+        "scenarios": scenarios,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"결과 저장: {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print("\n회귀:\n" + "\n".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
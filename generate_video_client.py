@@ -5,22 +5,875 @@ Client for generating videos from images using RunPod's generate_video endpoint
 """
 
 import os
+import codecs
+import mimetypes
+import shutil
+import tempfile
 import requests
 import json
 import time
 import base64
-from typing import Optional, Dict, Any, List, Union
+import random
+import secrets
+import threading
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Dict, Any, List, Union, Iterator, Iterable, Callable
 import logging
 
 # Logging configuration
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Chunk size for streaming base64 (multiple of 3 for encoding, of 4 for decoding)
+BASE64_CHUNK_SIZE = 3 * 1024 * 1024
+# Output keys that are decoded to a file while the response is read
+SPOOLED_OUTPUT_KEYS = ('videoUrl', 'video')
+# Characters of raw base64; a legacy `video` value is spooled only if it is longer than
+# 8 characters and starts with these (URLs and short strings stay as they are)
+BASE64_CHARS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=')
+
+
+class Base64File:
+    """
+    File that is base64-encoded chunk by chunk while a request body is sent
+    
+    Put it anywhere in a job input in place of a base64 string; StreamingJSONBody
+    writes it as a JSON string without loading the whole file.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.size = os.path.getsize(path)
+    
+    def encoded_size(self) -> int:
+        return (self.size + 2) // 3 * 4
+    
+    def iter_encoded(self, chunk_size: int = BASE64_CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield base64.b64encode(chunk)
+    
+    def __repr__(self) -> str:
+        return f"<base64 of {self.path} ({self.size} bytes)>"
+
+
+class StreamingJSONBody:
+    """
+    JSON request body with Base64File values encoded on the fly
+    
+    Has a length (so requests sends Content-Length instead of chunked encoding)
+    and can be iterated again when a request is retried.
+    """
+    
+    def __init__(self, payload: Any):
+        files: List[Base64File] = []
+        marker = f"__base64_file_{secrets.token_hex(8)}__"
+        
+        def placeholder(value: Any) -> str:
+            if isinstance(value, Base64File):
+                files.append(value)
+                return marker
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+        
+        text = json.dumps(payload, default=placeholder, ensure_ascii=False)
+        self.parts = [part.encode('utf-8') for part in text.split(marker)]
+        self.files = files
+    
+    def __len__(self) -> int:
+        return sum(len(part) for part in self.parts) + sum(f.encoded_size() for f in self.files)
+    
+    def __iter__(self) -> Iterator[bytes]:
+        for i, part in enumerate(self.parts):
+            yield part
+            if i < len(self.files):
+                yield from self.files[i].iter_encoded()
+
+
+class Base64Writer:
+    """Decode base64 text (raw or a data URL) into a file, chunk by chunk"""
+    
+    def __init__(self, f):
+        self.file = f
+        self.mime: Optional[str] = None
+        self._header: Optional[str] = None
+        self._started = False
+        self._rest = ''
+    
+    def write(self, text: str) -> None:
+        if not self._started:
+            self._started = True
+            if text.startswith('data:'):
+                self._header = ''
+        if self._header is not None:
+            self._header += text
+            if ',' not in self._header:
+                return
+            header, text = self._header.split(',', 1)
+            self.mime = header[5:].split(';', 1)[0] or None
+            self._header = None
+        
+        data = self._rest + text
+        usable = len(data) - len(data) % 4
+        if usable:
+            self.file.write(base64.b64decode(data[:usable]))
+        self._rest = data[usable:]
+    
+    def close(self) -> None:
+        if self._rest.strip('='):
+            self.file.write(base64.b64decode(self._rest + '=' * (-len(self._rest) % 4)))
+        self._rest = ''
+
+
+def write_base64_to_file(value: str, path: str, chunk_size: int = BASE64_CHUNK_SIZE) -> Optional[str]:
+    """
+    Decode a base64 string or data URL into a file without a full decoded copy
+    
+    Returns:
+        MIME type of a data URL, otherwise None
+    """
+    with open(path, 'wb') as f:
+        writer = Base64Writer(f)
+        chunk_size -= chunk_size % 4
+        for start in range(0, len(value), chunk_size):
+            writer.write(value[start:start + chunk_size])
+        writer.close()
+    return writer.mime
+
+
+def _remove_files(paths: set) -> None:
+    """Delete files (missing ones are ignored) and forget them"""
+    for path in list(paths):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        paths.discard(path)
+
+
+def load_json_spooled(
+    chunks: Iterable[bytes],
+    spool_dir: str,
+    keys: tuple = SPOOLED_OUTPUT_KEYS,
+    spooled_files: Optional[set] = None
+) -> Any:
+    """
+    Parse a JSON document while decoding large base64 outputs straight to disk
+    
+    String values under `keys` (a data URL, or raw base64 for the legacy `video`
+    key) are never held in memory: they are decoded into files in spool_dir and
+    replaced in their object by `videoFile` (path of the first decoded file).
+    Everything else, including URLs under those keys, is parsed normally.
+    If parsing fails, the files decoded so far are deleted.
+    
+    Args:
+        chunks: Response body as byte chunks
+        spool_dir: Directory for decoded files
+        keys: Keys whose string values are decoded to files
+        spooled_files: Set that receives the paths of the decoded files
+    
+    Returns:
+        Parsed JSON document
+    """
+    marker = f"__spooled_{secrets.token_hex(8)}__:"
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    skeleton: List[str] = []
+    spooled: List[str] = []
+    
+    in_string = False
+    escape = False
+    string_start = 0
+    string_len = 0
+    last_string: Optional[str] = None
+    between: List[str] = []
+    probe_key: Optional[str] = None
+    writer: Optional[Base64Writer] = None
+    writer_file = None
+    
+    def start_spool(raw: str) -> None:
+        nonlocal writer, writer_file
+        fd, path = tempfile.mkstemp(prefix='video_', dir=spool_dir)
+        writer_file = os.fdopen(fd, 'wb')
+        writer = Base64Writer(writer_file)
+        spooled.append(path)
+        writer.write(raw.replace('\\/', '/'))
+    
+    def finish_spool() -> None:
+        nonlocal writer, writer_file
+        writer.close()
+        writer_file.close()
+        path = spooled[-1]
+        ext = mimetypes.guess_extension(writer.mime or '') or ''
+        if ext:
+            os.replace(path, path + ext)
+            spooled[-1] = path + ext
+        skeleton.append(json.dumps(f"{marker}{len(spooled) - 1}"))
+        writer = writer_file = None
+    
+    try:
+        for chunk in chunks:
+            text = decoder.decode(chunk)
+            i, n = 0, len(text)
+            while i < n:
+                if writer is not None:
+                    if escape:
+                        # Only "\/" can appear in base64 text
+                        writer.write(text[i])
+                        escape = False
+                        i += 1
+                        continue
+                    end = min((j for j in (text.find('"', i), text.find('\\', i)) if j >= 0), default=n)
+                    writer.write(text[i:end])
+                    if end == n:
+                        i = n
+                    elif text[end] == '\\':
+                        escape = True
+                        i = end + 1
+                    else:
+                        finish_spool()
+                        between = []
+                        i = end + 1
+                elif in_string:
+                    if escape:
+                        skeleton.append(text[i])
+                        string_len += 1
+                        escape = False
+                        i += 1
+                        continue
+                    end = min((j for j in (text.find('"', i), text.find('\\', i)) if j >= 0), default=n)
+                    skeleton.append(text[i:end])
+                    string_len += end - i
+                    closed = end < n and text[end] == '"'
+                    if end < n and not closed:
+                        skeleton.append('\\')
+                        escape = True
+                        end += 1
+                    
+                    if probe_key is not None and (string_len >= 8 or closed):
+                        # Decide from the first characters whether this value is base64 to spool
+                        raw = ''.join(skeleton[string_start + 1:])
+                        key, probe_key = probe_key, None
+                        probe = (raw[:-1] if escape else raw).replace('\\/', '/')
+                        if raw and (raw.startswith('data:') or (key == 'video' and not closed and BASE64_CHARS.issuperset(probe))):
+                            pending_escape = escape
+                            del skeleton[string_start:]
+                            in_string = escape = False
+                            start_spool(raw[:-1] if pending_escape else raw)
+                            escape = pending_escape
+                            i = end
+                            continue
+                    
+                    if closed:
+                        skeleton.append('"')
+                        in_string = False
+                        last_string = ''.join(skeleton[string_start + 1:-1]) if string_len <= 64 else None
+                        between = []
+                        i = end + 1
+                    else:
+                        i = end
+                else:
+                    end = text.find('"', i)
+                    if end < 0:
+                        end = n
+                    segment = text[i:end]
+                    skeleton.append(segment)
+                    if len(between) < 8:
+                        between.append(segment)
+                    if end < n:
+                        key = last_string if ''.join(between).strip() == ':' else None
+                        last_string = None
+                        in_string = True
+                        string_start = len(skeleton)
+                        string_len = 0
+                        skeleton.append('"')
+                        probe_key = key if key in keys else None
+                    i = end + 1 if end < n else n
+        
+        document = json.loads(''.join(skeleton))
+    except BaseException:
+        # Do not leave half-written files behind
+        if writer_file is not None:
+            writer_file.close()
+        _remove_files(set(spooled))
+        raise
+    
+    def resolve(node: Any) -> None:
+        if isinstance(node, dict):
+            for key, value in list(node.items()):
+                if isinstance(value, str) and value.startswith(marker):
+                    path = spooled[int(value[len(marker):])]
+                    del node[key]
+                    if 'videoFile' in node:
+                        os.remove(path)
+                    else:
+                        node['videoFile'] = path
+                        if spooled_files is not None:
+                            spooled_files.add(path)
+                else:
+                    resolve(value)
+        elif isinstance(node, list):
+            for value in node:
+                resolve(value)
+    
+    resolve(document)
+    return document
+
+
+class BatchManifest:
+    """
+    On-disk state of a batch run, rewritten atomically after every change
+    
+    Each item is keyed by image filename:
+    {"status": "pending|submitted|completed|failed", "job_id", "trace_id", "attempts", "output_file", "error"}
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.items: Dict[str, Dict[str, Any]] = {}
+        
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.items = json.load(f).get('items', {})
+                logger.info(f"Resuming batch from manifest: {path} ({len(self.items)} items)")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read batch manifest, starting over: {e}")
+    
+    def get(self, filename: str) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.items.get(filename) or {'status': 'pending', 'attempts': 0})
+    
+    def update(self, filename: str, **fields: Any) -> None:
+        with self._lock:
+            item = self.items.setdefault(filename, {'status': 'pending', 'attempts': 0})
+            item.update(fields)
+            item['updated_at'] = time.time()
+            
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'items': self.items}, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+class Tracer:
+    """
+    Timed spans grouped by trace, appended to a JSON-lines file
+    
+    submit_job starts one trace per job and passes its ID to the worker. The
+    client records its own spans (submit, RunPod queue / execution, result
+    fetch, save) and merges the worker spans returned in output["trace"], so
+    every job yields one latency waterfall from submit to saved file.
+    
+    Each line of the file is one span: trace_id, span_id, parent_span_id,
+    name, service, start / end (Unix seconds), duration and attributes.
+    Worker spans use the worker's clock.
+    """
+    
+    def __init__(self, path: Optional[str] = None, max_traces: int = 1000):
+        """
+        Args:
+            path: JSON-lines file spans are appended to (None keeps them in memory only)
+            max_traces: Number of most recent traces kept in memory
+        """
+        self.path = path
+        self.max_traces = max_traces
+        self._traces: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._jobs: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    
+    def start_trace(self, trace_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Start a trace (or return the existing one with this ID)
+        
+        Returns:
+            Trace state: {"trace_id", "root_span_id", "started", "spans", ...}
+        """
+        trace_id = trace_id or secrets.token_hex(16)
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None:
+                trace = {'trace_id': trace_id, 'root_span_id': secrets.token_hex(8), 'started': time.time(), 'spans': []}
+                self._traces[trace_id] = trace
+                while len(self._traces) > self.max_traces:
+                    old_id, _ = self._traces.popitem(last=False)
+                    self._jobs = {job: tid for job, tid in self._jobs.items() if tid != old_id}
+            return trace
+    
+    def bind_job(self, job_id: str, trace_id: str) -> None:
+        with self._lock:
+            self._jobs[job_id] = trace_id
+    
+    def get(self, job_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Trace state of a job, or None if the job was not traced"""
+        with self._lock:
+            trace_id = self._jobs.get(job_id) if job_id else None
+            return self._traces.get(trace_id) if trace_id else None
+    
+    def add(
+        self,
+        trace_id: str,
+        name: str,
+        start: float,
+        end: float,
+        service: str = 'client',
+        parent_span_id: Optional[str] = None,
+        span_id: Optional[str] = None,
+        **attributes: Any
+    ) -> Dict[str, Any]:
+        """
+        Record one span (parented to the trace's root span unless parent_span_id is given)
+        
+        Returns:
+            The span dictionary
+        """
+        trace = self.start_trace(trace_id)
+        span = self._span(
+            trace_id, name, start, end, service,
+            span_id or secrets.token_hex(8), parent_span_id or trace['root_span_id'], attributes
+        )
+        self.add_spans(trace_id, [span])
+        return span
+    
+    def end_trace(self, trace_id: str, **attributes: Any) -> None:
+        """Record the root span (client.job) from the start of the trace until now"""
+        trace = self.start_trace(trace_id)
+        span = self._span(trace_id, 'client.job', trace['started'], time.time(), 'client', trace['root_span_id'], None, attributes)
+        self.add_spans(trace_id, [span])
+    
+    @staticmethod
+    def _span(
+        trace_id: str,
+        name: str,
+        start: float,
+        end: float,
+        service: str,
+        span_id: str,
+        parent_span_id: Optional[str],
+        attributes: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        return {
+            'trace_id': trace_id,
+            'span_id': span_id,
+            'parent_span_id': parent_span_id,
+            'name': name,
+            'service': service,
+            'start': round(start, 6),
+            'end': round(end, 6),
+            'duration': round(end - start, 6),
+            'attributes': attributes
+        }
+    
+    def add_spans(self, trace_id: str, spans: List[Dict[str, Any]]) -> None:
+        """Add finished spans (e.g. the worker's) to a trace and append them to the file"""
+        trace = self.start_trace(trace_id)
+        with self._lock:
+            trace['spans'].extend(spans)
+            if self.path:
+                try:
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        for span in spans:
+                            f.write(json.dumps(span, ensure_ascii=False) + '\n')
+                except OSError as e:
+                    logger.warning(f"Trace write failed ({self.path}): {e}")
+    
+    @contextmanager
+    def span(self, trace_id: str, name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Record the time spent in a with-block as a span
+        
+        Yields:
+            Attribute dictionary; values added inside the block are recorded with the span
+        """
+        start = time.time()
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes['error'] = str(e) or type(e).__name__
+            raise
+        finally:
+            self.add(trace_id, name, start, time.time(), **attributes)
+    
+    def spans(self, trace_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            return sorted(trace['spans'], key=lambda s: s['start']) if trace else []
+    
+    def waterfall(self, trace_id: str, width: int = 40) -> str:
+        """
+        Text waterfall of a trace: one line per span with a bar placed on the trace's time axis
+        
+        Returns:
+            Multi-line string (empty if the trace has no spans)
+        """
+        spans = self.spans(trace_id)
+        if not spans:
+            return ''
+        t0 = min(s['start'] for s in spans)
+        total = max(max(s['end'] for s in spans) - t0, 1e-6)
+        name_width = max(len(s['name']) for s in spans)
+        lines = [f"trace {trace_id} ({total:.3f}s)"]
+        for s in spans:
+            begin = int((s['start'] - t0) / total * width)
+            length = max(1, int(round(s['duration'] / total * width)))
+            bar = (' ' * begin + '█' * length)[:width].ljust(width)
+            lines.append(f"{s['name']:<{name_width}} |{bar}| {s['start'] - t0:8.3f}s +{s['duration']:.3f}s")
+        return '\n'.join(lines)
+
+
+class StatusPoller:
+    """
+    Shared status poller for every outstanding job of one GenerateVideoClient
+    
+    A single background thread polls all tracked jobs and adapts the interval
+    per job: slowly while IN_QUEUE, faster as a running job approaches its
+    expected completion (from progress ETAs or the durations of earlier jobs).
+    It uses RunPod's /stream endpoint while that is available and falls back
+    to /status. Completions are delivered through futures and callbacks.
+    """
+    
+    TERMINAL_STATUSES = ('COMPLETED', 'FAILED', 'CANCELLED', 'TIMED_OUT')
+    
+    def __init__(
+        self,
+        client: 'GenerateVideoClient',
+        min_interval: float = 1.0,
+        max_interval: float = 30.0,
+        queue_interval: float = 15.0
+    ):
+        """
+        Args:
+            client: Client whose session and URLs are used
+            min_interval: Shortest delay between two polls of one job (seconds)
+            max_interval: Longest delay between two polls of a running job (seconds)
+            queue_interval: Longest delay between two polls of a queued job (seconds)
+        """
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.queue_interval = queue_interval
+        self.use_stream: Optional[bool] = None
+        self.expected_duration: Optional[float] = None
+        self.requests_sent = 0
+        
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        # Webhook payloads that arrived before their job was tracked
+        self._unclaimed: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def track(
+        self,
+        job_id: str,
+        callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+        max_wait_time: Optional[float] = 1800,
+        max_interval: Optional[float] = None,
+        fallback_interval: Optional[float] = None
+    ) -> Future:
+        """
+        Start tracking a job
+        
+        Args:
+            job_id: Job ID
+            callback: Called with the job result dictionary when the job finishes
+            max_wait_time: Resolve with status TIMEOUT after this many seconds (None: no limit)
+            max_interval: Per-job cap on the polling interval (seconds)
+            fallback_interval: If set, the job's result is expected from a webhook and
+                it is only polled at this fixed interval, to catch missed callbacks
+        
+        Returns:
+            Future resolved with the job result dictionary
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                now = time.time()
+                first_poll = fallback_interval or self.min_interval
+                job = {
+                    'future': Future(),
+                    'callbacks': [],
+                    'status': None,
+                    'running_since': None,
+                    'eta': None,
+                    'fallback_interval': fallback_interval,
+                    'interval': first_poll,
+                    'max_interval': max_interval or self.max_interval,
+                    'next_poll': now + first_poll,
+                    'deadline': now + max_wait_time if max_wait_time is not None else float('inf')
+                }
+                self._jobs[job_id] = job
+            if callback is not None:
+                job['callbacks'].append(callback)
+            
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="runpod-status-poller", daemon=True)
+                self._thread.start()
+            early = self._unclaimed.pop(job_id, None)
+        
+        if early is not None:
+            self.handle_status(job_id, early)
+        self._wakeup.set()
+        return job['future']
+    
+    def _finish(self, job_id: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is None:
+            return
+        
+        execution_time = result.pop('_execution_time', None)
+        delay_time = result.pop('_delay_time', None)
+        if result.get('status') == 'COMPLETED' and (execution_time or job['running_since'] is not None):
+            self._observe_duration(execution_time or time.time() - job['running_since'])
+        self.client._trace_result(job_id, result, delay_time, execution_time)
+        
+        job['future'].set_result(result)
+        for callback in job['callbacks']:
+            try:
+                callback(result)
+            except Exception as e:
+                logger.error(f"❌ Job callback failed ({job_id}): {e}")
+    
+    def _observe_duration(self, duration: float) -> None:
+        """Exponential moving average of job run time"""
+        if self.expected_duration is None:
+            self.expected_duration = duration
+        else:
+            self.expected_duration = 0.7 * self.expected_duration + 0.3 * duration
+    
+    def _next_interval(self, job: Dict[str, Any]) -> float:
+        if job['status'] == 'IN_PROGRESS' and job['running_since'] is None:
+            job['running_since'] = time.time()
+        if job['fallback_interval']:
+            return job['fallback_interval']
+        
+        if job['status'] == 'IN_PROGRESS':
+            remaining = job['eta']
+            if remaining is None and self.expected_duration is not None:
+                remaining = self.expected_duration - (time.time() - job['running_since'])
+            if remaining is None:
+                interval = job['interval'] * 1.5
+            else:
+                # Poll about twice before the expected completion, then at the minimum rate
+                interval = remaining / 2
+            cap = job['max_interval']
+        else:
+            interval = job['interval'] * 1.5
+            cap = min(self.queue_interval, job['max_interval'])
+        
+        job['interval'] = max(self.min_interval, min(interval, cap))
+        return job['interval']
+    
+    def _poll_stream(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Poll /stream; returns the status data, or None when /stream is not usable"""
+        with self.client.session.get(f"{self.client.stream_url}/{job_id}", timeout=30, stream=True) as response:
+            self.requests_sent += 1
+            if response.status_code in (400, 404, 405):
+                return None
+            response.raise_for_status()
+            stream_data = self.client._parse_json(response.iter_content(chunk_size=64 * 1024))
+        
+        progress = None
+        results = []
+        for item in stream_data.get('stream') or []:
+            record = item.get('output') if isinstance(item, dict) else None
+            if self.client._is_progress(record):
+                progress = record
+            elif isinstance(record, dict):
+                results.append(record)
+        
+        if progress is not None and progress.get('eta_seconds') is not None:
+            with self._lock:
+                if job_id in self._jobs:
+                    self._jobs[job_id]['eta'] = progress['eta_seconds']
+        
+        if stream_data.get('status') == 'COMPLETED':
+            if not results:
+                # Non-streaming workers may not repeat the output on /stream
+                return self.client._fetch_status(job_id)
+            return {'status': 'COMPLETED', 'output': results[-1]}
+        return stream_data
+    
+    def _poll(self, job_id: str) -> None:
+        started = time.time()
+        try:
+            status_data = None
+            if self.use_stream is not False:
+                status_data = self._poll_stream(job_id)
+                if status_data is None:
+                    logger.info("RunPod /stream not available, polling /status")
+                    self.use_stream = False
+                else:
+                    self.use_stream = True
+            if status_data is None:
+                status_data = self.client._fetch_status(job_id)
+                self.requests_sent += 1
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                self._finish(job_id, {'status': 'NOT_FOUND', 'error': f"Job {job_id} not found", 'job_id': job_id})
+            else:
+                logger.error(f"❌ Status check error: {e}")
+            return
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ Status check error: {e}")
+            return
+        
+        if status_data.get('status') in self.TERMINAL_STATUSES:
+            # The final response carries (and spools) the outputs
+            self.client._trace_span(
+                job_id, 'client.fetch_result', started, time.time(),
+                endpoint='stream' if self.use_stream else 'status'
+            )
+        self.handle_status(job_id, status_data)
+    
+    def handle_status(self, job_id: str, status_data: Dict[str, Any]) -> None:
+        """Apply one status payload (from a poll or a webhook) to a tracked job"""
+        status = status_data.get('status')
+        with self._lock:
+            if job_id not in self._jobs:
+                if status in self.TERMINAL_STATUSES:
+                    self._unclaimed[job_id] = status_data
+                    while len(self._unclaimed) > 256:
+                        self._unclaimed.pop(next(iter(self._unclaimed)))
+                return
+        if status == 'COMPLETED':
+            logger.info(f"✅ Job completed! (Job ID: {job_id})")
+            self._finish(job_id, {
+                'status': 'COMPLETED',
+                'output': self.client._final_output(status_data.get('output')),
+                'job_id': job_id,
+                '_execution_time': (status_data.get('executionTime') or 0) / 1000 or None,
+                '_delay_time': (status_data.get('delayTime') or 0) / 1000 or None
+            })
+        elif status in self.TERMINAL_STATUSES:
+            logger.error(f"❌ Job ended: {status} (Job ID: {job_id})")
+            self._finish(job_id, {
+                'status': status,
+                'error': status_data.get('error', 'Unknown error'),
+                'job_id': job_id
+            })
+        elif status in ['IN_QUEUE', 'IN_PROGRESS']:
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    job['status'] = status
+                    job['next_poll'] = time.time() + self._next_interval(job)
+        else:
+            logger.warning(f"❓ Unknown status: {status}")
+            self._finish(job_id, {'status': 'UNKNOWN', 'data': status_data, 'job_id': job_id})
+    
+    def _loop(self) -> None:
+        while True:
+            now = time.time()
+            with self._lock:
+                expired = [job_id for job_id, job in self._jobs.items() if job['deadline'] <= now]
+                due = [job_id for job_id, job in self._jobs.items() if job['next_poll'] <= now and job_id not in expired]
+                for job_id in due:
+                    # Push back now so a failed request does not cause a tight retry loop
+                    self._jobs[job_id]['next_poll'] = now + self._jobs[job_id]['interval']
+            
+            for job_id in expired:
+                logger.error(f"❌ Job wait timeout (Job ID: {job_id})")
+                self._finish(job_id, {'status': 'TIMEOUT', 'job_id': job_id})
+            for job_id in due:
+                self._poll(job_id)
+            
+            with self._lock:
+                next_times = [min(job['next_poll'], job['deadline']) for job in self._jobs.values()]
+            timeout = max(0.05, min(next_times) - time.time()) if next_times else None
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+
+class WebhookReceiver:
+    """
+    Small local HTTP server that receives RunPod job webhooks
+    
+    RunPod POSTs the job status payload (same shape as /status) to the
+    webhook URL when a job finishes. The URL path carries a random token so
+    that only callbacks for jobs submitted by this client are accepted.
+    """
+    
+    def __init__(self, poller: StatusPoller, public_url: str, host: str = '0.0.0.0', port: int = 8765):
+        """
+        Args:
+            poller: Poller whose tracked jobs are resolved by incoming webhooks
+            public_url: Base URL under which RunPod can reach this server
+            host: Listen address
+            port: Listen port (0 picks a free port)
+        """
+        self.poller = poller
+        self.token = secrets.token_urlsafe(16)
+        self.received = 0
+        
+        receiver = self
+        
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.rstrip('/') != f"/runpod-webhook/{receiver.token}":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                    status_data = receiver.poller.client._parse_json(self._read_body(length))
+                    job_id = status_data['id']
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Invalid webhook payload: {e}")
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                
+                self.send_response(200)
+                self.end_headers()
+                receiver.received += 1
+                receiver.poller.handle_status(job_id, status_data)
+            
+            def _read_body(self, length: int) -> Iterator[bytes]:
+                while length > 0:
+                    chunk = self.rfile.read(min(length, 64 * 1024))
+                    if not chunk:
+                        break
+                    length -= len(chunk)
+                    yield chunk
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.port = self.server.server_address[1]
+        base_url = public_url.rstrip('/') if public_url else f"http://127.0.0.1:{self.port}"
+        self.url = f"{base_url}/runpod-webhook/{self.token}"
+        
+        self._thread = threading.Thread(target=self.server.serve_forever, name="runpod-webhook", daemon=True)
+        self._thread.start()
+        logger.info(f"Webhook receiver listening on {host}:{self.port}")
+    
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
 class GenerateVideoClient:
+    # Image paths with these prefixes are passed to the worker by reference
+    WORKER_PATH_PREFIXES = ('/runpod-volume/',)
+    
     def __init__(
         self,
         runpod_endpoint_id: str,
-        runpod_api_key: str
+        runpod_api_key: str,
+        spool_dir: Optional[str] = None,
+        spool_outputs: bool = False,
+        trace_file: Optional[str] = None
     ):
         """
         Initialize Generate Video client
@@ -28,11 +881,19 @@ class GenerateVideoClient:
         Args:
             runpod_endpoint_id: RunPod endpoint ID
             runpod_api_key: RunPod API key
+            spool_dir: Directory for videos decoded while a result is downloaded (default: system temp dir)
+            spool_outputs: Decode `videoUrl` / `video` to a file in spool_dir while the
+                response is read; the output then carries `videoFile` instead (opt-in).
+                Spooled files not moved by save_video_result are deleted by close()
+                or at interpreter exit
+            trace_file: JSON-lines file for client and worker spans of every job (see Tracer)
         """
         self.runpod_endpoint_id = runpod_endpoint_id
         self.runpod_api_key = runpod_api_key
         self.runpod_api_endpoint = f"https://api.runpod.ai/v2/{runpod_endpoint_id}/run"
         self.status_url = f"https://api.runpod.ai/v2/{runpod_endpoint_id}/status"
+        self.stream_url = f"https://api.runpod.ai/v2/{runpod_endpoint_id}/stream"
+        self.cancel_url = f"https://api.runpod.ai/v2/{runpod_endpoint_id}/cancel"
         
         # Initialize HTTP session
         self.session = requests.Session()
@@ -41,8 +902,53 @@ class GenerateVideoClient:
             'Content-Type': 'application/json'
         })
         
+        # Shared status poller for all jobs of this client
+        self.poller = StatusPoller(self)
+        self.webhook: Optional[WebhookReceiver] = None
+        self.webhook_fallback_interval = 120.0
+        
+        # Submit-to-save spans per job, merged with the worker's
+        self.tracer = Tracer(trace_file)
+        
+        self.spool_dir = spool_dir or tempfile.gettempdir()
+        self.spool_outputs = spool_outputs
+        if spool_outputs:
+            os.makedirs(self.spool_dir, exist_ok=True)
+        # Spooled files not yet saved; removed by close() or when the client goes away
+        self._spooled: set = set()
+        self._spool_cleanup = weakref.finalize(self, _remove_files, self._spooled)
+        
         logger.info(f"GenerateVideoClient initialized - Endpoint: {runpod_endpoint_id}")
     
+    def enable_webhook(
+        self,
+        public_url: str,
+        host: str = '0.0.0.0',
+        port: int = 8765,
+        fallback_interval: float = 120.0
+    ) -> str:
+        """
+        Receive job results through RunPod webhooks instead of polling
+        
+        Jobs submitted afterwards carry the webhook URL and are resolved as soon
+        as RunPod calls it. They are still polled every fallback_interval
+        seconds in case a callback is lost.
+        
+        Args:
+            public_url: Base URL under which RunPod can reach this machine (e.g. https://my-host:8765)
+            host: Listen address of the local receiver
+            port: Listen port of the local receiver
+            fallback_interval: Polling interval for jobs waiting on a webhook (seconds)
+        
+        Returns:
+            Webhook URL attached to submitted jobs
+        """
+        if self.webhook is not None:
+            self.webhook.close()
+        self.webhook = WebhookReceiver(self.poller, public_url, host=host, port=port)
+        self.webhook_fallback_interval = fallback_interval
+        return self.webhook.url
+    
     def encode_file_to_base64(self, file_path: str) -> Optional[str]:
         """
         Encode file to base64
@@ -73,26 +979,41 @@ class GenerateVideoClient:
         """
         Submit job to RunPod
         
+        A trace ID is added to the input (kept if input_data already has one), so
+        the worker's spans are returned with the result and merged into the job's trace.
+        
         Args:
             input_data: API input data
         
         Returns:
             Job ID or None (on failure)
         """
+        trace = self.tracer.start_trace(input_data.get('trace_id'))
+        input_data = {**input_data, 'trace_id': trace['trace_id'], 'parent_span_id': trace['root_span_id']}
         payload = {"input": input_data}
+        if self.webhook is not None:
+            payload["webhook"] = self.webhook.url
         
         try:
             logger.info(f"Submitting job to RunPod: {self.runpod_api_endpoint}")
-            logger.info(f"Input data: {json.dumps(input_data, indent=2, ensure_ascii=False)}")
+            logger.info(f"Input data: {json.dumps(self._loggable(input_data), indent=2, ensure_ascii=False)}")
             
-            response = self.session.post(self.runpod_api_endpoint, json=payload, timeout=30)
-            response.raise_for_status()
+            # Base64File values are encoded while the body is sent (the upload is part of this span)
+            with self.tracer.span(trace['trace_id'], 'client.submit') as span:
+                response = self.session.post(self.runpod_api_endpoint, data=StreamingJSONBody(payload), timeout=30)
+                response.raise_for_status()
+                response_data = response.json()
+                span['job_id'] = response_data.get('id')
+            trace['submitted'] = time.time()
             
-            response_data = response.json()
             job_id = response_data.get('id')
             
             if job_id:
-                logger.info(f"✅ Job submission successful! Job ID: {job_id}")
+                logger.info(f"✅ Job submission successful! Job ID: {job_id} (trace {trace['trace_id']})")
+                self.tracer.bind_job(job_id, trace['trace_id'])
+                if self.webhook is not None:
+                    # Track right away so a webhook arriving before wait_for_completion is not lost
+                    self.poller.track(job_id, fallback_interval=self.webhook_fallback_interval)
                 return job_id
             else:
                 logger.error(f"❌ Failed to receive Job ID: {response_data}")
@@ -102,64 +1023,129 @@ class GenerateVideoClient:
             logger.error(f"❌ Job submission failed: {e}")
             return None
     
+    @classmethod
+    def _loggable(cls, value: Any) -> Any:
+        """Job input with files and long strings (base64 data) summarized for logging"""
+        if isinstance(value, dict):
+            return {k: cls._loggable(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [cls._loggable(v) for v in value]
+        if isinstance(value, Base64File):
+            return repr(value)
+        if isinstance(value, str) and len(value) > 256:
+            return f"<{len(value)} chars>"
+        return value
+    
     def wait_for_completion(self, job_id: str, check_interval: int = 10, max_wait_time: int = 1800) -> Dict[str, Any]:
         """
         Wait for job completion
         
+        The job is tracked by the client's shared StatusPoller, which adapts the
+        polling rate to the job state.
+        
         Args:
             job_id: Job ID
-            check_interval: Status check interval (seconds)
+            check_interval: Maximum status check interval (seconds)
             max_wait_time: Maximum wait time (seconds)
         
         Returns:
             Job result dictionary
         """
+        logger.info(f"⏱️ Waiting for job... (Job ID: {job_id})")
+        future = self.poller.track(job_id, max_wait_time=max_wait_time, max_interval=check_interval)
+        return future.result()
+    
+    @staticmethod
+    def _is_progress(record: Any) -> bool:
+        return isinstance(record, dict) and record.get('type') == 'progress'
+    
+    @classmethod
+    def _final_output(cls, output: Any) -> Any:
+        """
+        Extract the result from a job output
+        
+        Streaming workers return every yielded record as a list; the result is
+        the last record that is not a progress update.
+        """
+        if isinstance(output, list):
+            results = [r for r in output if isinstance(r, dict) and not cls._is_progress(r)]
+            return results[-1] if results else {}
+        return output
+    
+    def stream(self, job_id: str, poll_interval: float = 1.0, max_wait_time: int = 1800) -> Iterator[Dict[str, Any]]:
+        """
+        Stream job progress from a worker started with STREAM_PROGRESS=true
+        
+        Args:
+            job_id: Job ID
+            poll_interval: Delay between /stream requests (seconds)
+            max_wait_time: Maximum wait time (seconds)
+        
+        Yields:
+            Progress records ({'type': 'progress', 'node', 'stage', 'step', 'max', 'eta_seconds', ...}),
+            then one final dictionary shaped like the wait_for_completion result
+        """
         start_time = time.time()
+        result = None
         
         while time.time() - start_time < max_wait_time:
             try:
-                logger.info(f"⏱️ Checking job status... (Job ID: {job_id})")
-                
-                response = self.session.get(f"{self.status_url}/{job_id}", timeout=30)
-                response.raise_for_status()
-                
-                status_data = response.json()
-                status = status_data.get('status')
-                
-                if status == 'COMPLETED':
-                    logger.info("✅ Job completed!")
-                    return {
-                        'status': 'COMPLETED',
-                        'output': status_data.get('output'),
-                        'job_id': job_id
-                    }
-                elif status == 'FAILED':
-                    logger.error("❌ Job failed.")
-                    return {
-                        'status': 'FAILED',
-                        'error': status_data.get('error', 'Unknown error'),
-                        'job_id': job_id
-                    }
-                elif status in ['IN_QUEUE', 'IN_PROGRESS']:
-                    logger.info(f"🏃 Job in progress... (Status: {status})")
-                    time.sleep(check_interval)
-                else:
-                    logger.warning(f"❓ Unknown status: {status}")
-                    return {
-                        'status': 'UNKNOWN',
-                        'data': status_data,
-                        'job_id': job_id
-                    }
-                    
+                with self.session.get(f"{self.stream_url}/{job_id}", timeout=30, stream=True) as response:
+                    response.raise_for_status()
+                    stream_data = self._parse_json(response.iter_content(chunk_size=64 * 1024))
             except requests.exceptions.RequestException as e:
-                logger.error(f"❌ Status check error: {e}")
-                time.sleep(check_interval)
+                logger.error(f"❌ Stream request error: {e}")
+                time.sleep(poll_interval)
+                continue
+            
+            for item in stream_data.get('stream') or []:
+                record = item.get('output') if isinstance(item, dict) else None
+                if self._is_progress(record):
+                    yield record
+                elif isinstance(record, dict):
+                    result = record
+            
+            status = stream_data.get('status')
+            if status == 'COMPLETED':
+                logger.info("✅ Job completed!")
+                final = {'status': 'COMPLETED', 'output': result or {}, 'job_id': job_id}
+                self._trace_result(job_id, final)
+                yield final
+                return
+            if status in ['FAILED', 'CANCELLED', 'TIMED_OUT']:
+                logger.error(f"❌ Job ended: {status}")
+                final = {
+                    'status': status,
+                    'error': stream_data.get('error', status),
+                    'job_id': job_id
+                }
+                self._trace_result(job_id, final)
+                yield final
+                return
+            
+            time.sleep(poll_interval)
         
-        logger.error(f"❌ Job wait timeout ({max_wait_time} seconds)")
-        return {
-            'status': 'TIMEOUT',
-            'job_id': job_id
-        }
+        logger.error(f"❌ Job stream timeout ({max_wait_time} seconds)")
+        yield {'status': 'TIMEOUT', 'job_id': job_id}
+    
+    def cancel_job(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job
+        
+        Args:
+            job_id: Job ID
+        
+        Returns:
+            Cancel request success status
+        """
+        try:
+            response = self.session.post(f"{self.cancel_url}/{job_id}", timeout=30)
+            response.raise_for_status()
+            logger.info(f"🛑 Job cancel requested: {job_id}")
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ Job cancel failed: {e}")
+            return False
     
     def save_video_result(self, result: Dict[str, Any], output_path: str) -> bool:
         """
@@ -172,26 +1158,44 @@ class GenerateVideoClient:
         Returns:
             Save success status
         """
+        started = time.time()
+        ok = self._save_video(result, output_path)
+        self._trace_span(result.get('job_id'), 'client.save', started, time.time(), path=output_path, ok=ok)
+        return ok
+    
+    def _save_video(self, result: Dict[str, Any], output_path: str) -> bool:
+        """Body of save_video_result"""
         try:
             if result.get('status') != 'COMPLETED':
                 logger.error(f"Job not completed: {result.get('status')}")
                 return False
             
             output = result.get('output', {})
-            video_b64 = output.get('video')
+            video_file = output.get('videoFile')
+            video_b64 = output.get('videoUrl') or output.get('video')
             
-            if not video_b64:
+            if not video_file and not video_b64:
                 logger.error("Video data not found")
                 return False
             
             # Create directory
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            
-            # Decode base64 and save video
-            decoded_video = base64.b64decode(video_b64)
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
             
-            with open(output_path, 'wb') as f:
-                f.write(decoded_video)
+            if video_file:
+                # Already decoded while the result was downloaded
+                shutil.move(video_file, output_path)
+                self._spooled.discard(video_file)
+                output['videoFile'] = output_path
+            elif video_b64.startswith(('http://', 'https://')):
+                # Worker uploaded the video to object storage (no RunPod auth header for it)
+                with requests.get(video_b64, stream=True, timeout=60) as response:
+                    response.raise_for_status()
+                    with open(output_path, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=1024 * 1024):
+                            f.write(chunk)
+            else:
+                # Decode base64 (or a data URL) in chunks
+                write_base64_to_file(video_b64, output_path)
             
             file_size = os.path.getsize(output_path)
             logger.info(f"✅ Video saved successfully: {output_path} ({file_size / (1024*1024):.1f}MB)")
@@ -201,47 +1205,91 @@ class GenerateVideoClient:
             logger.error(f"❌ Video save failed: {e}")
             return False
     
-    def create_video_from_image(
-        self,
-        image_path: str,
-        prompt: str = "running man, grab the gun",
-        negative_prompt: Optional[str] = None,
-        width: int = 480,
-        height: int = 832,
-        length: int = 81,
-        steps: int = 10,
-        seed: int = 42,
-        cfg: float = 2.0,
-        context_overlap: int = 48,
-        lora_pairs: Optional[List[Dict[str, Any]]] = None
-    ) -> Dict[str, Any]:
+    def trace_waterfall(self, job_id: str) -> str:
         """
-        Generate video from image
+        Text latency waterfall of a job: client, RunPod and worker spans on one time axis
         
         Args:
-            image_path: Image file path
-            prompt: Prompt text
-            negative_prompt: Negative prompt to exclude unwanted elements
-            width: Output width
-            height: Output height
-            length: Number of frames
-            steps: Number of steps
-            seed: Seed value
-            cfg: CFG scale
-            context_overlap: Context overlap
-            lora_pairs: LoRA settings list (max 4)
+            job_id: Job ID
         
         Returns:
-            Job result dictionary
+            Multi-line string (empty if the job was not traced by this client)
         """
-        # Check file existence
-        if not os.path.exists(image_path):
-            return {"error": f"Image file does not exist: {image_path}"}
+        trace = self.tracer.get(job_id)
+        return self.tracer.waterfall(trace['trace_id']) if trace else ''
+    
+    def _trace_span(self, job_id: Optional[str], name: str, start: float, end: float, **attributes: Any) -> None:
+        trace = self.tracer.get(job_id)
+        if trace is not None:
+            self.tracer.add(trace['trace_id'], name, start, end, **attributes)
+    
+    def _trace_result(
+        self,
+        job_id: str,
+        result: Dict[str, Any],
+        delay_time: Optional[float] = None,
+        execution_time: Optional[float] = None
+    ) -> None:
+        """Add RunPod queue / execution spans and the worker's spans to the job's trace and close it"""
+        trace = self.tracer.get(job_id)
+        if trace is None or trace.get('ended'):
+            return
+        trace['ended'] = True
+        trace_id = trace['trace_id']
         
-        # Encode image to base64
-        image_base64 = self.encode_file_to_base64(image_path)
-        if not image_base64:
-            return {"error": "Image base64 encoding failed"}
+        # RunPod reports durations only; place them after the submit on the client's clock
+        submitted = trace.get('submitted') or trace['started']
+        if delay_time:
+            self.tracer.add(trace_id, 'runpod.queue', submitted, submitted + delay_time, service='runpod')
+            if execution_time:
+                self.tracer.add(
+                    trace_id, 'runpod.execution', submitted + delay_time,
+                    submitted + delay_time + execution_time, service='runpod'
+                )
+        
+        output = result.get('output')
+        worker_trace = output.get('trace') if isinstance(output, dict) else None
+        if isinstance(worker_trace, dict) and worker_trace.get('trace_id') == trace_id:
+            self.tracer.add_spans(trace_id, worker_trace.get('spans') or [])
+        self.tracer.end_trace(trace_id, job_id=job_id, status=result.get('status'))
+    
+    def _build_video_input(
+        self,
+        image_path: str,
+        prompt: str,
+        negative_prompt: Optional[str],
+        width: int,
+        height: int,
+        length: int,
+        steps: int,
+        seed: int,
+        cfg: float,
+        context_overlap: int,
+        lora_pairs: Optional[List[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Build the API input for one image (see create_video_from_image for the parameters)
+        
+        Returns:
+            API input data, or {"error": ...} on failure
+        """
+        image_input: Dict[str, Any] = {}
+        if image_path.startswith(('http://', 'https://')):
+            # Fetched by the worker
+            image_input["image_url"] = image_path
+        elif image_path.startswith(self.WORKER_PATH_PREFIXES):
+            # Path on the worker's network volume
+            image_input["image_path"] = image_path
+        else:
+            # Check file existence
+            if not os.path.exists(image_path):
+                return {"error": f"Image file does not exist: {image_path}"}
+            
+            # Image is base64-encoded while the request is sent
+            try:
+                image_input["image_base64"] = Base64File(image_path)
+            except OSError as e:
+                return {"error": f"Image read failed: {e}"}
         
         # Process LoRA settings
         if lora_pairs is None:
@@ -255,7 +1303,7 @@ class GenerateVideoClient:
         
         # Configure API input data
         input_data = {
-            "image_base64": image_base64,
+            **image_input,
             "prompt": prompt,
             "width": width,
             "height": height,
@@ -271,6 +1319,57 @@ class GenerateVideoClient:
         if negative_prompt:
             input_data["negative_prompt"] = negative_prompt
         
+        return input_data
+    
+    def create_video_from_image(
+        self,
+        image_path: str,
+        prompt: str = "running man, grab the gun",
+        negative_prompt: Optional[str] = None,
+        width: int = 480,
+        height: int = 832,
+        length: int = 81,
+        steps: int = 10,
+        seed: int = 42,
+        cfg: float = 2.0,
+        context_overlap: int = 48,
+        lora_pairs: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate video from image
+        
+        Args:
+            image_path: Image file path, http(s) URL, or path on the worker's network volume (/runpod-volume/...)
+            prompt: Prompt text
+            negative_prompt: Negative prompt to exclude unwanted elements
+            width: Output width
+            height: Output height
+            length: Number of frames
+            steps: Number of steps
+            seed: Seed value
+            cfg: CFG scale
+            context_overlap: Context overlap
+            lora_pairs: LoRA settings list (max 4)
+        
+        Returns:
+            Job result dictionary
+        """
+        input_data = self._build_video_input(
+            image_path=image_path,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            width=width,
+            height=height,
+            length=length,
+            steps=steps,
+            seed=seed,
+            cfg=cfg,
+            context_overlap=context_overlap,
+            lora_pairs=lora_pairs
+        )
+        if "error" in input_data:
+            return input_data
+        
         # Submit job and wait
         job_id = self.submit_job(input_data)
         if not job_id:
@@ -279,6 +1378,117 @@ class GenerateVideoClient:
         result = self.wait_for_completion(job_id)
         return result
     
+    def create_video_variants(
+        self,
+        image_path: str,
+        variants: List[Dict[str, Any]],
+        prompt: str = "running man, grab the gun",
+        negative_prompt: Optional[str] = None,
+        width: int = 480,
+        height: int = 832,
+        length: int = 81,
+        steps: int = 10,
+        seed: int = 42,
+        cfg: float = 2.0,
+        context_overlap: int = 48,
+        lora_pairs: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate several videos from one image in a single job
+        
+        The image is uploaded once and the worker queues all variants back to
+        back, so loaded models and shared encodes are reused between them.
+        
+        Args:
+            image_path: Image file path, http(s) URL, or path on the worker's network volume (/runpod-volume/...)
+            variants: Parameter overrides per variant, e.g. [{"seed": 1}, {"seed": 2, "prompt": "..."}]
+            (other arguments are the shared base parameters, see create_video_from_image)
+        
+        Returns:
+            Job result dictionary; output["variants"] holds one result per variant
+            (a failed variant has an "error" key instead of a video)
+        """
+        if not variants:
+            return {"error": "At least one variant is required"}
+        
+        input_data = self._build_video_input(
+            image_path=image_path,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            width=width,
+            height=height,
+            length=length,
+            steps=steps,
+            seed=seed,
+            cfg=cfg,
+            context_overlap=context_overlap,
+            lora_pairs=lora_pairs
+        )
+        if "error" in input_data:
+            return input_data
+        input_data["variants"] = variants
+        
+        job_id = self.submit_job(input_data)
+        if not job_id:
+            return {"error": "Job submission failed"}
+        
+        return self.wait_for_completion(job_id)
+    
+    def save_variant_results(self, result: Dict[str, Any], output_path_pattern: str) -> List[Optional[str]]:
+        """
+        Save the videos of a create_video_variants result
+        
+        Args:
+            result: Job result dictionary
+            output_path_pattern: Output path with an {index} placeholder, e.g. "out/video_{index}.mp4"
+        
+        Returns:
+            Saved path per variant (None for variants that failed or could not be saved)
+        """
+        if result.get('status') != 'COMPLETED':
+            logger.error(f"Job not completed: {result.get('status')}")
+            return []
+        
+        saved = []
+        for index, variant in enumerate(result.get('output', {}).get('variants', [])):
+            if 'error' in variant:
+                logger.error(f"Variant {index} failed: {variant['error']}")
+                saved.append(None)
+                continue
+            output_path = output_path_pattern.format(index=index)
+            ok = self.save_video_result({'status': 'COMPLETED', 'output': variant, 'job_id': result.get('job_id')}, output_path)
+            saved.append(output_path if ok else None)
+        return saved
+    
+    def _fetch_status(self, job_id: str) -> Dict[str, Any]:
+        """
+        Fetch the raw status of one job
+        
+        Raises:
+            requests.exceptions.RequestException on request failure
+        """
+        with self.session.get(f"{self.status_url}/{job_id}", timeout=30, stream=True) as response:
+            response.raise_for_status()
+            return self._parse_json(response.iter_content(chunk_size=64 * 1024))
+    
+    def _parse_json(self, chunks: Iterable[bytes]) -> Any:
+        """Parse a response body, spooling video outputs to disk when spool_outputs is set"""
+        if self.spool_outputs:
+            return load_json_spooled(chunks, self.spool_dir, spooled_files=self._spooled)
+        return json.loads(b''.join(chunks))
+    
+    def close(self) -> None:
+        """Delete spooled videos that were not saved and stop the webhook receiver"""
+        _remove_files(self._spooled)
+        if self.webhook is not None:
+            self.webhook.close()
+            self.webhook = None
+    
+    @staticmethod
+    def _retry_delay(attempt: int, base: float, cap: float = 120.0) -> float:
+        """Exponential backoff with jitter (between 50% and 150% of the exponential delay)"""
+        return min(cap, base * (2 ** max(attempt - 1, 0))) * (0.5 + random.random())
+    
     def batch_process_images(
         self,
         image_folder_path: str,
@@ -293,11 +1503,22 @@ class GenerateVideoClient:
         seed: int = 42,
         cfg: float = 2.0,
         context_overlap: int = 48,
-        lora_pairs: Optional[List[Dict[str, Any]]] = None
+        lora_pairs: Optional[List[Dict[str, Any]]] = None,
+        max_in_flight: int = 4,
+        manifest_path: Optional[str] = None,
+        max_retries: int = 3,
+        retry_backoff: float = 5.0,
+        poll_interval: float = 5.0,
+        max_wait_time: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         Batch process all image files in folder
         
+        Jobs go through separate submit / poll / download stages with at most
+        max_in_flight jobs submitted at once. Item states are kept in a manifest
+        file, so running the same batch again resumes it: completed items are
+        skipped and submitted jobs are polled instead of being resubmitted.
+        
         Args:
             image_folder_path: Folder path containing image files
             output_folder_path: Folder path to save results
@@ -312,6 +1533,13 @@ class GenerateVideoClient:
             cfg: CFG scale
             context_overlap: Context overlap
             lora_pairs: LoRA settings list
+            max_in_flight: Maximum number of jobs submitted but not finished
+            manifest_path: Manifest file path (default: <output_folder_path>/batch_manifest.json)
+            max_retries: Retries per image after a failed submission or job
+            retry_backoff: Base retry delay (seconds), doubled per attempt with jitter
+            poll_interval: Maximum status check interval per job (seconds)
+            max_wait_time: Maximum wait time per job (seconds, default: no limit). A job
+                that runs longer is cancelled before the image is retried
         
         Returns:
             Batch processing result dictionary
@@ -324,15 +1552,123 @@ class GenerateVideoClient:
         os.makedirs(output_folder_path, exist_ok=True)
         
         # Get image file list
-        image_files = [
+        image_files = sorted(
             f for f in os.listdir(image_folder_path)
             if f.lower().endswith(valid_extensions)
-        ]
+        )
         
         if not image_files:
             return {"error": f"No image files to process: {image_folder_path}"}
         
-        logger.info(f"Starting batch processing: {len(image_files)} files")
+        logger.info(f"Starting batch processing: {len(image_files)} files (max in flight: {max_in_flight})")
+        
+        manifest = BatchManifest(manifest_path or os.path.join(output_folder_path, 'batch_manifest.json'))
+        video_params = dict(
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            width=width,
+            height=height,
+            length=length,
+            steps=steps,
+            seed=seed,
+            cfg=cfg,
+            context_overlap=context_overlap,
+            lora_pairs=lora_pairs
+        )
+        
+        def output_file_for(filename: str) -> str:
+            return os.path.join(output_folder_path, f"result_{os.path.splitext(filename)[0]}.mp4")
+        
+        def submit(filename: str) -> str:
+            input_data = self._build_video_input(image_path=os.path.join(image_folder_path, filename), **video_params)
+            if "error" in input_data:
+                raise RuntimeError(input_data["error"])
+            job_id = self.submit_job(input_data)
+            if not job_id:
+                raise RuntimeError("Job submission failed")
+            return job_id
+        
+        # Restore state from the manifest
+        to_submit = deque()
+        in_flight: Dict[str, Future] = {}
+        for filename in image_files:
+            item = manifest.get(filename)
+            if item['status'] == 'completed' and os.path.exists(item.get('output_file') or ''):
+                continue
+            if item['status'] == 'submitted' and item.get('job_id'):
+                in_flight[filename] = self.poller.track(item['job_id'], max_wait_time=max_wait_time, max_interval=poll_interval)
+            else:
+                if item['status'] == 'failed':
+                    manifest.update(filename, status='pending', attempts=0, error=None)
+                to_submit.append(filename)
+        
+        retry_at: Dict[str, float] = {}
+        submitting: Dict[Future, str] = {}
+        downloading: Dict[Future, str] = {}
+        
+        def schedule_retry(filename: str, error: str) -> None:
+            attempts = manifest.get(filename).get('attempts', 0) + 1
+            if attempts > max_retries:
+                logger.error(f"[{filename}] Giving up after {attempts} attempts: {error}")
+                manifest.update(filename, status='failed', attempts=attempts, error=error, job_id=None)
+                return
+            delay = self._retry_delay(attempts, retry_backoff)
+            logger.warning(f"[{filename}] Attempt {attempts} failed ({error}), retrying in {delay:.1f}s")
+            manifest.update(filename, status='pending', attempts=attempts, error=error, job_id=None)
+            retry_at[filename] = time.time() + delay
+            to_submit.append(filename)
+        
+        with ThreadPoolExecutor(max_workers=max_in_flight) as submit_pool, \
+                ThreadPoolExecutor(max_workers=2) as download_pool:
+            while to_submit or submitting or in_flight or downloading:
+                now = time.time()
+                
+                # 1) Submit stage: keep at most max_in_flight jobs outstanding
+                for _ in range(len(to_submit)):
+                    if len(in_flight) + len(submitting) >= max_in_flight:
+                        break
+                    filename = to_submit.popleft()
+                    if retry_at.get(filename, 0) > now:
+                        to_submit.append(filename)
+                        continue
+                    submitting[submit_pool.submit(submit, filename)] = filename
+                
+                for future in [f for f in submitting if f.done()]:
+                    filename = submitting.pop(future)
+                    try:
+                        job_id = future.result()
+                    except Exception as e:
+                        schedule_retry(filename, str(e))
+                        continue
+                    trace = self.tracer.get(job_id)
+                    manifest.update(filename, status='submitted', job_id=job_id, trace_id=trace and trace['trace_id'])
+                    in_flight[filename] = self.poller.track(job_id, max_wait_time=max_wait_time, max_interval=poll_interval)
+                
+                # 2) Poll stage: the shared poller resolves one future per job
+                for filename, future in list(in_flight.items()):
+                    if not future.done():
+                        continue
+                    del in_flight[filename]
+                    result = future.result()
+                    if result.get('status') == 'COMPLETED':
+                        downloading[download_pool.submit(self.save_video_result, result, output_file_for(filename))] = filename
+                    else:
+                        if result.get('status') == 'TIMEOUT':
+                            # The job may still be running; stop it so a retry does not run it twice
+                            self.cancel_job(result['job_id'])
+                        schedule_retry(filename, str(result.get('error', result.get('status'))))
+                
+                # 3) Download stage
+                for future in [f for f in downloading if f.done()]:
+                    filename = downloading.pop(future)
+                    if future.exception() is None and future.result():
+                        logger.info(f"✅ [{filename}] Processing completed")
+                        manifest.update(filename, status='completed', output_file=output_file_for(filename), error=None)
+                    else:
+                        logger.error(f"[{filename}] Result save failed")
+                        manifest.update(filename, status='failed', error='Result save failed')
+                
+                time.sleep(0.2)
         
         results = {
             "total_files": len(image_files),
@@ -340,62 +1676,26 @@ class GenerateVideoClient:
             "failed": 0,
             "results": []
         }
-        
-        # Process each image file
         for filename in image_files:
-            logger.info(f"\n==================== Processing started: {filename} ====================")
-            
-            image_path = os.path.join(image_folder_path, filename)
-            
-            # Generate video
-            result = self.create_video_from_image(
-                image_path=image_path,
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                width=width,
-                height=height,
-                length=length,
-                steps=steps,
-                seed=seed,
-                cfg=cfg,
-                context_overlap=context_overlap,
-                lora_pairs=lora_pairs
-            )
-            
-            if result.get('status') == 'COMPLETED':
-                # Save result file
-                base_filename = os.path.splitext(filename)[0]
-                output_filename = os.path.join(output_folder_path, f"result_{base_filename}.mp4")
-                
-                if self.save_video_result(result, output_filename):
-                    logger.info(f"✅ [{filename}] Processing completed")
-                    results["successful"] += 1
-                    results["results"].append({
-                        "filename": filename,
-                        "status": "success",
-                        "output_file": output_filename,
-                        "job_id": result.get('job_id')
-                    })
-                else:
-                    logger.error(f"[{filename}] Result save failed")
-                    results["failed"] += 1
-                    results["results"].append({
-                        "filename": filename,
-                        "status": "failed",
-                        "error": "Result save failed",
-                        "job_id": result.get('job_id')
-                    })
+            item = manifest.get(filename)
+            if item['status'] == 'completed':
+                results["successful"] += 1
+                results["results"].append({
+                    "filename": filename,
+                    "status": "success",
+                    "output_file": item.get('output_file'),
+                    "job_id": item.get('job_id'),
+                    "trace_id": item.get('trace_id')
+                })
             else:
-                logger.error(f"[{filename}] Job failed: {result.get('error', 'Unknown error')}")
                 results["failed"] += 1
                 results["results"].append({
                     "filename": filename,
                     "status": "failed",
-                    "error": result.get('error', 'Unknown error'),
-                    "job_id": result.get('job_id')
+                    "error": item.get('error', 'Unknown error'),
+                    "job_id": item.get('job_id'),
+                    "trace_id": item.get('trace_id')
                 })
-            
-            logger.info(f"==================== Processing completed: {filename} ====================")
         
         logger.info(f"\n🎉 Batch processing completed: {results['successful']}/{results['total_files']} successful")
         return results
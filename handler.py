@@ -1,64 +1,941 @@
 import runpod
 import os
+import sys
+import ctypes
 import websocket
 import base64
 import json
 import uuid
 import logging
-import urllib.request
+import http.client
+import threading
 import time
+import asyncio
+import queue
+import hashlib
+import shutil
+import fnmatch
+import mimetypes
+import struct
+import re
+import subprocess
+import zlib
+import yaml
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+except ImportError:  # S3 출력 업로드를 쓸 때만 필요
+    boto3 = None
+
+try:
+    import imageio_ffmpeg
+except ImportError:  # PATH 에 ffmpeg 가 있으면 필요 없음
+    imageio_ffmpeg = None
 
 # 로깅 설정
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 server_address = os.getenv("SERVER_ADDRESS", "127.0.0.1")
+server_port = int(os.getenv("SERVER_PORT", "8188"))
 client_id = str(uuid.uuid4())
+# 워커 프로세스 시작 시각 (cold start 비용 측정 기준)
+WORKER_STARTED = time.monotonic()
+
+# ComfyUI 준비 대기 / 요청 타임아웃 (초)
+COMFY_READY_TIMEOUT = float(os.getenv("COMFY_READY_TIMEOUT", "180"))
+COMFY_HTTP_TIMEOUT = float(os.getenv("COMFY_HTTP_TIMEOUT", "30"))
+# WebSocket recv 대기 시간. 이 시간 동안 메시지가 없으면 None 을 돌려주고 호출 측이 다시 기다림
+COMFY_WS_RECV_TIMEOUT = float(os.getenv("COMFY_WS_RECV_TIMEOUT", "30"))
+# prompt 하나의 실행 대기 상한 (초, 0 이면 제한 없음)
+COMFY_EXECUTION_TIMEOUT = float(os.getenv("COMFY_EXECUTION_TIMEOUT", "3600"))
+# job 전체의 기본 마감 시간 (초, 0 이면 제한 없음). job input 의 timeout 으로 job 별로 지정 가능
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "0"))
+# 취소 / 마감 시 /interrupt 후 ComfyUI 가 실제로 멈췄다고 알려줄 때까지 기다리는 시간 (초)
+CANCEL_STOP_TIMEOUT = float(os.getenv("CANCEL_STOP_TIMEOUT", "30"))
+CANCEL_REASONS = {"cancelled": "취소됨", "deadline": "마감 시간 초과"}
+# job trace (단계 / ComfyUI 노드별 span) 를 JSON lines 로 남길 파일. 비어 있으면 남기지 않음.
+# 클라이언트가 trace_id 를 주면 span 은 결과의 trace 로도 반환됨 (클라이언트 span 과 합쳐서 job 하나의 waterfall)
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+# 결과를 받은 prompt 의 ComfyUI history 를 지움 (오래 떠 있는 워커에서 ComfyUI 메모리가 계속 늘지 않도록)
+PRUNE_HISTORY = os.getenv("PRUNE_HISTORY", "true").lower() == "true"
+# 큐잉 전 워크플로우 검증 (ComfyUI /object_info 스키마를 한 번 받아 캐시해서 사용)
+VALIDATE_WORKFLOW = os.getenv("VALIDATE_WORKFLOW", "true").lower() == "true"
+# 검증에 실패하면 새로 올린 LoRA / 모델일 수 있으므로 /object_info 를 다시 받는데, 그 최소 간격 (초)
+OBJECT_INFO_REFRESH_INTERVAL = float(os.getenv("OBJECT_INFO_REFRESH_INTERVAL", "60"))
+# 워커 하나가 동시에 처리할 job 수.
+# ComfyUI 는 prompt 를 순서대로 실행하지만, 다음 job 의 입력 저장/큐잉과 이전 job 의 출력 인코딩이 GPU 실행과 겹치게 됨
+MAX_CONCURRENCY = max(1, int(os.getenv("MAX_CONCURRENCY", "2")))
+# true 면 generator(streaming) handler 로 동작: 진행 상황을 yield 하고 마지막에 결과를 yield
+# (/status 의 output 이 yield 한 항목들의 배열이 되므로 기본값은 false)
+STREAM_PROGRESS = os.getenv("STREAM_PROGRESS", "false").lower() == "true"
+# progress 레코드 최소 간격 (초). 노드의 마지막 스텝 완료는 간격과 상관없이 보냄
+PROGRESS_MIN_INTERVAL = float(os.getenv("PROGRESS_MIN_INTERVAL", "1.0"))
+# job 하나에 넣을 수 있는 variant (시드 / 프롬프트 등 파라미터 덮어쓰기) 최대 개수
+MAX_VARIANTS = int(os.getenv("MAX_VARIANTS", "16"))
 
 # 이미지 저장 디렉토리 (ComfyUI 컨테이너 기준)
 INPUT_DIR = os.getenv("COMFY_INPUT_DIR", "/comfyui/input")
+# 입력 이미지 캐시: 내용 해시(sha256) 이름으로 저장하고, 요청한 이름은 하드링크로 연결
+# (LoadImage 는 INPUT_DIR 최상위 파일만 보므로 하위 폴더에 둬도 목록에 안 섞임)
+INPUT_CACHE_DIR = os.getenv("INPUT_CACHE_DIR", os.path.join(INPUT_DIR, ".cache"))
+INPUT_CACHE_MAX_BYTES = int(float(os.getenv("INPUT_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+INPUT_CACHE_MAX_AGE = float(os.getenv("INPUT_CACHE_MAX_AGE_HOURS", "24")) * 3600
+# 캐시 정리 최소 간격 (초)
+INPUT_CACHE_EVICT_INTERVAL = float(os.getenv("INPUT_CACHE_EVICT_INTERVAL", "60"))
+# 한 job 의 이미지 여러 장을 동시에 디코딩/다운로드/저장할 스레드 수
+INPUT_DECODE_WORKERS = max(1, int(os.getenv("INPUT_DECODE_WORKERS", "4")))
+# base64 대신 참조로 받는 입력: http(s):// URL, file:// URL, 또는 아래 디렉토리(쉼표 구분) 밑의 절대 경로
+INPUT_REF_ROOTS = [p.strip().rstrip("/") for p in os.getenv("INPUT_REF_ROOTS", "/runpod-volume").split(",") if p.strip()]
+INPUT_FETCH_TIMEOUT = float(os.getenv("INPUT_FETCH_TIMEOUT", "60"))
+INPUT_FETCH_MAX_BYTES = int(float(os.getenv("INPUT_FETCH_MAX_MB", "512")) * 1024 * 1024)
+# 받아 둔 URL 을 다시 확인하지 않고 쓰는 시간 (초). 지나면 ETag / Last-Modified 로 조건부 요청
+INPUT_REF_TTL = float(os.getenv("INPUT_REF_TTL", "60"))
+# 기억해 두는 참조 수 (넘으면 오래 안 쓰인 것부터 잊음)
+INPUT_REF_CACHE_MAX_ENTRIES = int(os.getenv("INPUT_REF_CACHE_MAX_ENTRIES", "4096"))
 # ComfyUI 출력/임시 디렉토리 (컨테이너 기준)
 OUTPUT_DIR = os.getenv("COMFY_OUTPUT_DIR", "/comfyui/output")
 TEMP_DIR = os.getenv("COMFY_TEMP_DIR", "/comfyui/temp")
 
+# 서버 측 워크플로우 템플릿 (워커 시작 시 한 번 로드)
+TEMPLATE_DIR = os.getenv("TEMPLATE_DIR", os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_FILES = {
+    "i2v": "new_Wan22_api.json",
+    "flf2v": "new_Wan22_flf2v_api.json",
+}
+
+# 출력/임시 디렉토리 정리 (janitor)
+# - 반환이 끝난 job 의 출력 파일은 다음 정리 때 삭제 (OUTPUT_DELETE_RETURNED)
+# - 그 외 파일은 나이(OUTPUT_MAX_AGE_HOURS)와 전체 용량(OUTPUT_QUOTA_MB) 기준으로 오래된 것부터 삭제
+# - OUTPUT_PIN_PATTERNS(쉼표 구분 glob, 파일명 또는 상대경로)에 맞는 파일과 pin() 된 파일은 지우지 않음
+OUTPUT_QUOTA_BYTES = int(float(os.getenv("OUTPUT_QUOTA_MB", "10240")) * 1024 * 1024)
+OUTPUT_MAX_AGE = float(os.getenv("OUTPUT_MAX_AGE_HOURS", "6")) * 3600
+OUTPUT_DELETE_RETURNED = os.getenv("OUTPUT_DELETE_RETURNED", "true").lower() == "true"
+OUTPUT_PIN_PATTERNS = [p.strip() for p in os.getenv("OUTPUT_PIN_PATTERNS", "").split(",") if p.strip()]
+# 이 시간(초) 안에 수정된 파일은 실행 중인 job 이 쓰는 중일 수 있어서 용량 초과여도 건드리지 않음
+OUTPUT_GRACE_SECONDS = float(os.getenv("OUTPUT_GRACE_SECONDS", "600"))
+JANITOR_INTERVAL = float(os.getenv("JANITOR_INTERVAL", "60"))
+
+# 워커 시작 시 warm-up: ComfyUI 준비 후 템플릿을 아주 작게 한 번 실행해서
+# 모델 가중치(WanVideo 14B x2, T5, VAE)를 미리 올려두고, 끝난 뒤에 RunPod 에 job 을 받기 시작한다고 알림
+WARMUP = os.getenv("WARMUP", "true").lower() == "true"
+WARMUP_TEMPLATE = os.getenv("WARMUP_TEMPLATE", "i2v")
+# 기본 warm-up 파라미터에 덮어쓸 값 (JSON). 해상도는 16 의 배수, 프레임 수는 4n+1
+WARMUP_PARAMS = json.loads(os.getenv("WARMUP_PARAMS", "") or "{}")
+# steps 는 템플릿의 high/low 경계(노드 575, 기본 4)보다 커야 low-noise 모델까지 로드됨
+WARMUP_DEFAULT_PARAMS = {"prompt": "warm-up", "width": 64, "height": 64, "length": 5, "steps": 6, "seed": 0}
+# 워커 시작 직후, ComfyUI 가 import 하는 동안 템플릿이 쓰는 모델 파일을 여러 스레드로 미리 읽어 페이지 캐시에 올림
+# (첫 모델 로딩이 네트워크 볼륨 / 디스크 대신 메모리에서 읽도록)
+PREFETCH_MODELS = os.getenv("PREFETCH_MODELS", "true").lower() == "true"
+PREFETCH_WORKERS = max(1, int(os.getenv("PREFETCH_WORKERS", "8")))
+# 미리 읽을 최대 크기 (GB). 비우면 워커 시작 시 사용 가능한 메모리(MemAvailable)의 80%
+PREFETCH_MAX_GB = os.getenv("PREFETCH_MAX_GB", "")
+# 스레드 하나가 한 번에 맡는 파일 구간 크기
+PREFETCH_RANGE_SIZE = 64 * 1024 * 1024
+
+# 결과 캐시: 같은 워크플로우 + 같은 입력 이미지면 ComfyUI 에 보내지 않고 저장해둔 출력 파일로 응답
+# - 키: 정규화한 워크플로우(노드별 class_type / inputs 만, 키 정렬) + 입력 이미지 내용 해시 + RESULT_CACHE_SALT
+# - 여러 워커가 공유하려면 네트워크 볼륨 경로를 지정 (예: /runpod-volume/result_cache)
+# - RESULT_CACHE_MAX_MB 를 넘으면 가장 오래 안 쓰인 항목부터 삭제, 0 이면 캐시 사용 안 함
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", os.path.join(os.path.dirname(OUTPUT_DIR.rstrip("/")), "result_cache"))
+RESULT_CACHE_MAX_BYTES = int(float(os.getenv("RESULT_CACHE_MAX_MB", "10240")) * 1024 * 1024)
+# 모델 / LoRA 파일을 바꿨을 때 이전 결과를 무효화하려면 값을 바꿈
+RESULT_CACHE_SALT = os.getenv("RESULT_CACHE_SALT", "")
+# 같은 키를 계산 중인 job 을 기다릴 때 취소 / 마감 시간을 확인하는 간격 (초)
+RESULT_CACHE_WAIT_INTERVAL = float(os.getenv("RESULT_CACHE_WAIT_INTERVAL", "1"))
+
+# 네트워크 볼륨의 모델 / LoRA 를 로컬 디스크(NVMe)에 복사해두고 워크플로우가 로컬 사본을 읽게 함
+# - 볼륨 위치는 ComfyUI 의 extra_model_paths.yaml 에서 읽음
+# - 처음 쓰인 파일은 그 job 에서는 볼륨에서 읽고, 백그라운드 복사가 끝난 뒤의 job 부터 로컬 사본 사용
+# - 사본: <COMFY_MODELS_DIR>/<폴더>/<MODEL_STAGE_SUBDIR>/<이름> (ComfyUI 기본 모델 폴더 아래라서 따로 등록할 필요 없음)
+# - MODEL_STAGE_MAX_GB 를 넘으면 가장 오래 안 쓰인 사본부터 삭제, 0 이면 사용 안 함
+MODEL_PATHS_FILE = os.getenv("MODEL_PATHS_FILE", "/comfyui/extra_model_paths.yaml")
+COMFY_MODELS_DIR = os.getenv("COMFY_MODELS_DIR", "/comfyui/models")
+MODEL_STAGE_SUBDIR = os.getenv("MODEL_STAGE_SUBDIR", "_staged")
+MODEL_STAGE_MAX_BYTES = int(float(os.getenv("MODEL_STAGE_MAX_GB", "50")) * 1024**3)
+# 복사한 뒤에도 디스크에 남겨둘 여유 공간 (출력 / 입력 캐시용)
+MODEL_STAGE_MIN_FREE_BYTES = int(float(os.getenv("MODEL_STAGE_MIN_FREE_GB", "10")) * 1024**3)
+# 복사할 폴더 (extra_model_paths.yaml 의 키, 예: loras,unet). 비우면 전부
+MODEL_STAGE_FOLDERS = {f.strip() for f in os.getenv("MODEL_STAGE_FOLDERS", "").split(",") if f.strip()}
+MODEL_STAGE_CHUNK_SIZE = 16 * 1024 * 1024
+MODEL_EXTENSIONS = (".safetensors", ".sft", ".ckpt", ".pt", ".pt2", ".pth", ".bin", ".pkl", ".gguf")
+
+# 긴 영상 분할 생성 (input 의 segment_length): 세그먼트마다 이전 세그먼트의 마지막 프레임에서 시작
+# - 끝난 세그먼트는 체크포인트로 저장, 같은 요청이 다시 오면 (재시도 등) 남은 세그먼트만 생성
+# - 네트워크 볼륨 경로를 지정하면 다른 워커에서도 이어서 생성 (예: /runpod-volume/segments)
+SEGMENT_CHECKPOINT_DIR = os.getenv("SEGMENT_CHECKPOINT_DIR", os.path.join(os.path.dirname(OUTPUT_DIR.rstrip("/")), "segments"))
+# 이 시간(시간 단위) 동안 다시 안 쓰인 체크포인트는 삭제
+SEGMENT_CHECKPOINT_MAX_AGE = float(os.getenv("SEGMENT_CHECKPOINT_MAX_AGE_HOURS", "24")) * 3600
+MAX_SEGMENTS = int(os.getenv("MAX_SEGMENTS", "16"))
+# 마지막 프레임 추출 / 세그먼트 이어붙이기에 쓰는 ffmpeg (없으면 PATH, imageio-ffmpeg 순으로 찾음)
+FFMPEG_BIN = os.getenv("FFMPEG_BIN") or shutil.which("ffmpeg")
+if not FFMPEG_BIN and imageio_ffmpeg is not None:
+    try:
+        FFMPEG_BIN = imageio_ffmpeg.get_ffmpeg_exe()
+    except RuntimeError:
+        FFMPEG_BIN = None
+
+# 출력 파일 base64 인코딩 시 한 번에 읽는 크기 (3의 배수로 맞춰야 청크 경계에서 패딩이 안 생김)
+OUTPUT_CHUNK_SIZE = max(3, int(os.getenv("OUTPUT_CHUNK_SIZE", str(3 * 1024 * 1024))) // 3 * 3)
+# 출력 파일을 S3 호환 버킷(AWS S3, MinIO, R2 등)에 올리고 URL 만 반환 (S3_BUCKET 설정 + boto3 필요)
+# 인증 정보는 boto3 표준 환경 변수(AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY)를 사용
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or None
+S3_PREFIX = os.getenv("S3_PREFIX", "outputs/")
+# 0 보다 크면 presigned URL 유효기간(초), 0 이면 S3_PUBLIC_URL(없으면 endpoint/bucket) 기준 고정 URL
+S3_PRESIGN_EXPIRES = int(os.getenv("S3_PRESIGN_EXPIRES", "86400"))
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL", "")
+# 이 크기를 넘는 파일은 멀티파트로, 파트 여러 개를 동시에 업로드
+S3_MULTIPART_THRESHOLD = int(float(os.getenv("S3_MULTIPART_THRESHOLD_MB", "16")) * 1024 * 1024)
+S3_MULTIPART_CHUNK = int(float(os.getenv("S3_MULTIPART_CHUNK_MB", "16")) * 1024 * 1024)
+
+# 인라인(data URL)으로 반환할 출력 파일의 최대 크기 (MB, 0 이면 제한 없음). base64 로 4/3 배가 되는 페이로드 상한
+# 넘는 파일은 S3 에 업로드해서 URL 로 반환. 기본값은 S3_BUCKET 이 있으면 16, 없으면 0
+# (S3 없이 한도를 직접 정하면 넘는 파일은 job 실패)
+MAX_INLINE_OUTPUT_BYTES = int(float(os.getenv("MAX_INLINE_OUTPUT_MB", "16" if S3_BUCKET else "0")) * 1024 * 1024)
+S3_UPLOAD_CONCURRENCY = max(1, int(os.getenv("S3_UPLOAD_CONCURRENCY", "8")))
+# 한 job 에서 동시에 업로드하는 파일 수
+S3_UPLOAD_FILES = max(1, int(os.getenv("S3_UPLOAD_FILES", "4")))
+# job input 의 output_mode 기본값: inline(data URL) 또는 s3(URL)
+OUTPUT_MODE = os.getenv("OUTPUT_MODE", "s3" if S3_BUCKET else "inline")
+
+
+def _strip_data_url(data: str) -> str:
+    """data:...;base64, 접두어가 있으면 제거"""
+    if data.startswith("data:"):
+        _, _, data = data.partition(",")
+    return data
+
 
-def save_base64_image(name: str, base64_data: str) -> str:
-    """Base64 이미지를 파일로 저장하고 경로 반환"""
+def _data_url_ext(data: str) -> str:
+    """data URL 의 mime 으로 확장자 추정 (알 수 없으면 .png)"""
+    if data.startswith("data:"):
+        mime = data[5:].split(";", 1)[0].lower()
+        for ext, m in ((".jpg", "image/jpeg"), (".webp", "image/webp"), (".gif", "image/gif")):
+            if mime == m:
+                return ext
+    return ".png"
+
+
+def _link_or_copy(src: str, dst: str):
+    """dst 를 src 의 하드링크로 원자적으로 교체 (하드링크가 안 되면 복사)"""
+    tmp = f"{dst}.{uuid.uuid4().hex}.tmp"
     try:
-        os.makedirs(INPUT_DIR, exist_ok=True)
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
 
-        decoded_data = base64.b64decode(base64_data)
-        file_path = os.path.join(INPUT_DIR, name)
 
-        with open(file_path, "wb") as f:
-            f.write(decoded_data)
+def save_base64_image(name: str | None, base64_data: str) -> tuple[str, tuple[int, int]]:
+    """
+    Base64 이미지를 파일로 저장하고 (경로, 고정한 캐시 파일 키) 반환.
+    - 내용 해시로 INPUT_CACHE_DIR 에 한 번만 저장, 같은 이미지가 다시 오면 쓰기 생략
+    - INPUT_DIR 의 이름은 캐시 파일에 하드링크. 요청한 이름에도 내용 해시를 붙여서
+      동시에 도는 job 이 같은 이름으로 다른 이미지를 보내도 서로 덮어쓰지 않음 (input_name_for)
+    """
+    try:
+        decoded_data = base64.b64decode(_strip_data_url(base64_data))
+        digest = hashlib.sha256(decoded_data).hexdigest()
+        name = input_name_for(name, digest, _data_url_ext(base64_data))
+
+        os.makedirs(INPUT_CACHE_DIR, exist_ok=True)
+        cached_path = os.path.join(INPUT_CACHE_DIR, digest + os.path.splitext(name)[1].lower())
+        if os.path.exists(cached_path):
+            # LRU 기준 시각 갱신
+            os.utime(cached_path)
+            logger.info(f"♻️ 캐시된 이미지 재사용: {name} -> {cached_path}")
+        else:
+            tmp = f"{cached_path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(decoded_data)
+            os.replace(tmp, cached_path)
 
-        logger.info(f"✅ 이미지 저장 완료: {file_path}")
-        return file_path
+        pin = _pin_input_cache(cached_path)
+        try:
+            return _link_input(name, cached_path), pin
+        except BaseException:
+            release_input_images([pin])
+            raise
     except Exception as e:
         logger.error(f"❌ 이미지 저장 실패: {e}")
         raise Exception(f"이미지 저장 실패: {e}")
 
 
-def queue_prompt(prompt):
-    url = f"http://{server_address}:8188/prompt"
-    logger.info(f"Queueing prompt to: {url}")
+def input_name_for(name: str | None, digest: str, default_ext: str) -> str:
+    """
+    입력 이미지를 INPUT_DIR 에 저장할 이름. 요청한 이름 뒤에 내용 해시를 붙임 (john-wick_cut.png -> john-wick_cut_<해시>.png).
+    같은 이름은 항상 같은 내용이므로, ComfyUI 가 읽기 전에 다른 job 이 파일을 바꿔치기할 수 없음
+    """
+    if not name:
+        return f"input_{digest[:16]}{default_ext}"
+    stem, ext = os.path.splitext(name)
+    return f"{stem}_{digest[:16]}{ext.lower()}"
+
+
+def rename_input_images(workflow: dict, renamed: dict[str, str]) -> dict:
+    """
+    요청한 입력 이름을 가리키는 노드 입력을 저장한 이름으로 바꾼 워크플로우 반환.
+    image 뿐 아니라 video / mask / start_image 처럼 입력 이름과 같은 문자열 입력은 모두 바꿈
+    """
+    if not renamed or not isinstance(workflow, dict):
+        return workflow
+    result = dict(workflow)
+    for node_id, node in workflow.items():
+        inputs = node.get("inputs") if isinstance(node, dict) else None
+        if not isinstance(inputs, dict):
+            continue
+        changed = {name: renamed[value] for name, value in inputs.items() if isinstance(value, str) and value in renamed}
+        if changed:
+            result[node_id] = {**node, "inputs": {**inputs, **changed}}
+    return result
+
+
+def _link_input(name: str, cached_path: str) -> str:
+    """캐시 파일을 INPUT_DIR/name 으로 연결하고 경로 반환"""
+    file_path = os.path.join(INPUT_DIR, name)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    try:
+        linked = os.path.samefile(file_path, cached_path)
+    except OSError:
+        linked = False
+    if not linked:
+        _link_or_copy(cached_path, file_path)
+
+    logger.info(f"✅ 이미지 저장 완료: {file_path}")
+    return file_path
+
+
+def is_input_ref(data) -> bool:
+    """base64 대신 URL / 파일 경로로 온 입력인지 (JPEG base64 도 / 로 시작하므로 경로는 허용 루트로만 판단)"""
+    if not isinstance(data, str):
+        return False
+    if data.startswith(("http://", "https://", "file://")):
+        return True
+    return any(data.startswith(root + "/") for root in INPUT_REF_ROOTS)
+
+
+def _ref_local_path(ref: str) -> str:
+    """file:// URL 또는 절대 경로 참조를 실제 경로로 변환 (INPUT_REF_ROOTS 밖이면 ValueError)"""
+    path = urllib.request.url2pathname(urllib.parse.urlparse(ref).path) if ref.startswith("file://") else ref
+    real = os.path.realpath(path)
+    for root in INPUT_REF_ROOTS:
+        root = os.path.realpath(root)
+        if real.startswith(root + os.sep):
+            return real
+    raise ValueError(f"허용되지 않은 입력 경로: {ref} (허용: {INPUT_REF_ROOTS})")
+
+
+def _cache_stream(chunks, ext: str) -> str:
+    """청크를 sha256 으로 해시하면서 INPUT_CACHE_DIR 에 저장하고 캐시 경로 반환"""
+    os.makedirs(INPUT_CACHE_DIR, exist_ok=True)
+    tmp = os.path.join(INPUT_CACHE_DIR, f"{uuid.uuid4().hex}.tmp")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > INPUT_FETCH_MAX_BYTES:
+                    raise ValueError(f"입력 파일이 너무 큽니다 (> {INPUT_FETCH_MAX_BYTES} bytes)")
+                digest.update(chunk)
+                f.write(chunk)
+        cached_path = os.path.join(INPUT_CACHE_DIR, digest.hexdigest() + ext)
+        if os.path.exists(cached_path):
+            os.utime(cached_path)
+            os.remove(tmp)
+        else:
+            os.replace(tmp, cached_path)
+        return cached_path
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+_input_ref_lock = threading.Lock()
+# 참조 -> {"path": 캐시 경로, "checked": 확인 시각, "etag", "last_modified"} (LRU 순서).
+# 받는 중인 참조는 Future 로 공유
+_input_ref_cache: OrderedDict[str, dict] = OrderedDict()
+_input_ref_inflight: dict[str, Future] = {}
+
+
+def _fetch_url(ref: str, entry: dict | None) -> tuple[str, dict]:
+    """URL 을 입력 캐시로 받고 (캐시 경로, 검증 헤더) 반환. entry 가 있으면 조건부 요청, 304 면 그 파일 그대로"""
+    headers = {"User-Agent": "wan22-worker"}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    try:
+        with urllib.request.urlopen(urllib.request.Request(ref, headers=headers), timeout=INPUT_FETCH_TIMEOUT) as response:
+            ext = (
+                os.path.splitext(urllib.parse.urlparse(ref).path)[1].lower()
+                or mimetypes.guess_extension(response.headers.get_content_type() or "")
+                or ".png"
+            )
+            cached = _cache_stream(iter(lambda: response.read(1024 * 1024), b""), ext)
+            return cached, {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and entry:
+            logger.info(f"♻️ 입력이 바뀌지 않음 (304): {ref}")
+            return entry["path"], {"etag": entry.get("etag"), "last_modified": entry.get("last_modified")}
+        raise
+
+
+def fetch_input_ref(ref: str) -> str:
+    """
+    참조 입력을 입력 캐시로 가져오고 캐시 경로 반환.
+    - http(s) 는 URL 기준으로 캐시하고, INPUT_REF_TTL 이 지나면 ETag / Last-Modified 로 다시 확인
+      (검증 헤더가 없으면 다시 받음. 내용이 같으면 캐시 파일은 하나)
+    - 로컬 파일은 (경로, 크기, 수정 시각) 기준으로 캐시
+    - 여러 job 이 같은 참조를 동시에 요청하면 한 번만 받음
+    """
+    if ref.startswith(("http://", "https://")):
+        key, local_path = ref, None
+    else:
+        local_path = _ref_local_path(ref)
+        st = os.stat(local_path)
+        key = f"{local_path}:{st.st_size}:{st.st_mtime_ns}"
+
+    with _input_ref_lock:
+        entry = _input_ref_cache.get(key)
+        if entry and not os.path.exists(entry["path"]):
+            entry = None
+        if entry:
+            _input_ref_cache.move_to_end(key)
+            if local_path or time.time() - entry["checked"] < INPUT_REF_TTL:
+                os.utime(entry["path"])
+                logger.info(f"♻️ 캐시된 입력 재사용: {ref} -> {entry['path']}")
+                return entry["path"]
+        future = _input_ref_inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _input_ref_inflight[key] = Future()
+    if not owner:
+        return future.result()
+
+    try:
+        t0 = time.monotonic()
+        validators = {}
+        if local_path:
+            ext = os.path.splitext(local_path)[1].lower() or ".png"
+            with open(local_path, "rb") as f:
+                cached = _cache_stream(iter(lambda: f.read(1024 * 1024), b""), ext)
+        else:
+            cached, validators = _fetch_url(ref, entry)
+            if cached == (entry or {}).get("path"):
+                os.utime(cached)
+        logger.info(f"⬇️ 입력 가져오기 완료: {ref} -> {cached} ({time.monotonic() - t0:.2f}s)")
+    except BaseException as e:
+        with _input_ref_lock:
+            _input_ref_inflight.pop(key, None)
+        future.set_exception(e)
+        raise
+
+    with _input_ref_lock:
+        _input_ref_cache[key] = {"path": cached, "checked": time.time(), **validators}
+        _input_ref_cache.move_to_end(key)
+        while len(_input_ref_cache) > INPUT_REF_CACHE_MAX_ENTRIES:
+            _input_ref_cache.popitem(last=False)
+        _input_ref_inflight.pop(key, None)
+    future.set_result(cached)
+    return cached
+
+
+def save_input_image(name: str | None, data: str) -> tuple[str, tuple[int, int]]:
+    """입력 이미지(base64 / data URL / URL·경로 참조)를 INPUT_DIR 에 저장하고 (경로, 고정한 캐시 파일 키) 반환"""
+    if not is_input_ref(data):
+        return save_base64_image(name, data)
+    try:
+        cached_path = fetch_input_ref(data)
+        digest, ext = os.path.splitext(os.path.basename(cached_path))
+        pin = _pin_input_cache(cached_path)
+        try:
+            return _link_input(input_name_for(name, digest, ext), cached_path), pin
+        except BaseException:
+            release_input_images([pin])
+            raise
+    except Exception as e:
+        logger.error(f"❌ 입력 가져오기 실패: {data}: {e}")
+        raise Exception(f"입력 가져오기 실패: {data}: {e}")
+
+
+_input_cache_lock = threading.Lock()
+_input_cache_last_evict = 0.0
+# 실행 중인 job 이 쓰고 있는 캐시 파일 (inode -> 참조 수), 정리 대상에서 제외
+_input_cache_pins: dict[tuple[int, int], int] = {}
+
+
+def _inode(path: str) -> tuple[int, int]:
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino)
+
+
+def _pin_input_cache(cached_path: str) -> tuple[int, int]:
+    """캐시 파일을 정리 대상에서 제외하고 키(inode) 반환. INPUT_DIR 의 이름이 아니라 캐시 파일 기준이라
+    다른 job 이 같은 이름을 다른 파일로 바꿔도 엉뚱한 파일을 풀지 않음"""
+    with _input_cache_lock:
+        key = _inode(cached_path)
+        _input_cache_pins[key] = _input_cache_pins.get(key, 0) + 1
+    return key
+
+
+def save_input_images(images: list[tuple[str, str]]) -> tuple[list[str], list[tuple[int, int]]]:
+    """
+    (name, base64 또는 참조) 목록을 병렬로 저장하고 (경로 목록, 고정한 캐시 파일 키 목록) 반환.
+    저장한 파일은 키 목록으로 release_input_images 를 부를 때까지 캐시 정리에서 제외됨.
+    """
+    if not images:
+        return [], []
+    if len(images) == 1:
+        saved = [save_input_image(*images[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(images), INPUT_DECODE_WORKERS)) as pool:
+            futures = [pool.submit(save_input_image, *item) for item in images]
+        saved = [future.result() for future in futures if future.exception() is None]
+        failed = next((future.exception() for future in futures if future.exception() is not None), None)
+        if failed is not None:
+            # 저장에 성공한 것까지 고정을 풀고 실패
+            release_input_images([pin for _, pin in saved])
+            raise failed
+
+    evict_input_cache()
+    return [path for path, _ in saved], [pin for _, pin in saved]
+
+
+def release_input_images(pins: list[tuple[int, int]]):
+    """save_input_images 가 고정한 캐시 파일 (반환한 키 목록) 고정 해제"""
+    with _input_cache_lock:
+        for key in pins:
+            count = _input_cache_pins.get(key, 0) - 1
+            if count > 0:
+                _input_cache_pins[key] = count
+            else:
+                _input_cache_pins.pop(key, None)
+
+
+def evict_input_cache(force: bool = False):
+    """
+    입력 이미지 캐시 정리.
+    - INPUT_CACHE_MAX_AGE 보다 오래 안 쓰인 파일 삭제
+    - 전체 크기가 INPUT_CACHE_MAX_BYTES 를 넘으면 오래 안 쓰인 것부터 삭제
+    - 삭제한 캐시 파일에 하드링크된 INPUT_DIR 의 이름도 같이 삭제
+    """
+    global _input_cache_last_evict
+    now = time.time()
+    if not force and now - _input_cache_last_evict < INPUT_CACHE_EVICT_INTERVAL:
+        return
+    if not _input_cache_lock.acquire(blocking=False):
+        return
+    try:
+        _input_cache_last_evict = now
+        try:
+            entries = []
+            with os.scandir(INPUT_CACHE_DIR) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False) and not entry.name.endswith(".tmp"):
+                        st = entry.stat(follow_symlinks=False)
+                        entries.append((st.st_mtime, st.st_size, entry.path, (st.st_dev, st.st_ino)))
+        except FileNotFoundError:
+            return
+
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        evicted = set()
+        freed = 0
+        for mtime, size, path, inode in entries:
+            if now - mtime <= INPUT_CACHE_MAX_AGE and total <= INPUT_CACHE_MAX_BYTES:
+                break
+            if inode in _input_cache_pins:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            freed += size
+            evicted.add(inode)
+
+        if not evicted:
+            return
+
+        # 지운 캐시 파일을 가리키던 참조는 잊음 (다음에 다시 받음)
+        with _input_ref_lock:
+            for key in [key for key, entry in _input_ref_cache.items() if not os.path.exists(entry["path"])]:
+                del _input_ref_cache[key]
+
+        # 요청 이름으로 걸려 있던 하드링크 정리
+        with os.scandir(INPUT_DIR) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    if (st.st_dev, st.st_ino) in evicted:
+                        try:
+                            os.remove(entry.path)
+                        except FileNotFoundError:
+                            pass
+
+        logger.info(f"🧹 입력 이미지 캐시 정리: {len(evicted)}개, {freed / (1024 * 1024):.1f}MB 확보")
+    except Exception as e:
+        logger.warning(f"입력 이미지 캐시 정리 실패: {e}")
+    finally:
+        _input_cache_lock.release()
+
+
+class PromptWatch:
+    """prompt_id 하나에 대한 WebSocket 이벤트 구독 (이벤트 큐 + 완료 future)"""
+
+    def __init__(self, prompt_id: str):
+        self.prompt_id = prompt_id
+        self.events = queue.Queue()
+        self.done = Future()
+        # prompt 의 출력 노드 ID (스키마를 모르면 None). executed 이벤트로 출력을 다 받았는지 판단할 때 사용
+        self.output_nodes: set[str] | None = None
+        # 이 prompt 가 쓰는 모델 로컬 사본 (끝날 때까지 정리 대상에서 제외)
+        self.staged: list[str] = []
+
+    def put(self, message: dict):
+        self.events.put(message)
+        if message.get("type") == "executing":
+            data = message.get("data", {})
+            if data.get("node") is None and not self.done.done():
+                self.done.set_result(None)
+
+    def get(self, timeout: float | None = None):
+        """이벤트 하나를 반환, timeout 동안 없으면 None"""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class JobCancelled(Exception):
+    """job 이 취소되었거나 마감 시간을 넘김 (ComfyUI 에서 prompt 를 내린 뒤에 발생)"""
+
+    def __init__(self, message: str, info: dict | None = None):
+        super().__init__(message)
+        self.info = info or {}
+
+
+class JobControl:
+    """
+    job 하나의 마감 시간과 취소 상태.
+    - 취소되면 등록된 콜백으로 prompt 를 기다리는 곳을 바로 깨움
+    - job 이 ComfyUI 에 넣고 아직 끝나지 않은 prompt 를 기억 (취소 시 한꺼번에 큐에서 내림)
+    """
+
+    def __init__(self, deadline: float | None = None):
+        self.deadline = deadline
+        self.reason: str | None = None
+        self.prompts: dict[str, PromptWatch] = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """취소 시 호출할 콜백 등록 (이미 취소됐으면 바로 호출). 해제 함수 반환"""
+
+        def remove():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                return remove
+        callback()
+        return remove
+
+    def stop_reason(self) -> str | None:
+        """멈춰야 하면 "cancelled" / "deadline", 아니면 None"""
+        if self.reason is not None:
+            return self.reason
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return "deadline"
+        return None
+
+    def check(self):
+        """이미 취소됐거나 마감 시간이 지났으면 JobCancelled (ComfyUI 에 새 prompt 를 넣기 전에 확인)"""
+        reason = self.stop_reason()
+        if reason is not None:
+            raise JobCancelled(f"job {CANCEL_REASONS[reason]}")
+
+    def track(self, prompt_id: str, watch: PromptWatch):
+        with self._lock:
+            self.prompts[prompt_id] = watch
+
+    def untrack(self, prompt_id: str):
+        with self._lock:
+            self.prompts.pop(prompt_id, None)
+
+    def tracked(self) -> dict[str, PromptWatch]:
+        with self._lock:
+            return dict(self.prompts)
+
+
+# 응답을 받기 전에 연결이 끊긴 경우 (서버가 닫은 keep-alive 연결에 보냄)
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+
+class ComfyUIConnection:
+    """
+    워커 시작 시 한 번 만들어 모든 job 이 같이 쓰는 ComfyUI 연결.
+    - HTTP: 스레드별 keep-alive 연결을 재사용. GET 은 실패하면 새 연결로 한 번 재시도,
+      그 밖의 요청은 재사용한 연결이 이미 닫혀 있던 경우(응답 전에 끊김)에만 재시도
+    - WebSocket: client_id 하나로 계속 유지, 끊기면 다시 연결
+    - 준비 상태: 연결 직후 ComfyUI 가 보내는 status 이벤트를 받으면 ready
+    - 수신: 백그라운드 스레드 하나가 메시지를 읽어 prompt_id 별 PromptWatch 로 나눠줌
+    """
+
+    def __init__(self, host: str, port: int, client_id: str):
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.ws_url = f"ws://{host}:{port}/ws?clientId={client_id}"
+
+        self.ready = threading.Event()
+        self._local = threading.local()
+        self._ws = None
+        self._ws_lock = threading.Lock()
+        self._reader = None
+        self._watches: dict[str, PromptWatch] = {}
+        self._watches_lock = threading.Lock()
+
+    # ---- HTTP ----
+
+    def _http_conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=COMFY_HTTP_TIMEOUT)
+            self._local.conn = conn
+        return conn
+
+    def _drop_http_conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def request(self, method: str, path: str, payload=None, retry: bool | None = None):
+        """
+        retry: 실패하면 새 연결로 한 번 더 보낼지 (기본: GET 만).
+        retry 가 아니어도 재사용한 keep-alive 연결이 서버 쪽에서 닫혀 있던 경우는 재시도하고,
+        retry=False 면 그것도 하지 않음 (POST /prompt 처럼 두 번 들어가면 안 되는 요청은 호출한 쪽에서 확인)
+        """
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+
+        retryable = method == "GET" if retry is None else retry
+        for attempt in range(2):
+            conn = self._http_conn()
+            reused = conn.sock is not None
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError, OSError) as e:
+                self._drop_http_conn()
+                # 재사용한 keep-alive 연결이 이미 닫혀 있었으면 요청은 서버에 닿지 않음
+                stale = reused and isinstance(e, STALE_CONNECTION_ERRORS)
+                if attempt == 1 or not (retryable or (stale and retry is None)):
+                    raise
+
+        if response.status >= 400:
+            raise Exception(
+                f"ComfyUI {method} {path} 실패 ({response.status}): {data.decode('utf-8', 'replace')}"
+            )
+        return json.loads(data) if data else None
+
+    def get_json(self, path: str):
+        return self.request("GET", path)
+
+    def post_json(self, path: str, payload):
+        return self.request("POST", path, payload)
+
+    # ---- WebSocket ----
+
+    def _connect_ws(self, timeout: float):
+        ws = websocket.WebSocket()
+        try:
+            ws.connect(self.ws_url, timeout=timeout)
+
+            # ComfyUI 는 연결 직후 status 이벤트를 보냄 -> 이걸 받아야 준비 완료
+            while True:
+                out = ws.recv()
+                if isinstance(out, str) and json.loads(out).get("type") == "status":
+                    break
+        except Exception:
+            ws.close()
+            raise
+
+        ws.settimeout(COMFY_WS_RECV_TIMEOUT)
+        self._ws = ws
+        self.ready.set()
+        logger.info(f"✅ WebSocket 연결 성공: {self.ws_url}")
+
+    def _close_ws(self):
+        self.ready.clear()
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+            self._ws = None
+
+    def wait_ready(self, timeout: float = COMFY_READY_TIMEOUT):
+        """WebSocket 이 연결되고 status 이벤트를 받을 때까지 대기 (이미 연결돼 있으면 바로 반환)"""
+        if self.ready.is_set():
+            return True
+
+        deadline = time.monotonic() + timeout
+        delay = 0.25
+        attempt = 0
+        with self._ws_lock:
+            while not self.ready.is_set():
+                attempt += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Exception("ComfyUI 서버에 연결할 수 없습니다.")
+                try:
+                    self._connect_ws(timeout=min(remaining, 10))
+                except Exception as e:
+                    self._close_ws()
+                    logger.warning(f"ComfyUI 대기 중 (시도 {attempt}): {e}")
+                    # 서버가 뜨기 전에는 연결이 바로 거부되므로 짧게 시작해서 점점 늘림
+                    time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+                    delay = min(delay * 2, 5)
+
+            if self._reader is None:
+                self._reader = threading.Thread(target=self._read_loop, name="comfy-ws-reader", daemon=True)
+                self._reader.start()
+        return True
+
+    def watch(self, prompt_id: str) -> PromptWatch:
+        """prompt_id 로 오는 이벤트 구독 시작 (queue_prompt 전에 등록해야 이벤트를 놓치지 않음)"""
+        w = PromptWatch(prompt_id)
+        with self._watches_lock:
+            self._watches[prompt_id] = w
+        return w
+
+    def unwatch(self, prompt_id: str):
+        with self._watches_lock:
+            self._watches.pop(prompt_id, None)
+
+    def _dispatch(self, message: dict):
+        data = message.get("data")
+        prompt_id = data.get("prompt_id") if isinstance(data, dict) else None
+        with self._watches_lock:
+            if prompt_id is None:
+                # 연결 재설정 알림은 모든 구독자에게
+                targets = list(self._watches.values()) if message.get("type") == "reconnected" else []
+            else:
+                w = self._watches.get(prompt_id)
+                targets = [w] if w else []
+        for w in targets:
+            w.put(message)
+
+    def _read_loop(self):
+        """
+        WebSocket 메시지를 계속 읽어 prompt 별로 나눠줌.
+        - 바이너리(프리뷰 이미지) 메시지는 버림
+        - 연결이 끊기면 다시 연결하고 모든 구독자에게 {"type": "reconnected"} 전달
+          (끊긴 동안 놓친 이벤트가 있을 수 있으니 구독자가 history 로 확인)
+        """
+        while True:
+            try:
+                self.wait_ready()
+                out = self._ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            except Exception as e:
+                logger.warning(f"WebSocket 연결 끊김, 다시 연결합니다: {e}")
+                with self._ws_lock:
+                    self._close_ws()
+                try:
+                    self.wait_ready()
+                except Exception as e:
+                    logger.error(f"❌ WebSocket 재연결 실패: {e}")
+                    continue
+                self._dispatch({"type": "reconnected", "data": {}})
+                continue
+
+            if isinstance(out, str):
+                try:
+                    self._dispatch(json.loads(out))
+                except ValueError:
+                    logger.warning(f"WebSocket 메시지 파싱 실패: {out[:200]}")
+
+
+comfy = ComfyUIConnection(server_address, server_port, client_id)
+
+
+def queue_prompt(prompt, prompt_id: str | None = None):
+    """
+    prompt 를 ComfyUI 큐에 넣음. POST /prompt 는 자동으로 재시도하지 않음 (같은 prompt 가 두 번 렌더링되지 않도록).
+    prompt_id 를 정해서 보냈으면, 응답을 못 받았을 때 큐 / history 에 들어갔는지 보고
+    들어갔으면 그대로 쓰고, 연결이 응답 전에 끊긴 경우에만 다시 보냄
+    """
+    logger.info(f"Queueing prompt to: http://{server_address}:{server_port}/prompt")
     p = {"prompt": prompt, "client_id": client_id}
-    data = json.dumps(p).encode("utf-8")
-    req = urllib.request.Request(
-        url,
-        data=data,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-    return json.loads(urllib.request.urlopen(req).read())
+    if prompt_id:
+        p["prompt_id"] = prompt_id
+    try:
+        return comfy.request("POST", "/prompt", p, retry=False)
+    except (http.client.HTTPException, ConnectionError, OSError) as e:
+        if not prompt_id:
+            raise
+        if prompt_is_known(prompt_id):
+            logger.warning(f"POST /prompt 응답을 못 받았지만 prompt 는 큐에 들어가 있음: {prompt_id} ({e!r})")
+            return {"prompt_id": prompt_id}
+        if not isinstance(e, STALE_CONNECTION_ERRORS):
+            raise
+        logger.warning(f"POST /prompt 전에 연결이 끊겨 다시 보냄: {prompt_id} ({e!r})")
+        return comfy.request("POST", "/prompt", p, retry=False)
+
+
+def prompt_is_known(prompt_id: str) -> bool:
+    """prompt 가 ComfyUI 큐(실행 중 / 대기)나 history 에 있는지"""
+    queue = comfy.get_json("/queue") or {}
+    for item in (queue.get("queue_running") or []) + (queue.get("queue_pending") or []):
+        if len(item) > 1 and item[1] == prompt_id:
+            return True
+    return prompt_id in (get_history(prompt_id) or {})
 
 
 def get_history(prompt_id):
-    url = f"http://{server_address}:8188/history/{prompt_id}"
-    logger.info(f"Getting history from: {url}")
-    with urllib.request.urlopen(url) as response:
-        return json.loads(response.read())
+    logger.info(f"Getting history: {prompt_id}")
+    return comfy.get_json(f"/history/{prompt_id}")
+
+
+def delete_history(prompt_ids: list[str]):
+    """결과를 다 받은 prompt 의 history 삭제 (실패해도 job 은 계속)"""
+    if not PRUNE_HISTORY or not prompt_ids:
+        return
+    try:
+        comfy.post_json("/history", {"delete": prompt_ids})
+    except Exception as e:
+        logger.warning(f"ComfyUI history 삭제 실패: {e}")
 
 
 def guess_mime_from_path(file_path: str) -> str:
@@ -87,6 +964,86 @@ def to_data_url(b64: str, mime: str) -> str:
     return f"data:{mime};base64,{b64}"
 
 
+def _read_full(f, view) -> int:
+    """view 를 가득 채울 때까지 읽음 (EOF 에서만 짧게 반환)"""
+    total = 0
+    while total < len(view):
+        n = f.readinto(view[total:])
+        if not n:
+            break
+        total += n
+    return total
+
+
+# CPython 의 compact ASCII str 는 헤더(PyASCIIObject) 바로 뒤에 문자 데이터가 있음
+_STR_DATA_OFFSET = sys.getsizeof("") - 1
+
+
+def _new_ascii_str(length: int) -> str | None:
+    """
+    CPython 에서 아직 아무도 보지 않은 길이 length 의 ASCII str 를 만듦 (다른 구현이면 None).
+    호출한 쪽이 _STR_DATA_OFFSET 뒤의 length 바이트를 ASCII 로 모두 채운 뒤에만 내보내야 함
+    """
+    if sys.implementation.name != "cpython":
+        return None
+    new = ctypes.pythonapi.PyUnicode_New
+    new.restype = ctypes.py_object
+    new.argtypes = (ctypes.c_ssize_t, ctypes.c_uint32)
+    return new(length, 127)
+
+
+def _base64_chunks(file_path: str):
+    """파일을 OUTPUT_CHUNK_SIZE 씩 읽어 청크별 base64 bytes 를 돌려줌 (이어 붙이면 전체를 한 번에 인코딩한 것과 같음)"""
+    chunk = bytearray(OUTPUT_CHUNK_SIZE)
+    view = memoryview(chunk)
+    with open(file_path, "rb", buffering=0) as f:
+        while True:
+            n = _read_full(f, view)
+            if not n:
+                break
+            yield base64.b64encode(view[:n])
+            if n < len(view):
+                break
+
+
+def encode_file_to_data_url(file_path: str, mime: str | None = None) -> str:
+    """
+    파일을 고정 크기 청크로 읽어 data URL 로 인코딩.
+    - 결과 크기를 미리 계산해서 결과 str 를 한 번만 할당하고 청크별 base64 를 바로 채움
+      (청크 목록과 이어 붙인 사본을 동시에 들고 있지 않으므로 메모리 사용량이 결과 크기 정도)
+    - CPython 이 아니면 청크별 base64 문자열을 모아 마지막에 한 번 이어 붙임
+    - MAX_INLINE_OUTPUT_BYTES 를 넘는 파일은 인코딩 전에 거부
+    """
+    mime = mime or guess_mime_from_path(file_path)
+
+    size = os.path.getsize(file_path)
+    if MAX_INLINE_OUTPUT_BYTES and size > MAX_INLINE_OUTPUT_BYTES:
+        raise ValueError(
+            f"출력 파일이 인라인 반환 한도를 초과했습니다: {file_path} "
+            f"({size} bytes > {MAX_INLINE_OUTPUT_BYTES} bytes). "
+            "워커에 S3_BUCKET 을 설정하거나 MAX_INLINE_OUTPUT_MB 를 늘리세요."
+        )
+
+    header = f"data:{mime};base64,".encode("ascii")
+    length = len(header) + (size + 2) // 3 * 4
+    result = _new_ascii_str(length)
+    if result is None:
+        return "".join([header.decode("ascii")] + [encoded.decode("ascii") for encoded in _base64_chunks(file_path)])
+
+    address = id(result) + _STR_DATA_OFFSET
+    ctypes.memmove(address, header, len(header))
+    written = len(header)
+    for encoded in _base64_chunks(file_path):
+        # 할당한 크기를 넘어서 쓰지 않도록 (인코딩 중에 파일이 바뀐 경우)
+        if written + len(encoded) > length:
+            raise ValueError(f"인코딩 중 출력 파일 크기가 바뀌었습니다: {file_path}")
+        ctypes.memmove(address + written, encoded, len(encoded))
+        written += len(encoded)
+    if written != length:
+        raise ValueError(f"인코딩 중 출력 파일 크기가 바뀌었습니다: {file_path}")
+    return result
+
+
 def resolve_comfy_file_path(item) -> str | None:
     """
     ComfyUI history outputs의 파일 정보를 실제 경로로 변환.
@@ -116,187 +1073,2663 @@ def normalize_input_image_to_data_url(name: str | None, image_data: str) -> str
     """요청으로 들어온 이미지(base64 or data URL)를 data URL로 정규화"""
     if not isinstance(image_data, str) or not image_data:
         return None
+    if is_input_ref(image_data):
+        # 참조로 받은 입력은 URL 만 그대로 돌려줌 (워커 내부 경로는 반환하지 않음)
+        return image_data if image_data.startswith(("http://", "https://")) else None
     if image_data.startswith("data:"):
         return image_data
     mime = guess_mime_from_path(name or "")
     return to_data_url(image_data, mime)
 
 
-def get_outputs(ws, prompt):
-    prompt_id = queue_prompt(prompt)["prompt_id"]
-    output_videos = {}
-    output_images = {}
-
-    while True:
-        out = ws.recv()
-        if isinstance(out, str):
-            message = json.loads(out)
-            if message.get("type") == "executing":
-                data = message.get("data", {})
-                if data.get("node") is None and data.get("prompt_id") == prompt_id:
-                    break
-        else:
-            continue
+def submit_prompt(prompt, timer) -> tuple[str, PromptWatch]:
+    """prompt 를 큐에 넣고 (prompt_id, 이벤트 구독) 반환. 결과는 wait_outputs 로 받음"""
+    # 취소됐거나 마감 시간이 지난 job 은 GPU 에 새 일을 넣지 않음
+    timer.control.check()
+    # 로컬 디스크에 복사해둔 모델은 사본 이름으로 바꿈 (검증 / 결과 캐시 키는 원래 이름 기준)
+    with timer.phase("model_stage"):
+        prompt, staged = model_stage.apply(prompt)
+    # prompt_id 를 미리 정해서 구독부터 걸어둠 (큐잉 직후 오는 이벤트도 놓치지 않도록)
+    prompt_id = str(uuid.uuid4())
+    watch = comfy.watch(prompt_id)
+    try:
+        with timer.phase("queue_prompt"):
+            queued_id = queue_prompt(prompt, prompt_id)["prompt_id"]
+    except BaseException:
+        comfy.unwatch(prompt_id)
+        model_stage.release(staged)
+        raise
+    if queued_id != prompt_id:
+        # prompt_id 지정을 지원하지 않는 ComfyUI 버전
+        comfy.unwatch(prompt_id)
+        prompt_id = queued_id
+        watch = comfy.watch(prompt_id)
+        if prompt_id in (get_history(prompt_id) or {}):
+            watch.put({"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+    watch.output_nodes = output_node_ids(prompt)
+    watch.staged = staged
+    timer.control.track(prompt_id, watch)
+    return prompt_id, watch
 
-    history = get_history(prompt_id)[prompt_id]
 
-    for node_id in history.get("outputs", {}):
-        node_output = history["outputs"][node_id]
+def get_outputs(prompt, on_message=None, timer=None):
+    """
+    prompt 를 큐에 넣고 끝날 때까지 기다린 뒤 출력 파일 목록 반환.
+    on_message 가 있으면 이 prompt 의 WebSocket 이벤트를 하나씩 넘겨줌.
+    timer(JobTimer) 가 있으면 queue_prompt / execution / history 단계 시간을 기록.
+    """
+    timer = timer or JobTimer()
+    prompt_id, watch = submit_prompt(prompt, timer)
+    return wait_outputs(prompt_id, watch, on_message, timer)
 
-        # ComfyUI 출력 키는 workflow에 따라 다를 수 있어서 images/gifs/videos 모두 처리
-        video_files = []
-        image_files = []
-        if isinstance(node_output, dict):
-            if "gifs" in node_output and isinstance(node_output["gifs"], list):
-                video_files = node_output["gifs"]
-            elif "videos" in node_output and isinstance(node_output["videos"], list):
-                video_files = node_output["videos"]
 
-            if "images" in node_output and isinstance(node_output["images"], list):
-                image_files = node_output["images"]
+def wait_outputs(prompt_id: str, watch: PromptWatch, on_message=None, timer=None) -> dict:
+    """
+    submit_prompt 로 넣은 prompt 가 끝날 때까지 기다린 뒤 출력 파일 목록 반환 (구독은 해제).
+    출력은 노드마다 오는 executed 이벤트로 모으고, 이벤트를 놓쳤을 수 있을 때만 /history 를 조회.
+    끝난 prompt 의 history 는 지움.
+    job 이 취소되거나 마감 시간 (job timeout / COMFY_EXECUTION_TIMEOUT) 을 넘기면
+    ComfyUI 에서 prompt 를 내리고 멈춘 것을 확인한 뒤 JobCancelled 발생
+    """
+    timer = timer or JobTimer()
+    control = timer.control
+    estimate = RemainingEstimate()
+    node_outputs = {}
+    cached_nodes = set()
+    need_history = False
+    # 취소되면 기다리던 get 을 바로 깨움
+    remove_callback = control.on_cancel(lambda: watch.put({"type": "job_cancelled", "data": {"prompt_id": prompt_id}}))
+    try:
+        with timer.phase("execution"):
+            deadline = time.monotonic() + COMFY_EXECUTION_TIMEOUT if COMFY_EXECUTION_TIMEOUT > 0 else None
+            if control.deadline is not None:
+                deadline = control.deadline if deadline is None else min(deadline, control.deadline)
+            while True:
+                reason = control.stop_reason()
+                if reason is None and deadline is not None and time.monotonic() >= deadline:
+                    reason = "deadline"
+                if reason is not None:
+                    info = stop_job_prompts(control, prompt_id, watch, estimate, reason)
+                    raise JobCancelled(f"job {CANCEL_REASONS[reason]}: ComfyUI prompt {prompt_id} 중단", info)
 
-        videos_output = []
-        for item in video_files:
-            fullpath = resolve_comfy_file_path(item)
-            if not fullpath:
-                continue
-            with open(fullpath, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("utf-8")
-            mime = guess_mime_from_path(fullpath)
-            videos_output.append(to_data_url(b64, mime))
-
-        images_output = []
-        for item in image_files:
-            fullpath = resolve_comfy_file_path(item)
-            if not fullpath:
-                continue
-            with open(fullpath, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("utf-8")
-            mime = guess_mime_from_path(fullpath)
-            images_output.append(to_data_url(b64, mime))
+                timeout = COMFY_WS_RECV_TIMEOUT
+                if deadline is not None:
+                    timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+                message = watch.get(timeout=timeout)
+                if message is None or message.get("type") == "job_cancelled":
+                    continue
 
-        output_videos[node_id] = videos_output
-        output_images[node_id] = images_output
+                if on_message is not None:
+                    on_message(message)
+                estimate(message)
 
-    return {"videos": output_videos, "images": output_images}
+                if message.get("type") == "execution_error":
+                    # 실패한 prompt 는 출력이 없으므로 끝날 때까지 기다리지 않음
+                    data = message.get("data", {})
+                    raise Exception(
+                        f"ComfyUI 실행 오류: 노드 {data.get('node_id')} ({data.get('node_type')}): "
+                        f"{data.get('exception_type', '')} {data.get('exception_message', '')}".rstrip()
+                    )
+                if message.get("type") == "execution_interrupted":
+                    raise Exception(f"ComfyUI 실행 중단됨: {prompt_id}")
 
+                if message.get("type") == "executed":
+                    data = message.get("data", {})
+                    if data.get("node") is not None and isinstance(data.get("output"), dict):
+                        node_outputs[str(data["node"])] = data["output"]
+                    continue
+                if message.get("type") == "execution_cached":
+                    cached_nodes.update(str(node) for node in message.get("data", {}).get("nodes") or [])
+                    continue
 
-def wait_for_comfyui():
-    """ComfyUI 서버가 준비될 때까지 대기"""
-    http_url = f"http://{server_address}:8188/"
-    logger.info(f"ComfyUI 서버 대기 중: {http_url}")
+                if message.get("type") == "reconnected":
+                    # 연결이 끊긴 사이에 끝났을 수 있음 (그 사이 executed 이벤트도 놓쳤으므로 history 로 받음)
+                    need_history = True
+                    if prompt_id in (get_history(prompt_id) or {}):
+                        break
+                    continue
 
-    max_attempts = 180
-    for attempt in range(max_attempts):
-        try:
-            urllib.request.urlopen(http_url, timeout=5)
-            logger.info(f"✅ ComfyUI 서버 연결 성공 (시도 {attempt+1})")
-            return True
-        except Exception as e:
-            logger.warning(f"서버 대기 중 (시도 {attempt+1}/{max_attempts}): {e}")
-            if attempt == max_attempts - 1:
-                raise Exception("ComfyUI 서버에 연결할 수 없습니다.")
-            time.sleep(1)
+                if message.get("type") == "executing":
+                    data = message.get("data", {})
+                    if data.get("node") is None:
+                        estimate.finish()
+                        break
+        # 캐시된 출력 노드는 ComfyUI 버전에 따라 executed 를 보내지 않음 -> 출력을 다 받았는지 모르면 history 로 받음
+        output_nodes = watch.output_nodes
+        missing = (cached_nodes if output_nodes is None else output_nodes) - node_outputs.keys()
+        if need_history or missing or not node_outputs:
+            with timer.phase("history"):
+                node_outputs = get_history(prompt_id)[prompt_id].get("outputs", {})
+    finally:
+        remove_callback()
+        control.untrack(prompt_id)
+        comfy.unwatch(prompt_id)
+        model_stage.release(watch.staged)
+        delete_history([prompt_id])
 
+    return collect_output_files(node_outputs)
 
-def handler(job):
-    job_input = job.get("input", {})
-    logger.info(f"Received job input keys: {list(job_input.keys())}")
 
-    # 1) workflow 받기 (필수)
-    workflow = job_input.get("workflow")
-    if not workflow:
-        return {"error": "workflow 필드가 필요합니다."}
+class RemainingEstimate:
+    """
+    실행 중인 prompt 가 끝날 때까지 남은 GPU 시간 추정 (취소로 아낀 시간 계산용).
+    - 지금 샘플러 노드의 남은 step x step 당 시간
+    - 최근에 끝까지 실행된 prompt 의 평균 실행 시간 - 지금까지 실행한 시간
+    둘 중 큰 값. 끝까지 실행된 prompt 의 실행 시간은 평균에 반영
+    """
 
-    if isinstance(workflow, str):
-        try:
-            workflow = json.loads(workflow)
-        except json.JSONDecodeError as e:
-            return {"error": f"workflow JSON 파싱 실패: {e}"}
+    def __init__(self):
+        self.execution_started = None
+        self._node_started = None
+        self._step_remaining = None
 
-    # 2) images 배열 처리 (우리 프로젝트: [{ name, data(base64) }])
-    #    다른 코드 호환: image 키도 지원
-    images = job_input.get("images", [])
-    if isinstance(images, list):
-        for img in images:
-            if not isinstance(img, dict):
-                continue
-            name = img.get("name")
-            image_data = img.get("data") or img.get("image")  # data 우선
+    def __call__(self, message: dict):
+        now = time.monotonic()
+        msg_type = message.get("type")
+        data = message.get("data", {})
+        if msg_type == "execution_start":
+            self.execution_started = now
+        elif msg_type == "executing":
+            self._node_started = now
+            self._step_remaining = None
+        elif msg_type == "progress":
+            value, maximum = data.get("value", 0), data.get("max", 0)
+            if self._node_started is not None and value:
+                self._step_remaining = (now - self._node_started) / value * (maximum - value)
 
-            if not name or not image_data:
-                logger.warning(
-                    f"이미지 정보 누락: name={name}, data={'있음' if img.get('data') else '없음'}, image={'있음' if img.get('image') else '없음'}"
-                )
-                continue
+    def remaining(self) -> float:
+        if self.execution_started is None:
+            return self.typical()
+        typical = self.typical() - (time.monotonic() - self.execution_started)
+        return max(typical, self._step_remaining or 0.0, 0.0)
 
-            save_base64_image(name, image_data)
+    def finish(self):
+        if self.execution_started is not None:
+            seconds = time.monotonic() - self.execution_started
+            with _worker_stats_lock:
+                average = CANCEL_STATS["execution_seconds_avg"]
+                CANCEL_STATS["execution_seconds_avg"] = seconds if average is None else 0.8 * average + 0.2 * seconds
 
-    # 3) ComfyUI 서버 대기
-    wait_for_comfyui()
+    @staticmethod
+    def typical() -> float:
+        """최근 prompt 의 평균 실행 시간 (아직 없으면 0)"""
+        return CANCEL_STATS["execution_seconds_avg"] or 0.0
 
-    # 4) WebSocket 연결
-    ws_url = f"ws://{server_address}:8188/ws?clientId={client_id}"
-    logger.info(f"WebSocket 연결: {ws_url}")
 
-    ws = websocket.WebSocket()
-    max_attempts = 36  # 3분 (5초 간격)
+def stop_job_prompts(control: JobControl, prompt_id: str, watch: PromptWatch, estimate: RemainingEstimate, reason: str) -> dict:
+    """
+    job 이 ComfyUI 에 넣어둔 prompt 를 모두 내림.
+    대기 중인 것을 먼저 /queue 에서 지우고 (interrupt 뒤에 GPU 가 바로 다음 variant 로 넘어가지 않도록),
+    실행 중인 것은 /interrupt 후 ComfyUI 가 멈췄다고 알려줄 때까지 기다림 -> 다음 job 은 깨끗한 상태에서 시작
+    """
+    t0 = time.monotonic()
+    watches = control.tracked()
+    watches.setdefault(prompt_id, watch)
 
-    for attempt in range(max_attempts):
-        try:
-            ws.connect(ws_url)
-            logger.info(f"✅ WebSocket 연결 성공 (시도 {attempt+1})")
-            break
-        except Exception as e:
-            logger.warning(f"WebSocket 연결 실패 (시도 {attempt+1}/{max_attempts}): {e}")
-            if attempt == max_attempts - 1:
-                raise Exception("WebSocket 연결 시간 초과")
-            time.sleep(5)
+    info = {"reason": reason, "removed": [], "interrupted": [], "finished": [], "stopped": True}
+    running = set()
+    try:
+        comfy.post_json("/queue", {"delete": list(watches)})
+        queue_state = comfy.get_json("/queue") or {}
+        running = {item[1] for item in queue_state.get("queue_running", []) if len(item) > 1}
+    except Exception as e:
+        # 큐 상태를 모르면 실행이 시작된 자기 prompt 만 실행 중으로 봄
+        logger.warning(f"ComfyUI 큐 정리 실패: {e}")
+        if estimate.execution_started is not None:
+            running = {prompt_id}
 
-    # 5) 워크플로우 실행
-    outputs = get_outputs(ws, workflow)
-    ws.close()
+    reclaimed = 0.0
+    for pid in watches:
+        if pid in running:
+            reclaimed += estimate.remaining() if pid == prompt_id else RemainingEstimate.typical()
+            try:
+                # prompt_id 를 주면 다른 job 의 prompt 가 그 사이에 시작됐어도 건드리지 않음
+                comfy.post_json("/interrupt", {"prompt_id": pid})
+                info["interrupted"].append(pid)
+            except Exception as e:
+                logger.warning(f"ComfyUI interrupt 실패 ({pid}): {e}")
+                info["stopped"] = False
+        else:
+            try:
+                finished = pid in (get_history(pid) or {})
+            except Exception:
+                finished = False
+            if finished:
+                # 그 사이에 끝남
+                info["finished"].append(pid)
+            else:
+                reclaimed += RemainingEstimate.typical()
+                info["removed"].append(pid)
 
-    # 6) 결과 반환
-    # 우리 프로젝트의 serverless 결과 파싱이 단순해서(output.videoUrl 형태), data URL로 반환
-    video_url = None
-    image_url = None
+    # interrupt 한 prompt 가 실제로 멈출 때까지 대기 (샘플러 step 하나가 끝나야 멈춤)
+    stop_deadline = t0 + CANCEL_STOP_TIMEOUT
+    for pid in info["interrupted"]:
+        stopped = False
+        while time.monotonic() < stop_deadline:
+            message = watches[pid].get(timeout=max(0.0, stop_deadline - time.monotonic()))
+            if message is None:
+                break
+            msg_type = message.get("type")
+            if msg_type in ("execution_interrupted", "execution_error", "execution_success") or (
+                msg_type == "executing" and message.get("data", {}).get("node") is None
+            ):
+                stopped = True
+                break
+        if not stopped:
+            info["stopped"] = False
+            logger.error(f"❗ ComfyUI prompt {pid} 가 {CANCEL_STOP_TIMEOUT:.0f}s 안에 멈추지 않았습니다")
 
-    videos = outputs.get("videos", {}) if isinstance(outputs, dict) else {}
-    images = outputs.get("images", {}) if isinstance(outputs, dict) else {}
+    # 자기 prompt 의 history 는 wait_outputs 가 지움
+    delete_history([pid for pid in watches if pid != prompt_id])
+    info["stop_seconds"] = round(time.monotonic() - t0, 3)
+    info["reclaimed_gpu_seconds"] = round(reclaimed, 1)
+    record_cancel(info)
+    return info
 
-    if isinstance(videos, dict):
-        for _, arr in videos.items():
-            if isinstance(arr, list) and arr:
-                video_url = arr[0]
-                break
 
-    # 1) ComfyUI outputs에서 이미지 1장 우선
-    if isinstance(images, dict):
-        for _, arr in images.items():
-            if isinstance(arr, list) and arr:
-                image_url = arr[0]
-                break
+def output_node_ids(prompt: dict) -> set[str] | None:
+    """prompt 에서 ComfyUI 가 출력 노드 (OUTPUT_NODE) 로 실행할 노드 ID. /object_info 스키마를 아직 모르면 None"""
+    schema = object_info.schema
+    if schema is None:
+        return None
+    return {
+        str(node_id)
+        for node_id, node in prompt.items()
+        if isinstance(node, dict) and schema.get(node.get("class_type"), {}).get("output_node")
+    }
 
-    # 2) 없으면 입력 이미지(첫 장)로 fallback
-    if not image_url and isinstance(job_input.get("images"), list) and job_input["images"]:
-        first = job_input["images"][0]
-        if isinstance(first, dict):
-            image_url = normalize_input_image_to_data_url(
-                first.get("name"),
-                first.get("data") or first.get("image") or "",
-            )
 
-    result = {}
-    if video_url:
-        result["videoUrl"] = video_url
-    if image_url:
-        result["imageUrl"] = image_url
+def collect_output_files(history_outputs) -> dict:
+    """
+    ComfyUI history outputs 에서 파일 경로만 모음 (인코딩은 하지 않음).
+    반환: {"videos": {node_id: [path, ...]}, "images": {node_id: [path, ...]}}
+    """
+    output_videos = {}
+    output_images = {}
 
-    if result:
-        return result
+    if not isinstance(history_outputs, dict):
+        return {"videos": output_videos, "images": output_images}
+
+    for node_id, node_output in history_outputs.items():
+        # ComfyUI 출력 키는 workflow에 따라 다를 수 있어서 images/gifs/videos 모두 처리
+        video_files = []
+        image_files = []
+        if isinstance(node_output, dict):
+            if "gifs" in node_output and isinstance(node_output["gifs"], list):
+                video_files = node_output["gifs"]
+            elif "videos" in node_output and isinstance(node_output["videos"], list):
+                video_files = node_output["videos"]
+
+            if "images" in node_output and isinstance(node_output["images"], list):
+                image_files = node_output["images"]
+
+        videos_output = [p for p in (resolve_comfy_file_path(item) for item in video_files) if p]
+        images_output = [p for p in (resolve_comfy_file_path(item) for item in image_files) if p]
+
+        output_videos[str(node_id)] = videos_output
+        output_images[str(node_id)] = images_output
+
+    return {"videos": output_videos, "images": output_images}
+
+
+# return 셀렉터에서 허용하는 값
+# - video / image: 첫 번째 파일만 videoUrl / imageUrl 로 반환
+# - videos / images: 선택된 노드의 모든 파일을 {node_id: [data URL, ...]} 로 반환
+RETURN_KINDS = ("video", "videos", "image", "images")
+DEFAULT_RETURN = ("video", "image")
+
+
+def parse_output_selector(job_input: dict) -> tuple[list[str] | None, set[str]]:
+    """job input 의 output_nodes / return 값을 검증해서 (노드 목록, 반환 종류) 로 변환"""
+    output_nodes = job_input.get("output_nodes")
+    if output_nodes is not None:
+        if isinstance(output_nodes, (str, int)):
+            output_nodes = [output_nodes]
+        if not isinstance(output_nodes, list) or not output_nodes:
+            raise ValueError("output_nodes 는 노드 ID 목록이어야 합니다.")
+        output_nodes = [str(n) for n in output_nodes]
+
+    kinds = job_input.get("return", DEFAULT_RETURN)
+    if isinstance(kinds, str):
+        kinds = [kinds]
+    if not isinstance(kinds, (list, tuple)) or not kinds:
+        raise ValueError(f"return 은 {RETURN_KINDS} 중 하나 이상이어야 합니다.")
+    unknown = [k for k in kinds if k not in RETURN_KINDS]
+    if unknown:
+        raise ValueError(f"지원하지 않는 return 값: {unknown} (가능: {RETURN_KINDS})")
+
+    return output_nodes, set(kinds)
+
+
+def _select_files(by_node: dict, output_nodes: list[str] | None) -> dict:
+    """output_nodes 가 주어지면 해당 노드만, 주어진 순서대로 남김"""
+    if output_nodes is None:
+        return {node_id: paths for node_id, paths in by_node.items() if paths}
+    return {node_id: by_node[node_id] for node_id in output_nodes if by_node.get(node_id)}
+
+
+def parse_output_mode(job_input: dict) -> str:
+    """job input 의 output_mode 검증 (inline: data URL, s3: 버킷에 올리고 URL 반환)"""
+    mode = job_input.get("output_mode", OUTPUT_MODE)
+    if mode not in ("inline", "s3"):
+        raise ValueError(f"output_mode 는 inline 또는 s3 여야 합니다: {mode!r}")
+    if mode == "s3" and s3_uploader is None:
+        raise ValueError("output_mode=s3 를 쓰려면 워커에 S3_BUCKET 을 설정해야 합니다.")
+    return mode
+
+
+def materialize_outputs(outputs: dict, output_nodes: list[str] | None, kinds: set[str], store=None, workers: int = 1) -> dict:
+    """
+    선택된 출력 파일만 변환해서 결과 dict 구성.
+    store(path) 가 파일 하나를 반환 값(기본: data URL)으로 바꾸며, 같은 파일은 한 번만 변환
+    """
+    store = store or encode_file_to_data_url
+    selected = {key: _select_files(outputs.get(key, {}), output_nodes) for key in ("videos", "images")}
+
+    needed = []
+    for kind, key in (("video", "videos"), ("image", "images")):
+        if key in kinds:
+            needed.extend(p for paths in selected[key].values() for p in paths)
+        elif kind in kinds:
+            first = next(iter(selected[key].values()), None)
+            if first:
+                needed.append(first[0])
+    needed = list(dict.fromkeys(needed))
+
+    if workers > 1 and len(needed) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(needed))) as pool:
+            stored = dict(zip(needed, pool.map(store, needed)))
+    else:
+        stored = {p: store(p) for p in needed}
+
+    result = {}
+    for kind, key in (("video", "videos"), ("image", "images")):
+        if key in kinds:
+            result[key] = {node_id: [stored[p] for p in paths] for node_id, paths in selected[key].items()}
+        if kind in kinds:
+            first = next(iter(selected[key].values()), None)
+            if first:
+                result[f"{kind}Url"] = stored[first[0]]
+
+    return result
+
+
+class S3Uploader:
+    """출력 파일을 S3 호환 버킷에 업로드하고 URL 반환 (큰 파일은 멀티파트로 파트를 병렬 업로드)"""
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+        self.stats = {"files": 0, "bytes": 0, "seconds": 0.0}
+        self._client = None
+        self._lock = threading.Lock()
+        self.transfer_config = None
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                if boto3 is None:
+                    raise RuntimeError("S3 업로드에는 boto3 가 필요합니다 (pip install boto3)")
+                self._client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION)
+                self.transfer_config = TransferConfig(
+                    multipart_threshold=S3_MULTIPART_THRESHOLD,
+                    multipart_chunksize=S3_MULTIPART_CHUNK,
+                    max_concurrency=S3_UPLOAD_CONCURRENCY,
+                    use_threads=True,
+                )
+            return self._client
+
+    def upload(self, path: str, key_prefix: str) -> str:
+        key = f"{S3_PREFIX}{key_prefix}/{os.path.basename(path)}"
+        size = os.path.getsize(path)
+        t0 = time.monotonic()
+        client = self.client
+        client.upload_file(
+            path, self.bucket, key,
+            ExtraArgs={"ContentType": guess_mime_from_path(path)},
+            Config=self.transfer_config,
+        )
+        elapsed = time.monotonic() - t0
+        with self._lock:
+            self.stats["files"] += 1
+            self.stats["bytes"] += size
+            self.stats["seconds"] += elapsed
+        logger.info(f"☁️ S3 업로드 완료: s3://{self.bucket}/{key} ({size / (1024 * 1024):.1f}MB, {elapsed:.2f}s)")
+        return self.url_for(key)
+
+    def url_for(self, key: str) -> str:
+        if S3_PRESIGN_EXPIRES > 0:
+            return self.client.generate_presigned_url(
+                "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=S3_PRESIGN_EXPIRES
+            )
+        quoted = urllib.parse.quote(key)
+        if S3_PUBLIC_URL:
+            return f"{S3_PUBLIC_URL.rstrip('/')}/{quoted}"
+        if S3_ENDPOINT_URL:
+            return f"{S3_ENDPOINT_URL.rstrip('/')}/{self.bucket}/{quoted}"
+        return f"https://{self.bucket}.s3.amazonaws.com/{quoted}"
+
+
+s3_uploader = S3Uploader(S3_BUCKET) if S3_BUCKET else None
+
+
+class OutputJanitor:
+    """
+    ComfyUI 출력/임시 디렉토리를 주기적으로 정리하는 백그라운드 스레드.
+    정리 결과(삭제 파일 수, 확보 용량)는 로그와 stats 로 확인.
+    """
+
+    def __init__(self, roots: list[str]):
+        self.roots = roots
+        self.stats = {"sweeps": 0, "files_removed": 0, "bytes_reclaimed": 0}
+        self._returned: set[str] = set()
+        self._pins: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="output-janitor", daemon=True)
+            self._thread.start()
+
+    def release(self, paths):
+        """반환이 끝난 job 의 출력 파일 등록 (다음 정리 때 삭제)"""
+        if not OUTPUT_DELETE_RETURNED:
+            return
+        with self._lock:
+            self._returned.update(os.path.abspath(p) for p in paths)
+        self._wakeup.set()
+
+    def pin(self, path: str):
+        """아직 쓰는 중인 파일 (캐시 저장 / 인코딩 / 업로드 / 세그먼트 이어붙이기 전) 은 정리 대상에서 제외"""
+        path = os.path.abspath(path)
+        with self._lock:
+            self._pins[path] = self._pins.get(path, 0) + 1
+
+    def unpin(self, path: str):
+        path = os.path.abspath(path)
+        with self._lock:
+            count = self._pins.get(path, 0) - 1
+            if count > 0:
+                self._pins[path] = count
+            else:
+                self._pins.pop(path, None)
+
+    @contextmanager
+    def pinned(self, paths):
+        """with 블록 동안 paths 를 정리 대상에서 제외"""
+        paths = list(paths)
+        for path in paths:
+            self.pin(path)
+        try:
+            yield
+        finally:
+            for path in paths:
+                self.unpin(path)
+
+    def _is_pinned(self, root: str, path: str) -> bool:
+        if path in self._pins:
+            return True
+        rel = os.path.relpath(path, root)
+        name = os.path.basename(path)
+        return any(fnmatch.fnmatch(rel, pat) or fnmatch.fnmatch(name, pat) for pat in OUTPUT_PIN_PATTERNS)
+
+    def _remove(self, path: str, size: int) -> bool:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.warning(f"출력 파일 삭제 실패: {path}: {e}")
+            return False
+        with self._lock:
+            self.stats["files_removed"] += 1
+            self.stats["bytes_reclaimed"] += size
+        return True
+
+    def sweep(self) -> tuple[int, int]:
+        """한 번 정리하고 (삭제 파일 수, 확보 바이트) 반환"""
+        now = time.time()
+        removed = 0
+        freed = 0
+
+        with self._lock:
+            returned = self._returned
+            self._returned = set()
+
+        files = []
+        for root in self.roots:
+            if not os.path.isdir(root):
+                continue
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    path = os.path.abspath(os.path.join(dirpath, filename))
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    with self._lock:
+                        if self._is_pinned(root, path):
+                            if path in returned and path in self._pins:
+                                # 고정이 풀린 뒤 다음 정리 때 삭제
+                                self._returned.add(path)
+                            continue
+                    if path in returned or now - st.st_mtime > OUTPUT_MAX_AGE:
+                        if self._remove(path, st.st_size):
+                            removed += 1
+                            freed += st.st_size
+                        continue
+                    files.append((st.st_mtime, st.st_size, path))
+
+        total = sum(f[1] for f in files)
+        if total > OUTPUT_QUOTA_BYTES:
+            for mtime, size, path in sorted(files):
+                if total <= OUTPUT_QUOTA_BYTES:
+                    break
+                if now - mtime < OUTPUT_GRACE_SECONDS:
+                    continue
+                if self._remove(path, size):
+                    removed += 1
+                    freed += size
+                total -= size
+
+        self._prune_empty_dirs()
+        with self._lock:
+            self.stats["sweeps"] += 1
+            stats = dict(self.stats)
+        if removed:
+            logger.info(
+                f"🧹 출력 정리: {removed}개 삭제, {freed / (1024 * 1024):.1f}MB 확보 "
+                f"(누적 {stats['files_removed']}개, {stats['bytes_reclaimed'] / (1024 * 1024):.1f}MB)"
+            )
+        return removed, freed
+
+    def summary(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+    def _prune_empty_dirs(self):
+        for root in self.roots:
+            if not os.path.isdir(root):
+                continue
+            for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+                if dirpath != root and not dirnames and not filenames:
+                    try:
+                        os.rmdir(dirpath)
+                    except OSError:
+                        pass
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(JANITOR_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning(f"출력 정리 실패: {e}")
+
+
+janitor = OutputJanitor([OUTPUT_DIR, TEMP_DIR])
+
+
+def output_paths(outputs: dict) -> list[str]:
+    """{"videos": {node_id: [path, ...]}, "images": {...}} 의 모든 파일 경로"""
+    return [p for by_node in outputs.values() for paths in by_node.values() for p in paths]
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _canonical_value(value):
+    # 2 와 2.0 처럼 같은 값이 다른 키가 되지 않도록
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, list):
+        return [_canonical_value(v) for v in value]
+    return value
+
+
+class ResultCache:
+    """
+    출력 파일을 결과 키별 디렉토리에 보관하는 LRU 캐시.
+    항목: <root>/<key>/manifest.json + 출력 파일 (같은 파일시스템이면 하드링크, 아니면 복사)
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "bytes_evicted": 0}
+        self._lock = threading.Lock()
+        # 계산 중인 키 -> 완료 이벤트 (같은 job 이 동시에 들어오면 한 번만 실행)
+        self._inflight: dict[str, threading.Event] = {}
+        # 응답에 쓰는 중인 항목 (정리 대상에서 제외)
+        self._in_use: dict[str, int] = {}
+
+    def key_for(self, workflow: dict, input_paths: list[str]) -> str:
+        """워크플로우 + 입력 이미지 내용으로 결과 키 계산 (입력 파일 이름은 내용 해시로 치환)"""
+        input_hashes = {}
+        for path in input_paths:
+            digest = f"sha256:{_file_sha256(path)}"
+            input_hashes[os.path.relpath(path, INPUT_DIR)] = digest
+            input_hashes[os.path.basename(path)] = digest
+
+        nodes = {}
+        for node_id, node in workflow.items():
+            if not isinstance(node, dict):
+                continue
+            inputs = {
+                name: input_hashes.get(value, value) if isinstance(value, str) else _canonical_value(value)
+                for name, value in (node.get("inputs") or {}).items()
+            }
+            # _meta(title) 등 실행 결과에 영향 없는 필드는 제외
+            nodes[str(node_id)] = {"class_type": node.get("class_type"), "inputs": inputs}
+
+        canonical = json.dumps(
+            {"salt": RESULT_CACHE_SALT, "nodes": nodes}, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def acquire(self, key: str, control: JobControl | None = None) -> dict | None:
+        """
+        캐시된 출력({"videos": {...}, "images": {...}}, 캐시 내 경로) 반환. 없으면 None.
+        같은 키를 다른 job 이 계산 중이면 끝날 때까지 기다렸다가 다시 확인.
+        기다리는 동안 control 이 취소되거나 마감 시간이 지나면 JobCancelled.
+        None 을 받은 쪽은 실행 후 store() 또는 abandon() 을 반드시 불러야 함.
+        """
+        waiting = False
+        while True:
+            outputs = self._load(key)
+            with self._lock:
+                if outputs is not None:
+                    self._in_use[key] = self._in_use.get(key, 0) + 1
+                    self.stats["hits"] += 1
+                    return outputs
+                event = self._inflight.get(key)
+                if event is None:
+                    self._inflight[key] = threading.Event()
+                    self.stats["misses"] += 1
+                    return None
+            if not waiting:
+                logger.info(f"⏳ 같은 결과를 계산 중인 job 대기: {key[:16]}")
+                waiting = True
+            if control is not None:
+                control.check()
+            event.wait(RESULT_CACHE_WAIT_INTERVAL)
+
+    def release(self, key: str):
+        """acquire 로 받은 캐시 항목 사용 끝"""
+        with self._lock:
+            count = self._in_use.get(key, 0) - 1
+            if count > 0:
+                self._in_use[key] = count
+            else:
+                self._in_use.pop(key, None)
+
+    def abandon(self, key: str):
+        """실행이 실패해서 저장할 결과가 없음 (기다리던 job 은 직접 실행)"""
+        with self._lock:
+            event = self._inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def _load(self, key: str) -> dict | None:
+        entry = os.path.join(self.root, key)
+        manifest_path = os.path.join(entry, "manifest.json")
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            # LRU 기준 시각 갱신
+            os.utime(manifest_path)
+        except (OSError, ValueError):
+            return None
+        outputs = {
+            kind: {node_id: [os.path.join(entry, name) for name in names] for node_id, names in by_node.items()}
+            for kind, by_node in manifest["outputs"].items()
+        }
+        if not all(os.path.exists(p) for p in output_paths(outputs)):
+            return None
+        return outputs
+
+    def store(self, key: str, outputs: dict):
+        """실행 결과 출력 파일을 캐시에 저장 (실패해도 job 결과에는 영향 없음)"""
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            tmp = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+            os.makedirs(tmp)
+            stored: dict[str, str] = {}
+            manifest = {"created": time.time(), "size": 0, "outputs": {}}
+            for kind, by_node in outputs.items():
+                manifest["outputs"][kind] = {}
+                for node_id, paths in by_node.items():
+                    names = []
+                    for path in paths:
+                        if path not in stored:
+                            name = f"{len(stored)}_{os.path.basename(path)}"
+                            _link_or_copy(path, os.path.join(tmp, name))
+                            manifest["size"] += os.path.getsize(path)
+                            stored[path] = name
+                        names.append(stored[path])
+                    manifest["outputs"][kind][node_id] = names
+            with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            final = os.path.join(self.root, key)
+            if os.path.isdir(final) and self._load(key) is None:
+                # 파일이 빠진 항목은 새 결과로 교체
+                shutil.rmtree(final, ignore_errors=True)
+            try:
+                os.rename(tmp, final)
+            except OSError:
+                # 다른 워커가 먼저 저장함
+                shutil.rmtree(tmp, ignore_errors=True)
+            else:
+                with self._lock:
+                    self.stats["stores"] += 1
+                logger.info(f"💾 결과 캐시 저장: {key[:16]} ({manifest['size'] / (1024 * 1024):.1f}MB)")
+            self.evict()
+        except Exception as e:
+            logger.warning(f"결과 캐시 저장 실패: {e}")
+        finally:
+            self.abandon(key)
+
+    def evict(self):
+        """전체 크기가 max_bytes 를 넘으면 가장 오래 안 쓰인 항목부터 삭제"""
+        entries = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                manifest_path = os.path.join(entry.path, "manifest.json")
+                try:
+                    mtime = os.stat(manifest_path).st_mtime
+                    with open(manifest_path, "r", encoding="utf-8") as f:
+                        size = json.load(f).get("size", 0)
+                except (OSError, ValueError):
+                    # 저장 중이거나 깨진 항목: 오래된 것만 정리
+                    if entry.name.startswith(".tmp-") and time.time() - entry.stat().st_mtime < 3600:
+                        continue
+                    mtime, size = 0.0, 0
+                entries.append((mtime, size, entry.name, entry.path))
+
+        total = sum(e[1] for e in entries)
+        for mtime, size, key, path in sorted(entries):
+            if total <= self.max_bytes and mtime:
+                break
+            with self._lock:
+                if key in self._in_use:
+                    continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            with self._lock:
+                self.stats["evictions"] += 1
+                self.stats["bytes_evicted"] += size
+
+    def hit_rate(self) -> float:
+        with self._lock:
+            hits, misses = self.stats["hits"], self.stats["misses"]
+        return hits / (hits + misses) if hits + misses else 0.0
+
+
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES) if RESULT_CACHE_MAX_BYTES > 0 else None
+
+
+def load_model_paths(path: str) -> list[tuple[str, str]]:
+    """extra_model_paths.yaml 의 (폴더 키, 디렉토리) 목록. 파일이 없거나 읽지 못하면 빈 목록"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        return []
+    except (OSError, yaml.YAMLError) as e:
+        logger.warning(f"{path} 읽기 실패, 모델 로컬 복사 사용 안 함: {e}")
+        return []
+
+    folders = []
+    for section in config.values() if isinstance(config, dict) else []:
+        if not isinstance(section, dict):
+            continue
+        # 상대 경로는 yaml 파일 위치 기준 (ComfyUI 와 같음)
+        base = os.path.join(os.path.dirname(os.path.abspath(path)), os.path.expanduser(str(section.get("base_path") or "")))
+        for key, value in section.items():
+            if key in ("base_path", "is_default") or not isinstance(value, str):
+                continue
+            # 한 키에 여러 경로를 줄 때는 줄바꿈으로 구분
+            for sub in value.splitlines():
+                if sub.strip():
+                    folders.append((key, os.path.normpath(os.path.join(base, sub.strip()))))
+    return folders
+
+
+class ModelStage:
+    """
+    네트워크 볼륨의 모델 파일을 로컬 디스크에 복사해두는 LRU 캐시.
+    항목: <models_dir>/<폴더>/<MODEL_STAGE_SUBDIR>/<이름> + 같은 디렉토리의 .<파일명>.stage.json
+    (원본 경로 / 크기 / mtime / sha256, 이 파일의 mtime 이 마지막 사용 시각)
+    """
+
+    def __init__(self, folders: list[tuple[str, str]], models_dir: str, max_bytes: int):
+        self.folders = [(key, path) for key, path in folders if not MODEL_STAGE_FOLDERS or key in MODEL_STAGE_FOLDERS]
+        self.models_dir = models_dir
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "copies": 0, "bytes_copied": 0, "failures": 0, "evictions": 0, "bytes_evicted": 0}
+        self._lock = threading.Lock()
+        # 이름 -> (폴더 키, 볼륨 경로). 볼륨에 없는 이름은 (None, 확인 시각)
+        self._located: dict[str, tuple] = {}
+        # 복사 중 / 복사 예약된 사본
+        self._pending: set[str] = set()
+        # 큐에 넣은 prompt 가 쓰는 중인 사본 (정리 대상에서 제외)
+        self._in_use: dict[str, int] = {}
+        # 볼륨 읽기가 job 의 모델 로딩과 겹치므로 한 번에 하나씩 복사
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-stage")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and bool(self.folders)
+
+    def _paths(self, key: str, name: str) -> tuple[str, str]:
+        staged = os.path.join(self.models_dir, key, MODEL_STAGE_SUBDIR, name)
+        return staged, os.path.join(os.path.dirname(staged), f".{os.path.basename(staged)}.stage.json")
+
+    def _locate(self, name: str) -> tuple[str, str] | None:
+        """볼륨에서 모델 파일 찾기 (ComfyUI 처럼 이미지 안의 기본 폴더에 있으면 그쪽이 우선이라 복사하지 않음)"""
+        with self._lock:
+            located = self._located.get(name)
+        if located is not None:
+            if located[0] is not None:
+                return located
+            # 새로 올린 파일일 수 있으므로 없던 이름은 가끔 다시 확인
+            if time.monotonic() - located[1] < OBJECT_INFO_REFRESH_INTERVAL:
+                return None
+
+        found = None
+        for key, folder in self.folders:
+            if os.path.isfile(os.path.join(self.models_dir, key, name)):
+                break
+            if os.path.isfile(os.path.join(folder, name)):
+                found = (key, os.path.join(folder, name))
+                break
+        with self._lock:
+            self._located[name] = found or (None, time.monotonic())
+        return found
+
+    def _ready(self, staged: str, meta_path: str, source: str) -> bool:
+        """사본이 있고 원본(크기 / mtime)이 복사한 뒤로 바뀌지 않았는지. 맞으면 마지막 사용 시각 갱신"""
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            st = os.stat(source)
+            if os.path.getsize(staged) != meta["size"] or (st.st_size, st.st_mtime_ns) != (meta["size"], meta["mtime_ns"]):
+                return False
+            os.utime(meta_path)
+        except (OSError, ValueError, KeyError):
+            return False
+        return True
+
+    def apply(self, workflow: dict) -> tuple[dict, list[str]]:
+        """
+        로컬 사본이 준비된 모델 파일명을 사본 이름으로 바꾼 workflow 와 고정한 사본 목록 반환 (release 로 해제).
+        사본이 아직 없는 파일은 백그라운드 복사를 예약하고 원래 이름 그대로 둠 (이번 job 은 볼륨에서 읽음)
+        """
+        if not self.enabled or not isinstance(workflow, dict):
+            return workflow, []
+        replace = {}
+        pinned = []
+        for node_id, node in workflow.items():
+            if not isinstance(node, dict):
+                continue
+            for input_name, value in (node.get("inputs") or {}).items():
+                if not isinstance(value, str) or not value.lower().endswith(MODEL_EXTENSIONS):
+                    continue
+                name = value.replace("\\", "/")
+                if os.path.isabs(name) or ".." in name.split("/") or name.startswith(f"{MODEL_STAGE_SUBDIR}/"):
+                    continue
+                location = self._locate(name)
+                if location is None:
+                    continue
+                key, source = location
+                staged, meta_path = self._paths(key, name)
+                # 확인하는 사이 정리되지 않도록 먼저 고정
+                with self._lock:
+                    self._in_use[staged] = self._in_use.get(staged, 0) + 1
+                if self._ready(staged, meta_path, source):
+                    replace[(node_id, input_name)] = f"{MODEL_STAGE_SUBDIR}/{name}"
+                    pinned.append(staged)
+                    with self._lock:
+                        self.stats["hits"] += 1
+                else:
+                    self.release([staged])
+                    with self._lock:
+                        self.stats["misses"] += 1
+                    self._schedule(key, name, source)
+
+        if replace:
+            workflow = dict(workflow)
+            for (node_id, input_name), value in replace.items():
+                node = workflow[node_id]
+                workflow[node_id] = {**node, "inputs": {**node["inputs"], input_name: value}}
+            logger.info(f"💽 로컬 모델 사본 사용: {sorted(set(replace.values()))}")
+        return workflow, pinned
+
+    def local_copy(self, name: str) -> str | None:
+        """준비된 로컬 사본 경로 (없으면 None, 복사를 예약하지는 않음)"""
+        location = self._locate(name) if self.enabled else None
+        if location is None:
+            return None
+        staged, meta_path = self._paths(location[0], name)
+        return staged if self._ready(staged, meta_path, location[1]) else None
+
+    def release(self, staged_paths: list[str]):
+        """apply 로 고정한 사본 사용 끝"""
+        with self._lock:
+            for staged in staged_paths:
+                count = self._in_use.get(staged, 0) - 1
+                if count > 0:
+                    self._in_use[staged] = count
+                else:
+                    self._in_use.pop(staged, None)
+
+    def _schedule(self, key: str, name: str, source: str):
+        staged, _ = self._paths(key, name)
+        with self._lock:
+            if staged in self._pending:
+                return
+            self._pending.add(staged)
+        self._executor.submit(self._copy, key, name, source)
+
+    def _copy(self, key: str, name: str, source: str):
+        """원본을 임시 파일로 복사 -> 체크섬 확인 -> rename 으로 교체 (다 복사된 사본만 보이도록)"""
+        staged, meta_path = self._paths(key, name)
+        tmp = f"{os.path.join(os.path.dirname(staged), '.' + os.path.basename(staged))}.{uuid.uuid4().hex}.part"
+        try:
+            st = os.stat(source)
+            if not self._make_room(st.st_size):
+                return
+            os.makedirs(os.path.dirname(staged), exist_ok=True)
+            t0 = time.monotonic()
+            digest = hashlib.sha256()
+            with open(source, "rb") as src, open(tmp, "wb") as dst:
+                for chunk in iter(lambda: src.read(MODEL_STAGE_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    dst.write(chunk)
+                dst.flush()
+                os.fsync(dst.fileno())
+            checksum = digest.hexdigest()
+            after = os.stat(source)
+            if (after.st_size, after.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+                raise OSError("복사하는 동안 원본이 바뀜")
+            if _file_sha256(tmp) != checksum:
+                raise OSError("복사한 파일의 체크섬이 원본과 다름")
+
+            meta = {"source": source, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": checksum, "staged_at": time.time()}
+            with open(f"{tmp}.json.part", "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            # 사본 먼저, 메타데이터는 나중에 교체 (메타데이터가 원본과 맞을 때만 준비된 것으로 봄)
+            os.replace(tmp, staged)
+            os.replace(f"{tmp}.json.part", meta_path)
+            seconds = time.monotonic() - t0
+            with self._lock:
+                self.stats["copies"] += 1
+                self.stats["bytes_copied"] += st.st_size
+            logger.info(
+                f"💽 모델 로컬 복사 완료: {key}/{name} ({st.st_size / 1024**3:.2f}GB, {seconds:.1f}s, "
+                f"{st.st_size / (1024 * 1024) / max(seconds, 1e-6):.0f}MB/s)"
+            )
+        except Exception as e:
+            with self._lock:
+                self.stats["failures"] += 1
+            logger.warning(f"모델 로컬 복사 실패 ({key}/{name}): {e}")
+        finally:
+            for path in (tmp, f"{tmp}.json.part"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            with self._lock:
+                self._pending.discard(staged)
+
+    def _entries(self) -> list[tuple[float, int, str, str]]:
+        """(마지막 사용 시각, 크기, 사본, 메타데이터) 목록. 메타데이터가 없는 사본은 시각 0 (가장 먼저 정리)"""
+        entries = []
+        for key in dict.fromkeys(key for key, _ in self.folders):
+            for dirpath, _, filenames in os.walk(os.path.join(self.models_dir, key, MODEL_STAGE_SUBDIR)):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    if filename.startswith("."):
+                        # 메타데이터 / 임시 파일. 복사 중인 파일은 계속 쓰이므로 한 시간 넘게 그대로인 것만 (중간에 죽은 복사) 삭제
+                        if filename.endswith(".part"):
+                            try:
+                                if time.time() - os.path.getmtime(path) > 3600:
+                                    os.remove(path)
+                            except OSError:
+                                pass
+                        continue
+                    meta_path = os.path.join(dirpath, f".{filename}.stage.json")
+                    try:
+                        size = os.path.getsize(path)
+                    except OSError:
+                        continue
+                    try:
+                        used = os.path.getmtime(meta_path)
+                    except OSError:
+                        used = 0.0
+                    entries.append((used, size, path, meta_path))
+        return entries
+
+    def _make_room(self, size: int) -> bool:
+        """size 바이트를 넣을 수 있도록 오래 안 쓰인 사본부터 삭제. 자리를 못 만들면 False (복사 안 함)"""
+        if size > self.max_bytes:
+            logger.info(f"모델 로컬 복사 생략: {size / 1024**3:.2f}GB 는 MODEL_STAGE_MAX_GB 보다 큼")
+            return False
+        entries = self._entries()
+        total = sum(e[1] for e in entries)
+        evicted = 0
+        for used, entry_size, staged, meta_path in sorted(entries):
+            if total + size <= self.max_bytes:
+                break
+            with self._lock:
+                if staged in self._in_use:
+                    continue
+            for path in (meta_path, staged):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= entry_size
+            evicted += entry_size
+            with self._lock:
+                self.stats["evictions"] += 1
+                self.stats["bytes_evicted"] += entry_size
+        if evicted:
+            logger.info(f"🧹 모델 로컬 사본 정리: {evicted / 1024**3:.2f}GB 확보")
+        if total + size > self.max_bytes:
+            logger.info(f"모델 로컬 복사 생략: 사용 중인 사본을 빼면 {size / 1024**3:.2f}GB 를 넣을 자리가 없음")
+            return False
+        os.makedirs(self.models_dir, exist_ok=True)
+        free = shutil.disk_usage(self.models_dir).free
+        if free - size < MODEL_STAGE_MIN_FREE_BYTES:
+            logger.info(f"모델 로컬 복사 생략: 디스크 여유 공간 부족 ({free / 1024**3:.1f}GB)")
+            return False
+        return True
+
+    def summary(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+
+MODEL_PATHS = load_model_paths(MODEL_PATHS_FILE)
+model_stage = ModelStage(MODEL_PATHS, COMFY_MODELS_DIR, MODEL_STAGE_MAX_BYTES)
+
+
+def find_model_file(name: str) -> str | None:
+    """ComfyUI 가 읽게 될 모델 파일 경로: 준비된 로컬 사본 -> 이미지의 기본 모델 폴더 -> extra_model_paths.yaml 폴더"""
+    staged = model_stage.local_copy(name)
+    if staged is not None:
+        return staged
+    try:
+        with os.scandir(COMFY_MODELS_DIR) as it:
+            local_dirs = sorted(entry.path for entry in it if entry.is_dir())
+    except OSError:
+        local_dirs = []
+    for folder in local_dirs + [path for _, path in MODEL_PATHS]:
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+# 템플릿 파라미터 -> 노드 입력 위치 [(node_id, class_type, input 이름)]
+# 템플릿에 해당 노드가 없으면 그 템플릿에서는 지원하지 않는 파라미터가 됨
+TEMPLATE_PARAM_SPEC = {
+    "prompt": [("135", "WanVideoTextEncode", "positive_prompt")],
+    "negative_prompt": [("135", "WanVideoTextEncode", "negative_prompt")],
+    "width": [("235", "INTConstant", "value")],
+    "height": [("236", "INTConstant", "value")],
+    "length": [("541", "WanVideoImageToVideoEncode", "num_frames")],
+    "steps": [("569", "INTConstant", "value")],
+    # high-noise 모델(220)이 끝나고 low-noise 모델(540)이 시작하는 스텝
+    "split_step": [("575", "INTConstant", "value")],
+    "cfg": [
+        ("570", "CreateCFGScheduleFloatList", "cfg_scale_start"),
+        ("570", "CreateCFGScheduleFloatList", "cfg_scale_end"),
+    ],
+    "seed": [("220", "WanVideoSampler", "seed"), ("540", "WanVideoSampler", "seed")],
+    "context_overlap": [("498", "WanVideoContextOptions", "context_overlap")],
+    "image": [("244", "LoadImage", "image")],
+    "end_image": [("617", "LoadImage", "image")],
+}
+TEMPLATE_PARAM_TYPES = {
+    "prompt": str,
+    "negative_prompt": str,
+    "width": int,
+    "height": int,
+    "length": int,
+    "steps": int,
+    "split_step": int,
+    "cfg": float,
+    "seed": int,
+    "context_overlap": int,
+    "image": str,
+    "end_image": str,
+}
+# lora_pairs: high -> 279, low -> 553. 0번 슬롯은 템플릿 기본 LoRA 라서 1번부터 채움
+TEMPLATE_LORA_NODES = {"high": ("279", "WanVideoLoraSelectMulti"), "low": ("553", "WanVideoLoraSelectMulti")}
+TEMPLATE_LORA_SLOTS = (1, 2, 3, 4)
+# 템플릿 job 에서 받는 이미지 키 (base64 / URL / 경로) -> 템플릿 파라미터
+TEMPLATE_IMAGE_KEYS = {
+    "image_base64": "image",
+    "image_url": "image",
+    "image_path": "image",
+    "end_image_base64": "end_image",
+    "end_image_url": "end_image",
+    "end_image_path": "end_image",
+}
+
+
+class WorkflowTemplate:
+    """로드된 워크플로우와 파라미터 -> (node_id, input) 패치 맵"""
+
+    def __init__(self, name: str, workflow: dict):
+        self.name = name
+        self.workflow = workflow
+        self.patch_map: dict[str, list[tuple[str, str]]] = {}
+        self.lora_nodes: dict[str, str] = {}
+
+        for param, targets in TEMPLATE_PARAM_SPEC.items():
+            compiled = [
+                (node_id, input_name)
+                for node_id, class_type, input_name in targets
+                if workflow.get(node_id, {}).get("class_type") == class_type
+                and input_name in workflow[node_id].get("inputs", {})
+            ]
+            if compiled:
+                self.patch_map[param] = compiled
+
+        for side, (node_id, class_type) in TEMPLATE_LORA_NODES.items():
+            if workflow.get(node_id, {}).get("class_type") == class_type:
+                self.lora_nodes[side] = node_id
+
+    def apply(self, params: dict) -> dict:
+        """
+        파라미터를 적용한 워크플로우 반환.
+        원본은 건드리지 않고, 바뀌는 노드만 복사함 (copy-on-write)
+        """
+        params = self._with_split_step(params)
+        wf = dict(self.workflow)
+        copied = set()
+
+        def set_input(node_id: str, input_name: str, value):
+            if node_id not in copied:
+                node = wf[node_id]
+                wf[node_id] = {**node, "inputs": dict(node["inputs"])}
+                copied.add(node_id)
+            wf[node_id]["inputs"][input_name] = value
+
+        for param, value in params.items():
+            if value is None or param == "lora_pairs":
+                continue
+            if param not in self.patch_map:
+                raise ValueError(f"템플릿 '{self.name}' 에서 지원하지 않는 파라미터: {param}")
+            try:
+                value = TEMPLATE_PARAM_TYPES[param](value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{param} 값이 올바르지 않습니다: {value!r}")
+            for node_id, input_name in self.patch_map[param]:
+                set_input(node_id, input_name, value)
+
+        lora_pairs = params.get("lora_pairs") or []
+        if not isinstance(lora_pairs, list):
+            raise ValueError("lora_pairs 는 배열이어야 합니다.")
+        if len(lora_pairs) > len(TEMPLATE_LORA_SLOTS):
+            raise ValueError(f"lora_pairs 는 최대 {len(TEMPLATE_LORA_SLOTS)}개까지 지원합니다.")
+        for slot, pair in zip(TEMPLATE_LORA_SLOTS, lora_pairs):
+            if not isinstance(pair, dict):
+                raise ValueError(f"lora_pairs 항목이 올바르지 않습니다: {pair!r}")
+            for side, node_id in self.lora_nodes.items():
+                lora_name = pair.get(side)
+                if not lora_name:
+                    continue
+                set_input(node_id, f"lora_{slot}", str(lora_name))
+                set_input(node_id, f"strength_{slot}", float(pair.get(f"{side}_weight", 1.0)))
+
+        return wf
+
+    def _with_split_step(self, params: dict) -> dict:
+        """
+        steps 만 바꾸면 high/low 경계(split_step)도 템플릿 기본값과 같은 비율로 옮김.
+        경계는 1 이상 steps 미만이어야 함 (두 모델 모두 한 스텝 이상 실행)
+        """
+        if "steps" not in self.patch_map or "split_step" not in self.patch_map:
+            return params
+        steps, split = params.get("steps"), params.get("split_step")
+        if steps is None and split is None:
+            return params
+        default_steps, default_split = (
+            self.workflow[node_id]["inputs"][input_name]
+            for node_id, input_name in (self.patch_map["steps"][0], self.patch_map["split_step"][0])
+        )
+        try:
+            steps = int(steps if steps is not None else default_steps)
+            if split is None:
+                split = min(max(round(steps * default_split / default_steps), 1), steps - 1)
+            split = int(split)
+        except (TypeError, ValueError, ZeroDivisionError):
+            raise ValueError(f"steps / split_step 값이 올바르지 않습니다: {params.get('steps')!r} / {params.get('split_step')!r}")
+        if not 0 < split < steps:
+            raise ValueError(f"split_step 은 1 이상 steps({steps}) 미만이어야 합니다: {split} (steps 는 2 이상)")
+        return {**params, "split_step": split}
+
+
+def load_templates() -> dict[str, WorkflowTemplate]:
+    templates = {}
+    for name, filename in TEMPLATE_FILES.items():
+        path = os.path.join(TEMPLATE_DIR, filename)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                templates[name] = WorkflowTemplate(name, json.load(f))
+            logger.info(f"✅ 템플릿 로드: {name} ({path}), 파라미터 {sorted(templates[name].patch_map)}")
+        except FileNotFoundError:
+            logger.warning(f"템플릿 파일 없음: {path}")
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"❌ 템플릿 로드 실패: {path}: {e}")
+    return templates
+
+
+TEMPLATES = load_templates()
+
+
+def apply_node_overrides(workflow: dict, overrides: dict) -> dict:
+    """{node_id: {input: value}} 덮어쓰기를 적용한 워크플로우 반환 (바뀌는 노드만 복사)"""
+    if not isinstance(overrides, dict):
+        raise ValueError(f"variant 는 객체여야 합니다: {overrides!r}")
+    wf = dict(workflow)
+    for node_id, inputs in overrides.items():
+        node = wf.get(str(node_id))
+        if not isinstance(node, dict):
+            raise ValueError(f"variant 의 노드 {node_id} 가 workflow 에 없습니다.")
+        if not isinstance(inputs, dict):
+            raise ValueError(f"variant 의 노드 {node_id} 값은 {{입력 이름: 값}} 객체여야 합니다.")
+        wf[str(node_id)] = {**node, "inputs": {**node.get("inputs", {}), **inputs}}
+    return wf
+
+
+def resolve_template_job(job_input: dict) -> tuple[WorkflowTemplate, dict]:
+    """
+    workflow 없이 온 job 의 템플릿과 파라미터 결정.
+    - template: 템플릿 이름 (없으면 end_image_* 유무로 flf2v / i2v 선택)
+    - 파라미터는 input 최상위 키(클라이언트 호환)와 params dict 를 합쳐서 사용 (params 우선)
+    """
+    has_end_image = any(job_input.get(k) for k, param in TEMPLATE_IMAGE_KEYS.items() if param == "end_image")
+    name = job_input.get("template") or ("flf2v" if has_end_image else "i2v")
+    template = TEMPLATES.get(name)
+    if template is None:
+        raise ValueError(f"알 수 없는 템플릿: {name} (가능: {sorted(TEMPLATES)})")
+
+    params = {k: job_input[k] for k in (*TEMPLATE_PARAM_TYPES, "lora_pairs") if k in job_input}
+    extra = job_input.get("params") or {}
+    if not isinstance(extra, dict):
+        raise ValueError("params 는 객체여야 합니다.")
+    params.update(extra)
+    return template, params
+
+
+# Wan 계열 노드의 프레임 수 입력은 4n+1 이어야 함 (VAE 가 시간 축을 4배 압축)
+FRAME_COUNT_INPUTS = ("num_frames", "length")
+
+
+class ObjectInfoCache:
+    """ComfyUI /object_info (노드 스키마) 캐시"""
+
+    def __init__(self):
+        self.schema: dict | None = None
+        self.fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> dict | None:
+        if self.schema is None:
+            self.refresh(force=self.fetched_at == 0.0)
+        return self.schema
+
+    def refresh(self, force: bool = False) -> bool:
+        """다시 받았으면 True (force 가 아니면 OBJECT_INFO_REFRESH_INTERVAL 안에는 다시 받지 않음)"""
+        with self._lock:
+            if not force and time.monotonic() - self.fetched_at < OBJECT_INFO_REFRESH_INTERVAL:
+                return False
+            self.fetched_at = time.monotonic()
+            try:
+                schema = comfy.get_json("/object_info")
+            except Exception as e:
+                logger.warning(f"/object_info 조회 실패, 워크플로우 검증 생략: {e}")
+                return False
+            self.schema = schema
+            logger.info(f"📋 /object_info 로드: 노드 클래스 {len(schema)}개 ({time.monotonic() - self.fetched_at:.2f}s)")
+            return True
+
+
+object_info = ObjectInfoCache()
+
+
+def _input_options(spec) -> list | None:
+    """입력 정의가 선택지(COMBO)면 선택지 목록, 아니면 None"""
+    if not isinstance(spec, (list, tuple)) or not spec:
+        return None
+    if isinstance(spec[0], list):
+        return spec[0]
+    if spec[0] == "COMBO" and len(spec) > 1 and isinstance(spec[1], dict):
+        return spec[1].get("options")
+    return None
+
+
+def _types_compatible(output_type, input_type) -> bool:
+    if not isinstance(output_type, str) or not isinstance(input_type, str):
+        return True
+    if output_type == "*" or input_type == "*":
+        return True
+    return bool(set(output_type.split(",")) & set(input_type.split(",")))
+
+
+def validate_workflow(workflow: dict, schema: dict, known_files=frozenset()) -> list[str]:
+    """
+    큐잉 전 워크플로우 검증. 문제 목록 반환 (비어 있으면 통과)
+    - 노드 클래스 설치 여부, 필수 입력, 링크 대상 노드 / 출력 슬롯 / 타입
+    - 선택지 값 (LoRA / 모델 파일명 등, extra_model_paths.yaml 경로 포함), 숫자 min / max, 프레임 수 4n+1
+    - known_files: 이 job 이 저장한 입력 이미지 이름 (캐시된 스키마의 이미지 목록에는 아직 없음)
+    """
+    if not isinstance(workflow, dict) or not workflow:
+        return ["workflow 가 비어 있거나 객체가 아닙니다."]
+
+    errors = []
+    for node_id, node in workflow.items():
+        if not isinstance(node, dict) or "class_type" not in node:
+            errors.append(f"노드 {node_id}: class_type 이 없습니다.")
+            continue
+        class_type = node["class_type"]
+        info = schema.get(class_type)
+        if info is None:
+            errors.append(f"노드 {node_id}: 설치되지 않은 노드 클래스 {class_type}")
+            continue
+        where = f"노드 {node_id} ({class_type})"
+
+        inputs = node.get("inputs") or {}
+        required = (info.get("input") or {}).get("required") or {}
+        optional = (info.get("input") or {}).get("optional") or {}
+        for name in required:
+            if name not in inputs:
+                errors.append(f"{where}: 필수 입력 {name} 없음")
+
+        for name, value in inputs.items():
+            spec = required.get(name) or optional.get(name)
+            if isinstance(value, list):
+                # 링크: [원본 노드 ID, 출력 슬롯]
+                if len(value) != 2:
+                    errors.append(f"{where}: 입력 {name} 의 링크 형식이 잘못됨: {value!r}")
+                    continue
+                source = workflow.get(str(value[0]))
+                if not isinstance(source, dict):
+                    errors.append(f"{where}: 입력 {name} 이(가) 없는 노드 {value[0]} 에 연결됨")
+                    continue
+                source_info = schema.get(source.get("class_type"))
+                if source_info is None:
+                    continue
+                outputs = source_info.get("output") or []
+                slot = value[1]
+                if not isinstance(slot, int) or not 0 <= slot < len(outputs):
+                    errors.append(f"{where}: 입력 {name} 이(가) 노드 {value[0]} 의 없는 출력 {slot} 에 연결됨")
+                elif spec and not _types_compatible(outputs[slot], spec[0]):
+                    errors.append(f"{where}: 입력 {name} 은(는) {spec[0]} 인데 노드 {value[0]} 의 출력은 {outputs[slot]}")
+                continue
+
+            if not spec:
+                continue
+            options = _input_options(spec)
+            if options is not None:
+                if value not in options and value not in known_files:
+                    errors.append(f"{where}: {name} 값 {value!r} 이(가) 사용 가능한 목록에 없습니다")
+                continue
+            limits = spec[1] if len(spec) > 1 and isinstance(spec[1], dict) else {}
+            if spec[0] in ("INT", "FLOAT") and isinstance(value, (int, float)) and not isinstance(value, bool):
+                if limits.get("min") is not None and value < limits["min"]:
+                    errors.append(f"{where}: {name}={value} 이(가) 최솟값 {limits['min']} 보다 작음")
+                if limits.get("max") is not None and value > limits["max"]:
+                    errors.append(f"{where}: {name}={value} 이(가) 최댓값 {limits['max']} 보다 큼")
+
+        if class_type.startswith("Wan"):
+            for name in FRAME_COUNT_INPUTS:
+                value = inputs.get(name)
+                if isinstance(value, int) and not isinstance(value, bool) and (value - 1) % 4:
+                    errors.append(f"{where}: {name}={value} 은(는) 4n+1 이어야 합니다 (예: {max(1, (value - 1) // 4 * 4 + 1)})")
+
+    return errors
+
+
+def preflight(workflow: dict, known_files=frozenset()) -> list[str]:
+    """캐시된 스키마로 검증. 실패하면 스키마를 한 번 새로 받아 다시 확인 (새로 올린 LoRA / 모델 / 노드일 수 있음)"""
+    schema = object_info.get()
+    if schema is None:
+        return []
+    errors = validate_workflow(workflow, schema, known_files)
+    if errors and object_info.refresh():
+        errors = validate_workflow(workflow, object_info.schema, known_files)
+    return errors
+
+
+TRACE_ID_PATTERN = re.compile(r"^[0-9A-Za-z_-]{1,64}$")
+_trace_file_lock = threading.Lock()
+
+
+class JobTrace:
+    """
+    job 하나의 span 목록 (worker.job 아래에 handler 단계 / ComfyUI 대기와 노드 실행).
+    시간은 monotonic 으로 재고 내보낼 때 Unix 시각으로 바꿈 (클라이언트 span 과 같은 축)
+    """
+
+    def __init__(self, trace_id: str | None = None, parent_span_id: str | None = None, job_id: str | None = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.parent_span_id = parent_span_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.job_id = job_id
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        self.spans: list[dict] = []
+        self._lock = threading.Lock()
+
+    def _wall(self, t: float) -> float:
+        return round(self.started_at + (t - self.started), 6)
+
+    def _span(self, name: str, start: float, end: float, parent: str | None, span_id: str, attributes: dict) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": span_id,
+            "parent_span_id": parent,
+            "name": name,
+            "service": "worker",
+            "start": self._wall(start),
+            "end": self._wall(end),
+            "duration": round(end - start, 6),
+            "attributes": attributes,
+        }
+
+    def add(self, name: str, start: float, end: float, **attributes):
+        """monotonic 구간 하나를 worker.job 아래 span 으로 기록"""
+        span = self._span(name, start, end, self.span_id, uuid.uuid4().hex[:16], attributes)
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self, **attributes) -> list[dict]:
+        """worker.job span 을 닫고 시작 시각 순 span 목록 반환 (TRACE_FILE 이 있으면 파일에도 기록)"""
+        root = self._span("worker.job", self.started, time.monotonic(), self.parent_span_id, self.span_id, {"job_id": self.job_id, **attributes})
+        with self._lock:
+            spans = [root] + sorted(self.spans, key=lambda span: span["start"])
+        if TRACE_FILE:
+            try:
+                with _trace_file_lock, open(TRACE_FILE, "a", encoding="utf-8") as f:
+                    for span in spans:
+                        f.write(json.dumps(span, ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.warning(f"trace 기록 실패 ({TRACE_FILE}): {e}")
+        return spans
+
+
+class JobTimer:
+    """job 처리 단계별 소요 시간 기록 (같은 단계를 여러 번 지나면 합산)"""
+
+    def __init__(self, control: JobControl | None = None, trace: JobTrace | None = None, **attributes):
+        self.started = time.monotonic()
+        self.phases: dict[str, float] = {}
+        # 워커 상태 (cold start 여부, warm-up 시간). warm-up job 은 None
+        self.worker: dict | None = None
+        # 마감 시간 / 취소 상태 (variant 별 timer 는 job 의 것을 공유)
+        self.control = control or JobControl()
+        # 단계마다 span 도 남김 (attributes 는 span 에 붙는 값, 예: variant 번호)
+        self.trace = trace
+        self.attributes = attributes
+
+    def child(self, **attributes) -> "JobTimer":
+        """같은 마감 시간 / 취소 상태 / trace 를 쓰는 timer (variant 별 단계 시간용)"""
+        return JobTimer(self.control, self.trace, **{**self.attributes, **attributes})
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            t1 = time.monotonic()
+            self.phases[name] = self.phases.get(name, 0.0) + t1 - t0
+            if self.trace is not None:
+                self.trace.add(f"handler.{name}", t0, t1, **self.attributes)
+
+    def summary(self) -> dict:
+        return {
+            "total": round(time.monotonic() - self.started, 3),
+            "phases": {name: round(sec, 3) for name, sec in self.phases.items()},
+        }
+
+
+class ExecutionProfiler:
+    """
+    prompt 의 WebSocket 이벤트로 노드별 실행 시간 측정.
+    - execution_start 까지: queue_wait (앞선 prompt 가 GPU 를 쓰는 시간 포함)
+    - executing 노드 전환 사이 간격: 해당 노드 실행 시간
+    - execution_cached 로 온 노드: cached (실행 안 함)
+    timer 에 trace 가 있으면 ComfyUI 대기 / 노드 실행을 span 으로도 남김
+    """
+
+    def __init__(self, workflow: dict, timer: JobTimer | None = None):
+        self.workflow = workflow
+        self.timer = timer
+        self.created = time.monotonic()
+        self.execution_started = None
+        self.finished = None
+        self.cached: list[str] = []
+        self.nodes: list[dict] = []
+        self._node = None
+        self._node_started = None
+
+    def _span(self, name: str, start: float, end: float, **attributes):
+        if self.timer is not None and self.timer.trace is not None:
+            self.timer.trace.add(name, start, end, **self.timer.attributes, **attributes)
+
+    def _start_execution(self, now: float):
+        self.execution_started = now
+        self._span("comfyui.queue_wait", self.created, now)
+
+    def _close_node(self, now: float):
+        if self._node is not None:
+            node = self.workflow.get(self._node, {})
+            self.nodes.append(
+                {
+                    "node": self._node,
+                    "class_type": node.get("class_type"),
+                    "title": node.get("_meta", {}).get("title"),
+                    "seconds": round(now - self._node_started, 3),
+                }
+            )
+            self._span(f"comfyui.{node.get('class_type')}", self._node_started, now, node=self._node)
+        self._node = None
+
+    def __call__(self, message: dict):
+        now = time.monotonic()
+        msg_type = message.get("type")
+        data = message.get("data", {})
+
+        if msg_type == "execution_start":
+            self._start_execution(now)
+        elif msg_type == "execution_cached":
+            self.cached.extend(data.get("nodes") or [])
+        elif msg_type == "executing":
+            if self.execution_started is None:
+                self._start_execution(now)
+            self._close_node(now)
+            node = data.get("node")
+            if node is None:
+                self.finished = now
+            else:
+                self._node = node
+                self._node_started = now
+
+    def summary(self) -> dict:
+        started = self.execution_started
+        return {
+            "queue_wait": round(started - self.created, 3) if started else None,
+            "execution": round(self.finished - started, 3) if started and self.finished else None,
+            "nodes": self.nodes,
+            "cached": self.cached,
+        }
+
+
+class ProgressReporter:
+    """
+    prompt 의 WebSocket 이벤트를 progress 레코드로 바꿔서 emit 으로 넘김.
+    레코드: {"type": "progress", "node", "stage", "step", "max", "eta_seconds", "nodes_done", "nodes_total", "elapsed"}
+    """
+
+    def __init__(self, workflow: dict, emit):
+        self.emit = emit
+        self.nodes_total = len(workflow)
+        self.nodes_done = 0
+        self.started = time.monotonic()
+        self._last_sent = 0.0
+        self._node = None
+        self._node_started = None
+        self._stages = self._stage_names(workflow)
+
+    @staticmethod
+    def _stage_names(workflow: dict) -> dict[str, str]:
+        """노드 이름: _meta.title 이 있으면 title, 같은 클래스가 여러 개면 (1/2) 처럼 순서를 붙임"""
+        by_class: dict[str, list[str]] = {}
+        for node_id, node in workflow.items():
+            by_class.setdefault(node.get("class_type", ""), []).append(node_id)
+
+        names = {}
+        for class_type, node_ids in by_class.items():
+            for i, node_id in enumerate(sorted(node_ids, key=lambda n: (len(n), n))):
+                title = workflow[node_id].get("_meta", {}).get("title") or class_type
+                names[node_id] = f"{title} ({i + 1}/{len(node_ids)})" if len(node_ids) > 1 else title
+        return names
+
+    def _send(self, record: dict, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_sent < PROGRESS_MIN_INTERVAL:
+            return
+        self._last_sent = now
+        record.update(
+            {
+                "type": "progress",
+                "nodes_done": self.nodes_done,
+                "nodes_total": self.nodes_total,
+                "elapsed": round(now - self.started, 2),
+            }
+        )
+        self.emit(record)
+
+    def __call__(self, message: dict):
+        msg_type = message.get("type")
+        data = message.get("data", {})
+
+        if msg_type == "execution_cached":
+            self.nodes_done += len(data.get("nodes") or [])
+        elif msg_type == "executing":
+            node = data.get("node")
+            if self._node is not None:
+                self.nodes_done += 1
+            self._node = node
+            self._node_started = time.monotonic()
+            if node is not None:
+                self._send({"node": node, "stage": self._stages.get(node, node)})
+        elif msg_type == "progress":
+            node = data.get("node") or self._node
+            value, maximum = data.get("value", 0), data.get("max", 0)
+            eta = None
+            if self._node_started is not None and value:
+                per_step = (time.monotonic() - self._node_started) / value
+                eta = round(per_step * (maximum - value), 1)
+            self._send(
+                {
+                    "node": node,
+                    "stage": self._stages.get(node, node),
+                    "step": value,
+                    "max": maximum,
+                    "eta_seconds": eta,
+                },
+                force=value == maximum,
+            )
+
+
+def wait_for_comfyui():
+    """ComfyUI 서버가 준비될 때까지 대기 (연결이 유지되고 있으면 바로 반환)"""
+    return comfy.wait_ready()
+
+
+def run_job(job, emit=None, control=None):
+    """
+    job 하나를 처리하고 결과 dict 반환.
+    emit 이 있으면 진행 상황 레코드를 실행 중에 넘겨줌 (streaming handler 용).
+    control(JobControl) 로 실행 중인 job 을 취소할 수 있음 (handler 가 RunPod 취소를 받으면 cancel).
+    input 에 trace_id 가 있으면 span 목록을 결과의 trace 로 반환 (TRACE_FILE 이 있으면 파일에도 기록)
+    """
+    job_input = job.get("input", {})
+    trace_id, parent_span_id = job_input.get("trace_id"), job_input.get("parent_span_id")
+    for value in (trace_id, parent_span_id):
+        if value is not None and not (isinstance(value, str) and TRACE_ID_PATTERN.match(value)):
+            return {"error": f"trace_id / parent_span_id 는 64자 이하의 영문, 숫자, -, _ 여야 합니다: {value!r}"}
+    trace = JobTrace(trace_id, parent_span_id, job.get("id")) if trace_id or TRACE_FILE else None
+
+    try:
+        result = process_job(job, emit, JobTimer(control, trace))
+    except BaseException as e:
+        if trace is not None:
+            trace.finish(error=str(e) or type(e).__name__)
+        raise
+    if trace is not None:
+        spans = trace.finish(error=result.get("error"))
+        if trace_id:
+            result["trace"] = {"trace_id": trace.trace_id, "spans": spans}
+    return result
+
+
+def process_job(job, emit, timer: JobTimer):
+    """run_job 의 실제 처리 (workflow 구성 -> 입력 저장 -> 검증 -> 실행 -> 결과)"""
+    job_input = job.get("input", {})
+    logger.info(f"Received job input keys: {list(job_input.keys())}")
+    if job.get("id") != WARMUP_JOB_ID:
+        timer.worker = count_worker_job()
+
+    # 마감 시간: input 의 timeout (초) 또는 JOB_TIMEOUT. 넘기면 ComfyUI 실행을 중단하고 실패 처리
+    job_timeout = job_input.get("timeout", JOB_TIMEOUT)
+    try:
+        job_timeout = float(job_timeout or 0)
+    except (TypeError, ValueError):
+        return {"error": f"timeout 은 초 단위 숫자여야 합니다: {job_timeout!r}"}
+    if job_timeout < 0:
+        return {"error": f"timeout 은 0 이상이어야 합니다: {job_timeout}"}
+    if job_timeout > 0:
+        timer.control.deadline = timer.started + job_timeout
+
+    # 1) workflow 받기
+    #    workflow 가 없으면 서버 측 템플릿 + 파라미터로 구성 (클라이언트의 평면 파라미터 형식)
+    workflow = job_input.get("workflow")
+    template = None
+    if workflow:
+        if isinstance(workflow, str):
+            try:
+                workflow = json.loads(workflow)
+            except json.JSONDecodeError as e:
+                return {"error": f"workflow JSON 파싱 실패: {e}"}
+    else:
+        try:
+            template, params = resolve_template_job(job_input)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    # 반환할 출력 선택 (output_nodes / return) 과 반환 방식 (output_mode)
+    try:
+        output_nodes, return_kinds = parse_output_selector(job_input)
+        output_mode = parse_output_mode(job_input)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    # variants: 같은 입력으로 파라미터만 바꾼 워크플로우 여러 개를 한 job 으로 실행
+    #   템플릿 job 은 템플릿 파라미터 덮어쓰기 ({"seed": 1}), workflow job 은 노드 입력 덮어쓰기 ({"220": {"seed": 1}})
+    variants = job_input.get("variants")
+    if variants is not None:
+        if not isinstance(variants, list) or not variants:
+            return {"error": "variants 는 비어 있지 않은 배열이어야 합니다."}
+        if len(variants) > MAX_VARIANTS:
+            return {"error": f"variants 는 최대 {MAX_VARIANTS}개까지 지원합니다."}
+
+    # segment_length: length 가 이보다 길면 세그먼트로 나눠 이어서 생성 (템플릿 job 만)
+    segment_lengths = None
+    if job_input.get("segment_length") is not None:
+        if template is None:
+            return {"error": "segment_length 는 템플릿 job 에서만 지원합니다."}
+        if variants is not None:
+            return {"error": "variants 와 segment_length 는 같이 쓸 수 없습니다."}
+        try:
+            segment_lengths = plan_segments(params.get("length"), job_input["segment_length"])
+        except ValueError as e:
+            return {"error": str(e)}
+
+    # 2) images 배열 처리 (우리 프로젝트: [{ name, data(base64) }])
+    #    다른 코드 호환: image 키도 지원. data 대신 url / path 로 참조를 줄 수도 있음
+    to_save = []
+    images = job_input.get("images", [])
+    if isinstance(images, list):
+        for img in images:
+            if not isinstance(img, dict):
+                continue
+            name = img.get("name")
+            image_data = img.get("data") or img.get("image") or img.get("url") or img.get("path")  # data 우선
+
+            if not name or not image_data:
+                logger.warning(
+                    f"이미지 정보 누락: name={name}, data={'있음' if img.get('data') else '없음'}, image={'있음' if img.get('image') else '없음'}"
+                )
+                continue
+
+            to_save.append((name, image_data))
+
+    # 템플릿 job 의 image_* / end_image_* 는 해시 이름으로 저장해서 LoadImage 에 연결
+    template_images = []
+    if template is not None:
+        for key, param in TEMPLATE_IMAGE_KEYS.items():
+            if job_input.get(key) and param not in dict(template_images):
+                template_images.append((param, len(to_save)))
+                to_save.append((None, job_input[key]))
+
+    with timer.phase("save_images"):
+        saved_images, input_pins = save_input_images(to_save)
+
+    if template is not None:
+        for param, index in template_images:
+            params[param] = os.path.basename(saved_images[index])
+
+    try:
+        if segment_lengths is not None:
+            return run_segments(job_input, params, segment_lengths, output_nodes, return_kinds, timer, emit, output_mode)
+
+        try:
+            if variants is None:
+                workflows = [template.apply(params) if template is not None else workflow]
+            elif template is not None:
+                for variant in variants:
+                    if not isinstance(variant, dict):
+                        raise ValueError(f"variant 는 객체여야 합니다: {variant!r}")
+                workflows = [template.apply({**params, **variant}) for variant in variants]
+            else:
+                workflows = [apply_node_overrides(workflow, variant) for variant in variants]
+        except ValueError as e:
+            return {"error": str(e)}
+        # images 의 name 으로 워크플로우에 걸어둔 이름 (image / video / mask 등) -> 실제 저장한 이름 (내용 해시가 붙음)
+        renamed = {
+            name: os.path.relpath(path, INPUT_DIR) for (name, _), path in zip(to_save, saved_images) if name
+        }
+        workflows = [rename_input_images(wf, renamed) for wf in workflows]
+
+        # 큐잉 전 검증 (input 의 validate=false 면 생략). 잘못된 job 은 GPU 를 쓰기 전에 바로 실패
+        if VALIDATE_WORKFLOW and job_input.get("validate", True):
+            known_files = {os.path.relpath(p, INPUT_DIR) for p in saved_images}
+            errors = []
+            with timer.phase("validate"):
+                for i, wf in enumerate(workflows):
+                    prefix = f"variant {i}: " if variants is not None else ""
+                    errors.extend(prefix + error for error in preflight(wf, known_files))
+            if errors:
+                logger.warning(f"❌ 워크플로우 검증 실패 ({len(errors)}건): {errors}")
+                summary = errors[0] if len(errors) == 1 else f"{errors[0]} 외 {len(errors) - 1}건"
+                return {"error": f"워크플로우 검증 실패: {summary}", "validation_errors": errors}
+
+        # 결과 캐시 키 (input 의 cache=false 면 캐시를 쓰지 않음)
+        cache_keys = [None] * len(workflows)
+        if result_cache is not None and job_input.get("cache", True):
+            with timer.phase("cache_key"):
+                cache_keys = [result_cache.key_for(wf, saved_images) for wf in workflows]
+        if variants is not None:
+            return execute_variants(job_input, workflows, output_nodes, return_kinds, timer, emit, output_mode, cache_keys)
+        return execute_job(job_input, workflows[0], output_nodes, return_kinds, timer, emit, output_mode, cache_keys[0])
+    finally:
+        release_input_images(input_pins)
+
+
+def execute_job(
+    job_input: dict,
+    workflow: dict,
+    output_nodes: list[str] | None,
+    return_kinds: set[str],
+    timer: JobTimer,
+    emit=None,
+    output_mode: str = "inline",
+    cache_key: str | None = None,
+) -> dict:
+    profiler = ExecutionProfiler(workflow, timer)
+
+    # 3) 결과 캐시 확인 (hit 이면 ComfyUI 를 거치지 않고 저장된 출력 파일 사용)
+    cached = None
+    if cache_key:
+        with timer.phase("cache_lookup"):
+            cached = result_cache.acquire(cache_key, timer.control)
+        logger.info(
+            f"{'🎯 결과 캐시 hit' if cached is not None else '결과 캐시 miss'}: {cache_key[:16]} "
+            f"(hit {result_cache.stats['hits']} / miss {result_cache.stats['misses']}, "
+            f"hit rate {result_cache.hit_rate():.1%})"
+        )
+
+    try:
+        outputs = cached if cached is not None else run_workflow(workflow, profiler, timer, emit)
+        # 캐시 저장과 인코딩 / 업로드가 끝날 때까지 janitor 가 출력 파일을 지우지 않도록
+        with janitor.pinned(output_paths(outputs)):
+            if cached is None and cache_key and any(outputs.values()):
+                with timer.phase("cache_store"):
+                    result_cache.store(cache_key, outputs)
+            return finish_job(
+                job_input, outputs, output_nodes, return_kinds, timer, profiler, output_mode, cache_key, cached is not None
+            )
+    finally:
+        if cached is not None:
+            result_cache.release(cache_key)
+        elif cache_key:
+            # 어떻게 끝나든 같은 키를 기다리는 job 을 깨움 (store 뒤에 또 불러도 무해)
+            result_cache.abandon(cache_key)
+
+
+def execute_variants(
+    job_input: dict,
+    workflows: list[dict],
+    output_nodes: list[str] | None,
+    return_kinds: set[str],
+    timer: JobTimer,
+    emit=None,
+    output_mode: str = "inline",
+    cache_keys: list[str | None] | None = None,
+) -> dict:
+    """
+    variant 워크플로우를 ComfyUI 큐에 연달아 넣고 variant 별 결과를 {"variants": [...]} 로 반환.
+    다음 prompt 가 이미 큐에 있으므로 variant 사이에 GPU 가 쉬지 않고,
+    입력이 같은 노드(모델 로드, CLIP vision 인코드, 같은 프롬프트의 T5 인코드)는 ComfyUI 캐시로 재사용됨.
+    variant 하나가 실패해도 나머지 결과는 반환 (실패한 자리는 {"error": ...})
+    """
+    cache_keys = cache_keys or [None] * len(workflows)
+    variants = []
+    seen_keys = set()
+    for index, (workflow, cache_key) in enumerate(zip(workflows, cache_keys)):
+        # 같은 job 안의 중복 variant 는 캐시를 한 번만 잡음 (자기 자신을 기다리지 않도록)
+        if cache_key in seen_keys:
+            cache_key = None
+        seen_keys.add(cache_key)
+        variant_timer = timer.child(variant=index)
+        variants.append(
+            {
+                "timer": variant_timer,
+                "profiler": ExecutionProfiler(workflow, variant_timer),
+                "cache_key": cache_key,
+                "cached": None,
+                "pending": False,
+                "prompt": None,
+            }
+        )
+
+    results = []
+    try:
+        # 캐시 키는 정렬된 순서로 잡음 (variant job 여러 개가 서로의 키를 기다리며 막히지 않도록)
+        with timer.phase("cache_lookup"):
+            for variant in sorted((v for v in variants if v["cache_key"]), key=lambda v: v["cache_key"]):
+                variant["cached"] = result_cache.acquire(variant["cache_key"], timer.control)
+                variant["pending"] = variant["cached"] is None
+        hits = sum(v["cached"] is not None for v in variants)
+        if cache_keys[0] is not None:
+            logger.info(f"결과 캐시: variant {len(variants)}개 중 hit {hits}개 (hit rate {result_cache.hit_rate():.1%})")
+
+        if hits < len(variants):
+            with timer.phase("wait_comfyui"):
+                wait_for_comfyui()
+            with timer.phase("queue_prompt"):
+                for variant, workflow in zip(variants, workflows):
+                    if variant["cached"] is None:
+                        variant["prompt"] = submit_prompt(workflow, variant["timer"])
+            logger.info(f"📥 variant {len(variants) - hits}개 큐잉 완료")
+
+        for index, (variant, workflow) in enumerate(zip(variants, workflows)):
+            results.append(run_variant(index, variant, workflow, job_input, output_nodes, return_kinds, emit, output_mode))
+    finally:
+        # 도중에 실패/취소되면 아직 기다리지 않은 variant 는 큐에서 지움 (GPU 가 버려질 결과를 만들지 않도록)
+        leftover = [variant["prompt"][0] for variant in variants if variant["prompt"] is not None]
+        if leftover:
+            try:
+                comfy.post_json("/queue", {"delete": leftover})
+            except Exception as e:
+                logger.warning(f"남은 variant prompt 큐 삭제 실패: {e}")
+        for variant in variants:
+            if variant["prompt"] is not None:
+                timer.control.untrack(variant["prompt"][0])
+                comfy.unwatch(variant["prompt"][0])
+                model_stage.release(variant["prompt"][1].staged)
+            if variant["cached"] is not None:
+                result_cache.release(variant["cache_key"])
+            elif variant["pending"]:
+                result_cache.abandon(variant["cache_key"])
+
+    timings = timer.summary()
+    if timer.worker is not None:
+        timings["worker"] = timer.worker
+    failed = sum("error" in r for r in results)
+    logger.info(f"⏱️ variant {len(results)}개 완료 ({failed}개 실패) {timings['total']}s, 단계 {timings['phases']}")
+    if failed == len(results):
+        return {"error": f"모든 variant 가 실패했습니다: {results[0]['error']}", "variants": results}
+    return {"variants": results, "timings": timings}
+
+
+def run_variant(index, variant, workflow, job_input, output_nodes, return_kinds, emit, output_mode) -> dict:
+    """큐에 넣은 variant 하나의 결과를 기다려서 결과 dict 로 만듦"""
+    cache_key = variant["cache_key"]
+    if variant["cached"] is not None:
+        outputs = variant["cached"]
+    else:
+        prompt_id, watch = variant["prompt"]
+        variant["prompt"] = None
+        listeners = [variant["profiler"]]
+        if emit:
+            listeners.append(ProgressReporter(workflow, lambda record: emit({**record, "variant": index})))
+
+        def on_message(message: dict):
+            for listener in listeners:
+                listener(message)
+
+        try:
+            outputs = wait_outputs(prompt_id, watch, on_message, variant["timer"])
+        except JobCancelled:
+            # 취소 / 마감은 variant 하나가 아니라 job 전체를 멈춤
+            raise
+        except Exception as e:
+            logger.error(f"❌ variant {index} 실패: {e}")
+            return {"error": str(e)}
+
+    with janitor.pinned(output_paths(outputs)):
+        if variant["pending"]:
+            variant["pending"] = False
+            if any(outputs.values()):
+                with variant["timer"].phase("cache_store"):
+                    result_cache.store(cache_key, outputs)
+            else:
+                result_cache.abandon(cache_key)
+
+        return finish_job(
+            job_input, outputs, output_nodes, return_kinds, variant["timer"], variant["profiler"],
+            output_mode, cache_key, variant["cached"] is not None,
+        )
+
+
+def plan_segments(length, segment_length) -> list[int] | None:
+    """
+    전체 프레임 수를 세그먼트 길이 목록으로 나눔 (각각 4n+1). 나눌 필요가 없으면 None.
+    마지막 세그먼트는 남은 프레임 수를 4n+1 로 올림 (최소 5)
+    """
+    try:
+        length, segment_length = int(length), int(segment_length)
+    except (TypeError, ValueError):
+        raise ValueError("segment_length 를 쓰려면 length 와 segment_length 가 정수여야 합니다.")
+    if segment_length < 5 or (segment_length - 1) % 4:
+        raise ValueError(f"segment_length 는 5 이상의 4n+1 이어야 합니다: {segment_length}")
+    if length <= segment_length:
+        return None
+    count = -(-length // segment_length)
+    if count > MAX_SEGMENTS:
+        raise ValueError(f"세그먼트는 최대 {MAX_SEGMENTS}개까지 지원합니다 (length {length} / segment_length {segment_length} = {count}).")
+    rest = length - segment_length * (count - 1)
+    return [segment_length] * (count - 1) + [max(5, -(-(rest - 1) // 4) * 4 + 1)]
+
+
+def run_ffmpeg(args: list[str]):
+    if not FFMPEG_BIN:
+        raise Exception("ffmpeg 를 찾을 수 없습니다 (FFMPEG_BIN 을 지정하거나 ffmpeg / imageio-ffmpeg 설치 필요)")
+    proc = subprocess.run([FFMPEG_BIN, "-v", "error", "-y", *args], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise Exception(f"ffmpeg 실패 ({proc.returncode}): {proc.stderr.strip()[-500:]}")
+
+
+def extract_last_frame(video_path: str, image_path: str):
+    """비디오의 마지막 프레임을 PNG 로 저장 (끝에서 1초 앞부터 디코드하면서 같은 파일에 덮어씀)"""
+    tmp = f"{image_path}.{uuid.uuid4().hex}.png"
+    try:
+        run_ffmpeg(["-sseof", "-1", "-i", video_path, "-an", "-update", "1", tmp])
+        os.replace(tmp, image_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def concat_videos(paths: list[str], output_path: str):
+    """같은 설정으로 인코딩된 mp4 들을 재인코딩 없이 이어붙임 (concat demuxer + stream copy)"""
+    list_path = f"{output_path}.{uuid.uuid4().hex}.txt"
+    tmp = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", "-movflags", "+faststart", "-f", "mp4", tmp])
+        os.replace(tmp, output_path)
+    finally:
+        for path in (list_path, tmp):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def prune_segment_checkpoints():
+    """SEGMENT_CHECKPOINT_MAX_AGE 동안 안 쓰인 체크포인트 삭제 (실패한 뒤 다시 오지 않은 요청)"""
+    try:
+        entries = os.listdir(SEGMENT_CHECKPOINT_DIR)
+    except OSError:
+        return
+    cutoff = time.time() - SEGMENT_CHECKPOINT_MAX_AGE
+    for name in entries:
+        path = os.path.join(SEGMENT_CHECKPOINT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                logger.info(f"🧹 오래된 세그먼트 체크포인트 삭제: {name}")
+        except OSError:
+            continue
+
+
+class SegmentProfile:
+    """세그먼트별 ExecutionProfiler 를 합친 요약 (finish_job 의 timings 용)"""
+
+    def __init__(self):
+        self.profilers: list[tuple[int, ExecutionProfiler]] = []
+
+    def summary(self) -> dict:
+        summaries = [(index, profiler.summary()) for index, profiler in self.profilers]
+
+        def total(key):
+            values = [s[key] for _, s in summaries if s[key] is not None]
+            return round(sum(values), 3) if values else None
+
+        return {
+            "queue_wait": total("queue_wait"),
+            "execution": total("execution"),
+            "nodes": [{**node, "segment": index} for index, s in summaries for node in s["nodes"]],
+            "cached": sorted({node for _, s in summaries for node in s["cached"]}),
+        }
+
+
+def run_segments(
+    job_input: dict,
+    params: dict,
+    lengths: list[int],
+    output_nodes: list[str] | None,
+    return_kinds: set[str],
+    timer: JobTimer,
+    emit=None,
+    output_mode: str = "inline",
+) -> dict:
+    """
+    긴 영상을 세그먼트로 나눠 순서대로 생성하고 하나로 이어붙여 반환.
+    - 첫 세그먼트는 입력 이미지, 다음 세그먼트는 이전 세그먼트의 마지막 프레임에서 시작 (i2v 템플릿)
+    - end_image 가 있으면 마지막 세그먼트는 flf2v 템플릿으로 끝 프레임을 맞춤
+    - 끝난 세그먼트는 SEGMENT_CHECKPOINT_DIR/<요청 키>/ 에 저장, 같은 요청이 다시 오면 남은 세그먼트부터 생성
+    - segment_prompts 가 있으면 세그먼트별 프롬프트 (모자라면 마지막 값 사용)
+    - 이어붙이기는 ffmpeg stream copy (재인코딩 없음). 경계마다 이어받은 프레임이 한 번 반복됨
+    """
+    i2v, flf2v = TEMPLATES.get("i2v"), TEMPLATES.get("flf2v")
+    end_image = params.get("end_image")
+    if i2v is None or (end_image and flf2v is None):
+        return {"error": "세그먼트 생성에 필요한 템플릿이 없습니다 (i2v / flf2v)."}
+    if not params.get("image"):
+        return {"error": "세그먼트 생성에는 시작 이미지가 필요합니다 (image_base64 / image_url / image_path)."}
+    prompts = job_input.get("segment_prompts") or []
+    if not isinstance(prompts, list) or not all(isinstance(p, str) for p in prompts):
+        return {"error": "segment_prompts 는 문자열 배열이어야 합니다."}
+
+    # 요청 키: 파라미터 + 세그먼트 계획 + 입력 이미지 내용 (같은 요청의 재시도면 같은 키)
+    with timer.phase("segment_plan"):
+        canonical = {k: _canonical_value(v) for k, v in params.items() if k not in ("image", "end_image")}
+        images = {k: _file_sha256(os.path.join(INPUT_DIR, params[k])) for k in ("image", "end_image") if params.get(k)}
+        key = hashlib.sha256(
+            json.dumps(
+                {"salt": RESULT_CACHE_SALT, "params": canonical, "images": images, "lengths": lengths, "prompts": prompts},
+                sort_keys=True,
+                ensure_ascii=False,
+            ).encode("utf-8")
+        ).hexdigest()
+        checkpoint_dir = os.path.join(SEGMENT_CHECKPOINT_DIR, key)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        os.utime(checkpoint_dir)
+        prune_segment_checkpoints()
+
+    count = len(lengths)
+    logger.info(f"🎞️ 세그먼트 생성: {count}개 {lengths} (체크포인트 {checkpoint_dir})")
+    profile = SegmentProfile()
+    segments = []
+    segment_paths = []
+    handoff_files = []
+    start_image = params["image"]
+    job_tag = uuid.uuid4().hex[:8]
+    validate = VALIDATE_WORKFLOW and job_input.get("validate", True)
+    try:
+        for index, length in enumerate(lengths):
+            segment_path = os.path.join(checkpoint_dir, f"segment_{index:03d}.mp4")
+            last_frame = os.path.join(checkpoint_dir, f"segment_{index:03d}_last.png")
+            t0 = time.monotonic()
+            resumed = os.path.exists(segment_path) and os.path.exists(last_frame)
+            if resumed:
+                logger.info(f"♻️ 세그먼트 {index + 1}/{count} 체크포인트 재사용")
+            else:
+                last = index == count - 1
+                template = flf2v if last and end_image else i2v
+                segment_params = {**params, "length": length, "image": start_image}
+                if not (last and end_image):
+                    segment_params.pop("end_image", None)
+                if prompts:
+                    segment_params["prompt"] = prompts[min(index, len(prompts) - 1)]
+                try:
+                    workflow = template.apply(segment_params)
+                except ValueError as e:
+                    return {"error": str(e)}
+                if validate:
+                    with timer.phase("validate"):
+                        errors = preflight(workflow, {start_image, *(v for v in (end_image,) if v)})
+                    if errors:
+                        logger.warning(f"❌ 세그먼트 {index} 워크플로우 검증 실패: {errors}")
+                        return {"error": f"세그먼트 {index} 워크플로우 검증 실패: {errors[0]}", "validation_errors": errors}
+
+                profiler = ExecutionProfiler(workflow, timer.child(segment=index))
+                profile.profilers.append((index, profiler))
+                segment_emit = (lambda record, index=index: emit({**record, "segment": index, "segments": count})) if emit else None
+                logger.info(f"▶️ 세그먼트 {index + 1}/{count} 생성 ({template.name}, {length} 프레임, 시작 이미지 {start_image})")
+                outputs = run_workflow(workflow, profiler, timer, segment_emit)
+                try:
+                    videos = _select_files(outputs["videos"], output_nodes)
+                    video = next((p for paths in videos.values() for p in paths), None)
+                    if video is None:
+                        raise Exception(f"세그먼트 {index} 의 출력 비디오가 없습니다.")
+                    # 체크포인트로 옮기기 전에 janitor 가 지우지 않도록
+                    with timer.phase("checkpoint"), janitor.pinned([video]):
+                        _link_or_copy(video, segment_path + ".tmp.mp4")
+                        extract_last_frame(segment_path + ".tmp.mp4", last_frame)
+                        os.replace(segment_path + ".tmp.mp4", segment_path)
+                finally:
+                    janitor.release(output_paths(outputs))
+
+            segment_paths.append(segment_path)
+            segments.append({"index": index, "frames": length, "resumed": resumed, "seconds": round(time.monotonic() - t0, 3)})
+            if index < count - 1:
+                # 다음 세그먼트의 시작 이미지 (이 job 전용 이름으로 INPUT_DIR 에 연결)
+                start_image = f"segment_{key[:16]}_{job_tag}_{index:03d}.png"
+                handoff_files.append(_link_input(start_image, last_frame))
+
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        output_path = os.path.join(OUTPUT_DIR, f"segmented_{key[:16]}_{uuid.uuid4().hex[:8]}.mp4")
+        with timer.phase("concat"), janitor.pinned([output_path]):
+            concat_videos(segment_paths, output_path)
+        logger.info(f"🔗 세그먼트 {count}개 이어붙임 (stream copy): {output_path} ({os.path.getsize(output_path) / (1024 * 1024):.1f}MB)")
+    finally:
+        for path in handoff_files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    with janitor.pinned([output_path]):
+        result = finish_job(
+            job_input, {"videos": {"segments": [output_path]}, "images": {}}, None, return_kinds, timer, profile,
+            output_mode, None, False,
+        )
+    if "error" not in result:
+        result["segments"] = segments
+        # 결과를 돌려줬으니 체크포인트는 필요 없음
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    return result
+
+
+def run_workflow(workflow: dict, profiler, timer: JobTimer, emit=None) -> dict:
+    """ComfyUI 에서 워크플로우를 실행하고 출력 파일 목록 반환"""
+    # ComfyUI 서버 대기 (워커 시작 시 만든 연결을 재사용)
+    with timer.phase("wait_comfyui"):
+        wait_for_comfyui()
+
+    # 워크플로우 실행 (이벤트는 노드별 시간 측정 + 진행 상황 전달에 사용)
+    listeners = [profiler]
+    if emit:
+        listeners.append(ProgressReporter(workflow, emit))
+
+    def on_message(message: dict):
+        for listener in listeners:
+            listener(message)
+
+    return get_outputs(workflow, on_message, timer)
+
+
+def finish_job(
+    job_input: dict,
+    outputs: dict,
+    output_nodes: list[str] | None,
+    return_kinds: set[str],
+    timer: JobTimer,
+    profiler,
+    output_mode: str,
+    cache_key: str | None,
+    cache_hit: bool,
+) -> dict:
+    """출력 파일을 반환 형태(data URL / URL)로 바꾸고 timings 를 붙여 결과 dict 구성"""
+    # 4) 결과 반환
+    # 우리 프로젝트의 serverless 결과 파싱이 단순해서(output.videoUrl 형태), data URL로 반환
+    # output_mode=s3 면 버킷에 올리고 URL 로 반환. inline 이어도 인라인 한도를 넘는 파일은 S3 가 있으면 업로드
+    # 선택된 출력만 인코딩 (나머지 파일은 열지도 않음)
+    key_prefix = f"{time.strftime('%Y%m%d')}/{uuid.uuid4().hex}"
+
+    def store(path: str) -> str:
+        if s3_uploader is not None and (
+            output_mode == "s3" or (MAX_INLINE_OUTPUT_BYTES and os.path.getsize(path) > MAX_INLINE_OUTPUT_BYTES)
+        ):
+            return s3_uploader.upload(path, key_prefix)
+        return encode_file_to_data_url(path)
+
+    try:
+        with timer.phase("upload" if output_mode == "s3" else "encode"):
+            result = materialize_outputs(
+                outputs, output_nodes, return_kinds, store=store,
+                workers=S3_UPLOAD_FILES if s3_uploader is not None else 1,
+            )
+    finally:
+        # 이 job 의 출력 파일은 반환이 끝났으니 정리 대상 (캐시 항목 파일은 캐시가 관리)
+        if not cache_hit:
+            janitor.release(output_paths(outputs))
+
+    # ComfyUI outputs 에 이미지가 없으면 입력 이미지(첫 장)로 fallback
+    if "image" in return_kinds and "imageUrl" not in result:
+        image_url = None
+        if isinstance(job_input.get("images"), list) and job_input["images"]:
+            first = job_input["images"][0]
+            if isinstance(first, dict):
+                image_url = normalize_input_image_to_data_url(
+                    first.get("name"),
+                    first.get("data") or first.get("image") or first.get("url") or "",
+                )
+        elif isinstance(job_input.get("image_base64") or job_input.get("image_url"), str):
+            image_url = normalize_input_image_to_data_url(
+                "image.png", job_input.get("image_base64") or job_input["image_url"]
+            )
+        if image_url:
+            result["imageUrl"] = image_url
+
+    if result.get("videoUrl") or result.get("imageUrl") or result.get("videos") or result.get("images"):
+        timings = timer.summary()
+        timings.update(profiler.summary())
+        result["timings"] = timings
+        if cache_key:
+            result["cache"] = {"hit": cache_hit, "key": cache_key}
+        if timer.worker is not None:
+            timings["worker"] = timer.worker
+        slowest = sorted(timings["nodes"], key=lambda n: n["seconds"], reverse=True)[:3]
+        logger.info(
+            f"⏱️ job 완료 {timings['total']}s, 단계 {timings['phases']}, "
+            f"느린 노드 {[(n['node'], n['class_type'], n['seconds']) for n in slowest]}"
+        )
+        return result
 
     return {"error": "비디오/이미지를 찾을 수 없습니다."}
 
 
-runpod.serverless.start({"handler": handler})
\ No newline at end of file
+WARMUP_JOB_ID = "warm-up"
+# 워커 단위 상태: ComfyUI 준비까지 걸린 시간, warm-up 시간, 모델 미리 읽기, 첫 job 까지 걸린 시간, 처리한 job 수
+WORKER_STATS = {
+    "comfy_ready_seconds": None,
+    "warmup_seconds": None,
+    "warmup_ok": None,
+    "prefetch_seconds": None,
+    "prefetch_bytes": None,
+    "first_job_seconds": None,
+    "jobs": 0,
+}
+_worker_stats_lock = threading.Lock()
+# 취소 / 마감 시간 초과로 멈춘 job 과 그 덕분에 아낀 GPU 시간 (추정치).
+# execution_seconds_avg: 끝까지 실행된 prompt 의 실행 시간 이동 평균 (큐에서 지운 prompt 의 아낀 시간 추정에 사용)
+CANCEL_STATS = {
+    "cancelled": 0,
+    "deadline": 0,
+    "prompts_removed": 0,
+    "prompts_interrupted": 0,
+    "reclaimed_gpu_seconds": 0.0,
+    "stop_seconds_max": 0.0,
+    "execution_seconds_avg": None,
+}
+
+
+def record_cancel(info: dict):
+    """stop_job_prompts 결과를 워커 통계에 더하고 로그로 남김"""
+    with _worker_stats_lock:
+        CANCEL_STATS[info["reason"]] += 1
+        CANCEL_STATS["prompts_removed"] += len(info["removed"])
+        CANCEL_STATS["prompts_interrupted"] += len(info["interrupted"])
+        CANCEL_STATS["reclaimed_gpu_seconds"] = round(CANCEL_STATS["reclaimed_gpu_seconds"] + info["reclaimed_gpu_seconds"], 1)
+        CANCEL_STATS["stop_seconds_max"] = max(CANCEL_STATS["stop_seconds_max"], info["stop_seconds"])
+        totals = dict(CANCEL_STATS)
+    logger.info(
+        f"🛑 job {CANCEL_REASONS[info['reason']]}: 큐에서 삭제 {len(info['removed'])}개, 중단 {len(info['interrupted'])}개, "
+        f"멈추기까지 {info['stop_seconds']}s, 아낀 GPU 시간 ~{info['reclaimed_gpu_seconds']}s "
+        f"(워커 누적: 취소 {totals['cancelled']} / 마감 {totals['deadline']}, ~{totals['reclaimed_gpu_seconds']}s)"
+    )
+
+
+def count_worker_job() -> dict:
+    """job 하나를 셈하고 결과 timings.worker 로 돌려줄 워커 상태 반환 (첫 job 은 cold_start)"""
+    with _worker_stats_lock:
+        WORKER_STATS["jobs"] += 1
+        if WORKER_STATS["jobs"] == 1:
+            # cold start 비교용: 워커 프로세스 시작부터 첫 job 을 받기까지
+            WORKER_STATS["first_job_seconds"] = round(time.monotonic() - WORKER_STARTED, 3)
+            steps = [
+                f"{label} {WORKER_STATS[key]}s"
+                for label, key in (("ComfyUI 준비", "comfy_ready_seconds"), ("warm-up", "warmup_seconds"), ("모델 미리 읽기", "prefetch_seconds"))
+                if WORKER_STATS[key] is not None
+            ]
+            logger.info(f"🚀 첫 job: 워커 시작 후 {WORKER_STATS['first_job_seconds']}s ({', '.join(steps) or '단계 기록 없음'})")
+        return {
+            "cold_start": WORKER_STATS["jobs"] == 1,
+            "job_index": WORKER_STATS["jobs"],
+            "uptime": round(time.monotonic() - WORKER_STARTED, 3),
+            "comfy_ready_seconds": WORKER_STATS["comfy_ready_seconds"],
+            "warmup_seconds": WORKER_STATS["warmup_seconds"],
+            "prefetch_seconds": WORKER_STATS["prefetch_seconds"],
+            "prefetch_bytes": WORKER_STATS["prefetch_bytes"],
+            "first_job_seconds": WORKER_STATS["first_job_seconds"],
+            "cancelled_jobs": CANCEL_STATS["cancelled"] + CANCEL_STATS["deadline"],
+            "reclaimed_gpu_seconds": CANCEL_STATS["reclaimed_gpu_seconds"],
+            "model_stage": model_stage.summary() if model_stage.enabled else None,
+        }
+
+
+def template_model_files() -> list[tuple[str, str]]:
+    """템플릿이 쓰는 모델 파일 (이름, 경로) 목록. 템플릿 안의 순서대로, 찾지 못한 파일은 빠짐"""
+    names = dict.fromkeys(
+        value
+        for template in TEMPLATES.values()
+        for node in template.workflow.values()
+        if isinstance(node, dict)
+        for value in (node.get("inputs") or {}).values()
+        if isinstance(value, str) and value.lower().endswith(MODEL_EXTENSIONS)
+    )
+    files = []
+    for name in names:
+        path = find_model_file(name)
+        if path is None:
+            logger.warning(f"미리 읽을 모델 파일을 찾지 못함: {name}")
+            continue
+        files.append((name, path))
+    return files
+
+
+def _available_memory() -> int | None:
+    try:
+        with open("/proc/meminfo", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _prefetch_range(path: str, offset: int, length: int) -> int:
+    """파일 구간을 읽어서 페이지 캐시에 올림 (WILLNEED 로 커널 read-ahead 를 먼저 걸고 직접 읽음). 읽은 바이트 수 반환"""
+    buffer = memoryview(bytearray(min(length, 8 * 1024 * 1024)))
+    done = 0
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError as e:
+        logger.warning(f"모델 미리 읽기 실패: {path}: {e}")
+        return 0
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+        while done < length:
+            n = os.preadv(fd, [buffer[: min(len(buffer), length - done)]], offset + done)
+            if n <= 0:
+                break
+            done += n
+    except OSError as e:
+        logger.warning(f"모델 미리 읽기 실패: {path}@{offset}: {e}")
+    finally:
+        os.close(fd)
+    return done
+
+
+def prefetch_models():
+    """
+    템플릿의 모델 파일을 PREFETCH_WORKERS 개 스레드로 구간을 나눠 읽음 (앞쪽 파일부터).
+    페이지 캐시에 다 안 들어가는 만큼은 읽지 않음 (먼저 읽은 것이 밀려나지 않도록)
+    """
+    t0 = time.monotonic()
+    if PREFETCH_MAX_GB:
+        budget = float(PREFETCH_MAX_GB) * 1024**3
+    else:
+        available = _available_memory()
+        budget = available * 0.8 if available is not None else float("inf")
+
+    selected = []
+    total = 0
+    for name, path in template_model_files():
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        if total + size > budget:
+            logger.info(f"모델 미리 읽기 생략: {name} ({size / 1024**3:.1f}GB, 남은 한도 {(budget - total) / 1024**3:.1f}GB)")
+            continue
+        selected.append((name, path, size))
+        total += size
+    if not selected:
+        return
+
+    ranges = [
+        (path, offset, min(PREFETCH_RANGE_SIZE, size - offset))
+        for _, path, size in selected
+        for offset in range(0, size, PREFETCH_RANGE_SIZE)
+    ]
+    logger.info(f"📚 모델 미리 읽기 시작: {len(selected)}개 {total / 1024**3:.1f}GB, 스레드 {PREFETCH_WORKERS}개 {[name for name, _, _ in selected]}")
+    with ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch") as pool:
+        read = sum(pool.map(lambda r: _prefetch_range(*r), ranges))
+
+    seconds = time.monotonic() - t0
+    with _worker_stats_lock:
+        WORKER_STATS["prefetch_seconds"] = round(seconds, 3)
+        WORKER_STATS["prefetch_bytes"] = read
+    logger.info(
+        f"📚 모델 미리 읽기 완료: {read / 1024**3:.2f}GB, {seconds:.1f}s ({read / (1024 * 1024) / max(seconds, 1e-6):.0f}MB/s), "
+        f"워커 시작 후 {time.monotonic() - WORKER_STARTED:.1f}s"
+    )
+
+
+def start_prefetch():
+    """prefetch_models 를 백그라운드 스레드로 시작 (ComfyUI 준비 / warm-up 과 동시에 진행)"""
+    if not PREFETCH_MODELS:
+        return
+
+    def run():
+        try:
+            prefetch_models()
+        except Exception as e:
+            logger.warning(f"모델 미리 읽기 실패: {e}")
+
+    threading.Thread(target=run, name="prefetch", daemon=True).start()
+
+
+def _tiny_png(width: int, height: int) -> bytes:
+    """warm-up 입력용 회색 PNG (이미지 라이브러리 없이 생성)"""
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    rows = b"".join(b"\x00" + b"\x80" * (width * 3) for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+def warm_up():
+    """
+    ComfyUI 가 준비될 때까지 기다린 뒤, WARMUP 이면 템플릿을 최소 크기(작은 해상도, 몇 프레임, 1 스텝)로 한 번 실행.
+    실패해도 워커는 계속 시작함 (첫 job 이 로딩 비용을 냄)
+    """
+    try:
+        wait_for_comfyui()
+    except Exception as e:
+        logger.error(f"❌ ComfyUI 준비 실패: {e}")
+        return
+    comfy_ready_seconds = round(time.monotonic() - WORKER_STARTED, 3)
+    with _worker_stats_lock:
+        WORKER_STATS["comfy_ready_seconds"] = comfy_ready_seconds
+    logger.info(f"✅ ComfyUI 준비 완료: 워커 시작 후 {comfy_ready_seconds}s")
+    if VALIDATE_WORKFLOW:
+        object_info.get()
+
+    if not WARMUP:
+        return
+    template = TEMPLATES.get(WARMUP_TEMPLATE)
+    if template is None:
+        logger.warning(f"warm-up 템플릿 없음: {WARMUP_TEMPLATE} (가능: {sorted(TEMPLATES)}), warm-up 생략")
+        return
+
+    params = {**WARMUP_DEFAULT_PARAMS, **WARMUP_PARAMS}
+    image = base64.b64encode(_tiny_png(int(params["width"]), int(params["height"]))).decode("ascii")
+    job_input = {"template": WARMUP_TEMPLATE, "params": params, "cache": False, "return": ["video"], "output_mode": "inline"}
+    for key, param in TEMPLATE_IMAGE_KEYS.items():
+        if key.endswith("_base64") and param in template.patch_map:
+            job_input[key] = image
+
+    t0 = time.monotonic()
+    try:
+        result = run_job({"id": WARMUP_JOB_ID, "input": job_input})
+        error = result.get("error")
+    except Exception as e:
+        error = str(e)
+    warmup_seconds = round(time.monotonic() - t0, 3)
+    with _worker_stats_lock:
+        WORKER_STATS["warmup_seconds"] = warmup_seconds
+        WORKER_STATS["warmup_ok"] = error is None
+    if error is None:
+        logger.info(
+            f"🔥 warm-up 완료 ({WARMUP_TEMPLATE}): {warmup_seconds}s, "
+            f"단계 {result.get('timings', {}).get('phases')}, 워커 시작 후 {time.monotonic() - WORKER_STARTED:.1f}s"
+        )
+    else:
+        logger.warning(f"warm-up 실패 ({warmup_seconds}s): {error}")
+
+
+async def handler(job):
+    """
+    RunPod async handler.
+    실제 처리는 스레드에서 돌려서 여러 job 의 CPU 작업(입력 저장, 출력 인코딩)이 서로/GPU 실행과 겹치게 함.
+    RunPod 가 job 을 취소하면 (task cancel) 스레드에 알려서 ComfyUI 실행을 중단시킴
+    """
+    control = JobControl()
+    try:
+        return await asyncio.to_thread(run_job, job, None, control)
+    except asyncio.CancelledError:
+        control.cancel("cancelled")
+        raise
+
+
+async def stream_handler(job):
+    """
+    RunPod generator(streaming) handler.
+    실행 중에는 progress 레코드를, 마지막에는 결과 dict 를 yield
+    """
+    loop = asyncio.get_running_loop()
+    records: asyncio.Queue = asyncio.Queue()
+
+    def emit(record: dict):
+        loop.call_soon_threadsafe(records.put_nowait, record)
+
+    control = JobControl()
+    task = asyncio.ensure_future(asyncio.to_thread(run_job, job, emit, control))
+    try:
+        while True:
+            next_record = asyncio.ensure_future(records.get())
+            try:
+                done, _ = await asyncio.wait({next_record, task}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if not next_record.done():
+                    next_record.cancel()
+            if next_record in done:
+                yield next_record.result()
+                continue
+            break
+    except (asyncio.CancelledError, GeneratorExit):
+        # 취소됐거나 소비자가 스트림을 닫음
+        control.cancel("cancelled")
+        raise
+
+    while not records.empty():
+        yield records.get_nowait()
+    yield task.result()
+
+
+def concurrency_modifier(current_concurrency: int) -> int:
+    return MAX_CONCURRENCY
+
+
+if __name__ == "__main__":
+    # import 만 할 때 (benchmark 등) 는 워커를 시작하지 않음
+    # ComfyUI 가 import 하는 동안 모델 파일을 페이지 캐시에 올림
+    start_prefetch()
+    janitor.start()
+    # RunPod 에는 warm-up 이 끝난 뒤에 준비됐다고 알림 (serverless.start 이후부터 job 을 받음)
+    warm_up()
+    if STREAM_PROGRESS:
+        runpod.serverless.start(
+            {
+                "handler": stream_handler,
+                "concurrency_modifier": concurrency_modifier,
+                "return_aggregate_stream": True,
+            }
+        )
+    else:
+        runpod.serverless.start({"handler": handler, "concurrency_modifier": concurrency_modifier})
@@ -0,0 +1,103 @@
+"""
+테스트 공통 설정.
+
+handler 는 import 할 때 환경 변수를 읽으므로, 여기서 임시 디렉토리와 fake ComfyUI 포트를 먼저 정해둠.
+ComfyUI 가 필요한 테스트는 fake_comfy fixture 로 benchmark/fake_comfyui.py 를 띄움 (GPU / 모델 없이 실행).
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+WORK_DIR = tempfile.mkdtemp(prefix="wan22-tests-")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+COMFY_PORT = free_port()
+os.environ.update(
+    {
+        "SERVER_ADDRESS": "127.0.0.1",
+        "SERVER_PORT": str(COMFY_PORT),
+        "COMFY_INPUT_DIR": os.path.join(WORK_DIR, "input"),
+        "COMFY_OUTPUT_DIR": os.path.join(WORK_DIR, "output"),
+        "COMFY_TEMP_DIR": os.path.join(WORK_DIR, "temp"),
+        "RESULT_CACHE_MAX_MB": "0",
+        "SEGMENT_CHECKPOINT_DIR": os.path.join(WORK_DIR, "segments"),
+        "MODEL_PATHS_FILE": os.path.join(WORK_DIR, "extra_model_paths.yaml"),
+        "COMFY_MODELS_DIR": os.path.join(WORK_DIR, "models"),
+        "WARMUP": "false",
+        "PREFETCH_MODELS": "false",
+        "STREAM_PROGRESS": "false",
+        "COMFY_EXECUTION_TIMEOUT": "60",
+    }
+)
+sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture(scope="session")
+def handler():
+    import handler as module
+
+    return module
+
+
+@pytest.fixture(scope="session")
+def fake_comfy(handler):
+    """
+    fake ComfyUI 서버 (세션 동안 하나). 출력은 handler 의 COMFY_OUTPUT_DIR 에 씀.
+    ffmpeg 가 있으면 실제 mp4 를 만들어서 세그먼트 이어붙이기처럼 비디오를 다시 읽는 경로도 테스트
+    """
+    cmd = [
+        sys.executable, os.path.join(REPO_DIR, "benchmark", "fake_comfyui.py"),
+        "--port", str(COMFY_PORT), "--output-dir", os.environ["COMFY_OUTPUT_DIR"],
+        "--output-mb", "0.05", "--load-time", "0.05", "--step-time", "0.01", "--decode-time", "0.01", "--preview-kb", "0",
+        "--video", "ffmpeg" if handler.FFMPEG_BIN else "synthetic",
+    ]
+    env = {**os.environ, "FFMPEG_BIN": handler.FFMPEG_BIN or ""}
+    log = open(os.path.join(WORK_DIR, "fake_comfyui.log"), "w+b")
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=log, env=env)
+    deadline = time.monotonic() + 15
+    while True:
+        if proc.poll() is not None:
+            log.seek(0)
+            pytest.fail(f"fake ComfyUI 시작 실패: {log.read().decode(errors='replace')}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{COMFY_PORT}/system_stats", timeout=1):
+                break
+        except OSError:
+            if time.monotonic() > deadline:
+                proc.kill()
+                pytest.fail("fake ComfyUI 가 응답하지 않습니다.")
+            time.sleep(0.1)
+    yield f"http://127.0.0.1:{COMFY_PORT}"
+    # handler 의 WebSocket 이 열려 있으면 정상 종료가 오래 걸리므로 잠깐만 기다리고 kill
+    proc.terminate()
+    try:
+        proc.wait(timeout=3)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+    log.close()
+
+
+@pytest.fixture
+def runpod_api(handler, fake_comfy):
+    """RunPod serverless API 대역 (job 은 fake ComfyUI 를 쓰는 handler 로 실행)"""
+    from fake_runpod import FakeRunPod
+
+    api = FakeRunPod(handler)
+    yield api
+    api.close()
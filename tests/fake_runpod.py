@@ -0,0 +1,156 @@
+"""
+클라이언트 테스트용 RunPod serverless API 대역.
+
+- POST /v2/<endpoint>/run, GET /v2/<endpoint>/status/<id>, POST /v2/<endpoint>/cancel/<id> 를 RunPod 와 같은 형식으로 제공
+- job 은 이 프로세스에서 handler.handler 로 실행 (백그라운드 이벤트 루프). 취소하면 RunPod 처럼 task 를 cancel
+- job 에 webhook 이 있으면 끝났을 때 /status 와 같은 payload 를 POST. drop_webhooks 면 보내지 않음 (콜백 유실 흉내)
+"""
+
+import asyncio
+import json
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TERMINAL_STATUSES = ("COMPLETED", "FAILED", "CANCELLED")
+
+
+class FakeRunPod:
+    def __init__(self, handler, endpoint_id: str = "test-endpoint"):
+        self.handler = handler
+        self.endpoint_id = endpoint_id
+        self.drop_webhooks = False
+        self.jobs: dict[str, dict] = {}
+        self.webhooks: list[dict] = []
+        self._lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self.loop.run_forever, name="fake-runpod-loop", daemon=True)
+        self._loop_thread.start()
+
+        api = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                route = api.route(self.path)
+                if route == ("run", None):
+                    self.reply(200, api.submit(body))
+                elif route and route[0] == "cancel":
+                    data = api.cancel(route[1])
+                    self.reply(200 if data else 404, data or {"error": "job not found"})
+                else:
+                    self.reply(404, {"error": "not found"})
+
+            def do_GET(self):
+                route = api.route(self.path)
+                data = api.status(route[1]) if route and route[0] == "status" else None
+                self.reply(200 if data else 404, data or {"error": "job not found"})
+
+            def reply(self, code: int, data: dict):
+                payload = json.dumps(data).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v2/{endpoint_id}"
+        self._server_thread = threading.Thread(target=self.server.serve_forever, name="fake-runpod-http", daemon=True)
+        self._server_thread.start()
+
+    def route(self, path: str):
+        """/v2/<endpoint>/<action>[/<job id>] -> (action, job id)"""
+        parts = path.strip("/").split("/")
+        if len(parts) < 3 or parts[:2] != ["v2", self.endpoint_id]:
+            return None
+        return parts[2], (parts[3] if len(parts) > 3 else None)
+
+    def point(self, client):
+        """GenerateVideoClient 가 이 대역을 보게 함"""
+        client.runpod_api_endpoint = f"{self.base_url}/run"
+        client.status_url = f"{self.base_url}/status"
+        client.stream_url = f"{self.base_url}/stream"
+        client.cancel_url = f"{self.base_url}/cancel"
+
+    def submit(self, body: dict) -> dict:
+        job_id = f"job-{uuid.uuid4().hex[:12]}"
+        job = {"id": job_id, "status": "IN_QUEUE", "webhook": body.get("webhook"), "submitted": time.time()}
+        with self._lock:
+            self.jobs[job_id] = job
+        job["task"] = asyncio.run_coroutine_threadsafe(self._run(job, body.get("input") or {}), self.loop)
+        # 시작 전에 취소돼도 CANCELLED 로 끝나게 task 쪽에서 처리
+        job["task"].add_done_callback(lambda task: task.cancelled() and self._finish(job, "CANCELLED"))
+        return {"id": job_id, "status": "IN_QUEUE"}
+
+    async def _run(self, job: dict, job_input: dict):
+        job["status"] = "IN_PROGRESS"
+        job["started"] = time.time()
+        try:
+            output = await self.handler.handler({"id": job["id"], "input": job_input})
+        except Exception as e:
+            self._finish(job, "FAILED", error=str(e))
+            return
+        if isinstance(output, dict) and "error" in output:
+            self._finish(job, "FAILED", error=output["error"])
+        else:
+            self._finish(job, "COMPLETED", output=output)
+
+    def _finish(self, job: dict, status: str, **fields):
+        now = time.time()
+        job.update(fields)
+        job["delayTime"] = int((job.get("started", now) - job["submitted"]) * 1000)
+        job["executionTime"] = int((now - job.get("started", now)) * 1000)
+        job["status"] = status
+        if job["webhook"]:
+            threading.Thread(target=self._deliver, args=(job["webhook"], self.status(job["id"])), daemon=True).start()
+
+    def _deliver(self, url: str, payload: dict):
+        with self._lock:
+            self.webhooks.append({"url": url, "payload": payload, "dropped": self.drop_webhooks})
+        if self.drop_webhooks:
+            return
+        request = urllib.request.Request(
+            url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=10):
+            pass
+
+    def status(self, job_id: str | None) -> dict | None:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        data = {"id": job_id, "status": job["status"]}
+        for key in ("output", "error", "delayTime", "executionTime"):
+            if key in job:
+                data[key] = job[key]
+        return data
+
+    def cancel(self, job_id: str | None) -> dict | None:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        if job["status"] not in TERMINAL_STATUSES:
+            job["task"].cancel()
+        return {"id": job_id, "status": "CANCELLED"}
+
+    def wait(self, job_id: str, status: str, timeout: float = 30) -> dict:
+        deadline = time.monotonic() + timeout
+        while self.jobs[job_id]["status"] != status:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{job_id}: {self.jobs[job_id]['status']} (기다린 상태: {status})")
+            time.sleep(0.02)
+        return self.jobs[job_id]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._loop_thread.join(timeout=10)
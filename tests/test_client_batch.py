@@ -0,0 +1,52 @@
+import base64
+
+import pytest
+
+from generate_video_client import GenerateVideoClient
+from test_inputs import png
+
+
+@pytest.fixture
+def client(runpod_api):
+    client = GenerateVideoClient(runpod_api.endpoint_id, "test-key")
+    runpod_api.point(client)
+    client.poller.min_interval = 0.1
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def images(tmp_path):
+    folder = tmp_path / "images"
+    folder.mkdir()
+    (folder / "a.png").write_bytes(base64.b64decode(png(40)))
+    return folder
+
+
+def test_batch_jobs_have_no_wait_limit_by_default(client, runpod_api, images, tmp_path, monkeypatch):
+    track = client.poller.track
+    limits = []
+
+    def recording_track(job_id, **kwargs):
+        limits.append(kwargs["max_wait_time"])
+        return track(job_id, **kwargs)
+
+    monkeypatch.setattr(client.poller, "track", recording_track)
+    result = client.batch_process_images(str(images), str(tmp_path / "out"), steps=2, length=5, poll_interval=0.2)
+    assert result["successful"] == 1
+    # wait_for_completion 의 기본값(1800초)을 물려받지 않음
+    assert limits == [None]
+
+
+def test_timed_out_job_is_cancelled_before_retry(client, runpod_api, images, tmp_path):
+    # 스텝이 많아서 max_wait_time 안에 끝나지 않는 job
+    result = client.batch_process_images(
+        str(images), str(tmp_path / "out"), steps=5000, length=5, poll_interval=0.2,
+        max_wait_time=1, max_retries=1, retry_backoff=0.1
+    )
+    assert result["failed"] == 1
+    assert result["results"][0]["error"] == "TIMEOUT"
+    # 두 번 제출했고, 시간이 지난 job 은 다시 내기 전에 모두 취소함
+    assert len(runpod_api.jobs) == 2
+    for job_id in runpod_api.jobs:
+        assert runpod_api.wait(job_id, "CANCELLED")["status"] == "CANCELLED"
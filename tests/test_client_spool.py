@@ -0,0 +1,107 @@
+import base64
+import json
+import os
+
+import pytest
+
+from generate_video_client import GenerateVideoClient, load_json_spooled
+
+VIDEO = os.urandom(3000)
+VIDEO_B64 = base64.b64encode(VIDEO).decode("ascii")
+
+
+def chunked(text: str, size: int):
+    data = text.encode("utf-8")
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def body(document) -> str:
+    # json.dumps 는 "/" 를 escape 하지 않으므로 RunPod 처럼 "\/" 로 바꿔서 보냄
+    return json.dumps(document, ensure_ascii=False).replace("/", "\\/")
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64, 1 << 20])
+def test_data_url_is_spooled_across_chunk_splits(tmp_path, size):
+    document = {"status": "COMPLETED", "output": {"videoUrl": f"data:video/mp4;base64,{VIDEO_B64}", "seed": 7}}
+    spooled = set()
+    parsed = load_json_spooled(chunked(body(document), size), str(tmp_path), spooled_files=spooled)
+
+    output = parsed["output"]
+    assert "videoUrl" not in output
+    assert output["seed"] == 7
+    assert output["videoFile"].endswith(".mp4")
+    assert spooled == {output["videoFile"]}
+    with open(output["videoFile"], "rb") as f:
+        assert f.read() == VIDEO
+
+
+@pytest.mark.parametrize("size", [1, 4, 64])
+def test_escapes_in_other_strings_are_kept(tmp_path, size):
+    document = {
+        "note": 'quote " backslash \\ slash / tab \t 한글 ✓',
+        "videoUrl": f"data:video/mp4;base64,{VIDEO_B64}",
+        "short": "\\",
+    }
+    parsed = load_json_spooled(chunked(body(document), size), str(tmp_path))
+    assert parsed["note"] == document["note"]
+    assert parsed["short"] == "\\"
+    with open(parsed["videoFile"], "rb") as f:
+        assert f.read() == VIDEO
+
+
+def test_nested_objects_and_lists(tmp_path):
+    other = os.urandom(100)
+    document = {
+        "output": {
+            "videos": {"9": [f"data:video/mp4;base64,{VIDEO_B64}"]},
+            "result": {"videoUrl": f"data:video/mp4;base64,{VIDEO_B64}", "meta": {"video": "short"}},
+            "variants": [{"video": base64.b64encode(other).decode("ascii")}, {"seed": [1, {"x": None}]}],
+        }
+    }
+    parsed = load_json_spooled(chunked(body(document), 13), str(tmp_path))
+    output = parsed["output"]
+    # 스풀 대상 키가 아닌 값은 그대로
+    assert output["videos"] == document["output"]["videos"]
+    assert output["result"]["meta"] == {"video": "short"}
+    assert output["variants"][1] == {"seed": [1, {"x": None}]}
+    with open(output["result"]["videoFile"], "rb") as f:
+        assert f.read() == VIDEO
+    with open(output["variants"][0]["videoFile"], "rb") as f:
+        assert f.read() == other
+
+
+@pytest.mark.parametrize("value", ["https://bucket.example/20240101/abc/out.mp4", "s3://bucket/out.mp4", ""])
+def test_non_data_url_video_is_left_alone(tmp_path, value):
+    document = {"output": {"video": value, "videoUrl": value}}
+    parsed = load_json_spooled(chunked(body(document), 3), str(tmp_path))
+    assert parsed == document
+    assert os.listdir(tmp_path) == []
+
+
+def test_truncated_body_removes_spooled_files(tmp_path):
+    text = body({"output": {"videoUrl": f"data:video/mp4;base64,{VIDEO_B64}", "seed": 1}})
+    with pytest.raises(json.JSONDecodeError):
+        load_json_spooled(chunked(text[:-5], 64), str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_client_deletes_unsaved_spool_files(tmp_path):
+    client = GenerateVideoClient("endpoint", "key", spool_dir=str(tmp_path / "spool"), spool_outputs=True)
+    document = {"status": "COMPLETED", "output": {"videoUrl": f"data:video/mp4;base64,{VIDEO_B64}"}}
+    saved = client._parse_json(chunked(body(document), 64))
+    unsaved = client._parse_json(chunked(body(document), 64))
+
+    assert client.save_video_result(saved, str(tmp_path / "out.mp4"))
+    client.close()
+    assert not os.path.exists(unsaved["output"]["videoFile"])
+    assert os.listdir(tmp_path / "spool") == []
+    with open(tmp_path / "out.mp4", "rb") as f:
+        assert f.read() == VIDEO
+
+
+def test_client_keeps_video_url_by_default(tmp_path):
+    client = GenerateVideoClient("endpoint", "key", spool_dir=str(tmp_path))
+    document = {"status": "COMPLETED", "output": {"videoUrl": f"data:video/mp4;base64,{VIDEO_B64}"}}
+    parsed = client._parse_json(chunked(body(document), 64))
+    assert parsed == document
+    client.close()
@@ -0,0 +1,100 @@
+import json
+import time
+import urllib.request
+
+import pytest
+
+from generate_video_client import GenerateVideoClient
+from test_inputs import png
+
+
+@pytest.fixture
+def client(runpod_api):
+    client = GenerateVideoClient(runpod_api.endpoint_id, "test-key")
+    runpod_api.point(client)
+    yield client
+    client.close()
+
+
+def job_input(**overrides) -> dict:
+    return {"image_base64": png(30), "prompt": "webhook test", "seed": 1, "steps": 2, "length": 5, **overrides}
+
+
+def comfy_queue(fake_comfy: str) -> dict:
+    with urllib.request.urlopen(f"{fake_comfy}/queue", timeout=5) as response:
+        return json.loads(response.read())
+
+
+def test_webhook_resolves_job_without_polling(client, runpod_api):
+    # fallback 간격이 테스트보다 길어서, 끝났다는 걸 알 수 있는 경로는 webhook 뿐
+    url = client.enable_webhook("", host="127.0.0.1", port=0, fallback_interval=600)
+    job_id = client.submit_job(job_input())
+    assert job_id
+
+    started = time.monotonic()
+    result = client.wait_for_completion(job_id, max_wait_time=60)
+    assert result["status"] == "COMPLETED"
+    assert result["output"]["videoUrl"].startswith("data:video/mp4;base64,")
+    assert time.monotonic() - started < 30
+
+    assert [call["url"] for call in runpod_api.webhooks] == [url]
+    assert client.webhook.received == 1
+    assert client.poller.requests_sent == 0
+
+
+def test_failed_job_is_delivered_by_webhook(client, runpod_api):
+    client.enable_webhook("", host="127.0.0.1", port=0, fallback_interval=600)
+    job_id = client.submit_job(job_input(template="no-such-template"))
+
+    result = client.wait_for_completion(job_id, max_wait_time=60)
+    assert result["status"] == "FAILED"
+    assert "no-such-template" in result["error"]
+    assert client.poller.requests_sent == 0
+
+
+def test_lost_webhook_falls_back_to_polling(client, runpod_api):
+    runpod_api.drop_webhooks = True
+    client.enable_webhook("", host="127.0.0.1", port=0, fallback_interval=0.5)
+    job_id = client.submit_job(job_input())
+
+    result = client.wait_for_completion(job_id, max_wait_time=60)
+    assert result["status"] == "COMPLETED"
+    assert runpod_api.webhooks and runpod_api.webhooks[0]["dropped"]
+    assert client.webhook.received == 0
+    assert client.poller.requests_sent >= 1
+
+
+def test_webhook_with_wrong_token_is_rejected(client):
+    url = client.enable_webhook("", host="127.0.0.1", port=0)
+    request = urllib.request.Request(
+        url.rsplit("/", 1)[0] + "/not-the-token", data=b'{"id": "x", "status": "COMPLETED"}', method="POST"
+    )
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request, timeout=5)
+    assert error.value.code == 404
+    assert client.webhook.received == 0
+
+
+def test_cancel_stops_running_job(client, runpod_api, fake_comfy):
+    client.enable_webhook("", host="127.0.0.1", port=0, fallback_interval=600)
+    # 스텝이 많아서 취소하지 않으면 한참 걸리는 job
+    job_id = client.submit_job(job_input(steps=5000, seed=2))
+    runpod_api.wait(job_id, "IN_PROGRESS")
+    deadline = time.monotonic() + 30
+    while not comfy_queue(fake_comfy)["queue_running"]:
+        assert time.monotonic() < deadline, "prompt 가 ComfyUI 에서 실행되지 않음"
+        time.sleep(0.05)
+
+    assert client.cancel_job(job_id)
+    result = client.wait_for_completion(job_id, max_wait_time=60)
+    assert result["status"] == "CANCELLED"
+
+    # handler 가 ComfyUI 에서도 prompt 를 내림
+    deadline = time.monotonic() + 30
+    while comfy_queue(fake_comfy)["queue_running"] or comfy_queue(fake_comfy)["queue_pending"]:
+        assert time.monotonic() < deadline, "취소된 prompt 가 ComfyUI 에 남아 있음"
+        time.sleep(0.05)
+
+
+def test_cancel_unknown_job_fails(client):
+    assert not client.cancel_job("job-does-not-exist")
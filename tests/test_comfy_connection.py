@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class ScriptedComfy:
+    """
+    POST /prompt 에서 연결을 끊는 ComfyUI 대역.
+    drops 의 각 값: "after" 는 prompt 를 큐에 넣은 뒤 응답 없이 끊음, "before" 는 넣지 않고 끊음,
+    "slow" 는 큐에 넣고 클라이언트 timeout 보다 늦게 응답
+    """
+
+    def __init__(self, drops: list[str]):
+        self.drops = list(drops)
+        self.posts = 0
+        self.queued: list[str] = []
+        api = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                api.posts += 1
+                drop = api.drops.pop(0) if api.drops else None
+                if drop != "before":
+                    api.queued.append(body["prompt_id"])
+                if drop == "slow":
+                    time.sleep(1)
+                elif drop:
+                    self.close_connection = True
+                    return
+                self.reply({"prompt_id": body["prompt_id"], "number": len(api.queued)})
+
+            def do_GET(self):
+                if self.path == "/queue":
+                    self.reply({"queue_running": [], "queue_pending": [[i, pid, {}] for i, pid in enumerate(api.queued)]})
+                else:
+                    self.reply({})
+
+            def reply(self, data):
+                payload = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def scripted(handler, monkeypatch):
+    servers = []
+
+    def start(drops):
+        server = ScriptedComfy(drops)
+        servers.append(server)
+        conn = handler.ComfyUIConnection("127.0.0.1", server.server.server_address[1], "test-client")
+        monkeypatch.setattr(handler, "comfy", conn)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def test_prompt_queued_before_disconnect_is_not_sent_again(handler, scripted):
+    server = scripted(["after"])
+    assert handler.queue_prompt({"1": {}}, "prompt-a") == {"prompt_id": "prompt-a"}
+    assert server.posts == 1
+    assert server.queued == ["prompt-a"]
+
+
+def test_prompt_dropped_before_queueing_is_sent_again(handler, scripted):
+    server = scripted(["before"])
+    assert handler.queue_prompt({"1": {}}, "prompt-b")["prompt_id"] == "prompt-b"
+    assert server.posts == 2
+    assert server.queued == ["prompt-b"]
+
+
+def test_prompt_that_timed_out_is_not_sent_again(handler, scripted, monkeypatch):
+    monkeypatch.setattr(handler, "COMFY_HTTP_TIMEOUT", 0.3)
+    server = scripted(["slow"])
+    assert handler.queue_prompt({"1": {}}, "prompt-d") == {"prompt_id": "prompt-d"}
+    assert server.posts == 1
+
+
+def test_post_is_not_retried_by_the_connection(handler, scripted):
+    server = scripted(["before"])
+    with pytest.raises(handler.STALE_CONNECTION_ERRORS):
+        handler.comfy.request("POST", "/prompt", {"prompt_id": "prompt-c"}, retry=False)
+    assert server.posts == 1
+
+
+def test_get_is_retried_on_a_new_connection(handler, scripted):
+    server = scripted([])
+    handler.comfy.get_json("/queue")
+    # 서버가 keep-alive 연결을 닫은 뒤에도 GET 은 새 연결로 다시 보냄
+    handler.comfy._http_conn().sock.close()
+    assert handler.comfy.get_json("/queue") == {"queue_running": [], "queue_pending": []}
@@ -0,0 +1,112 @@
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from test_inputs import png
+
+
+class ImageServer:
+    """/<name>.png 로 이미지를 주는 서버. validators 면 ETag 를 붙이고 If-None-Match 가 맞으면 304"""
+
+    def __init__(self):
+        self.images: dict[str, bytes] = {}
+        self.validators = True
+        self.requests: list[tuple[str, int]] = []
+        api = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = api.images[self.path.lstrip("/")]
+                etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+                if api.validators and self.headers.get("If-None-Match") == etag:
+                    api.requests.append((self.path, 304))
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                api.requests.append((self.path, 200))
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(body)))
+                if api.validators:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/{name}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def server(handler, monkeypatch):
+    monkeypatch.setattr(handler, "_input_ref_cache", OrderedDict())
+    server = ImageServer()
+    server.images["a.png"] = base64.b64decode(png(70))
+    yield server
+    server.close()
+
+
+def test_url_is_reused_within_ttl(handler, server):
+    first = handler.fetch_input_ref(server.url("a.png"))
+    assert handler.fetch_input_ref(server.url("a.png")) == first
+    assert server.requests == [("/a.png", 200)]
+
+
+def test_url_is_revalidated_after_ttl(handler, server, monkeypatch):
+    monkeypatch.setattr(handler, "INPUT_REF_TTL", 0)
+    first = handler.fetch_input_ref(server.url("a.png"))
+    assert handler.fetch_input_ref(server.url("a.png")) == first
+    # 바뀌지 않았으면 304 로 확인만 하고 다시 받지 않음
+    assert server.requests == [("/a.png", 200), ("/a.png", 304)]
+
+    server.images["a.png"] = base64.b64decode(png(71))
+    changed = handler.fetch_input_ref(server.url("a.png"))
+    assert changed != first
+    with open(changed, "rb") as f:
+        assert f.read() == server.images["a.png"]
+
+
+def test_url_without_validators_is_downloaded_again(handler, server, monkeypatch):
+    monkeypatch.setattr(handler, "INPUT_REF_TTL", 0)
+    server.validators = False
+    first = handler.fetch_input_ref(server.url("a.png"))
+    # 내용이 같으면 같은 캐시 파일
+    assert handler.fetch_input_ref(server.url("a.png")) == first
+    assert server.requests == [("/a.png", 200), ("/a.png", 200)]
+
+
+def test_remembered_refs_are_bounded(handler, server, monkeypatch):
+    monkeypatch.setattr(handler, "INPUT_REF_CACHE_MAX_ENTRIES", 2)
+    for shade, name in enumerate(["a.png", "b.png", "c.png"]):
+        server.images[name] = base64.b64decode(png(80 + shade))
+    handler.fetch_input_ref(server.url("a.png"))
+    handler.fetch_input_ref(server.url("b.png"))
+    # a 를 다시 쓰면 가장 오래 안 쓰인 것은 b
+    handler.fetch_input_ref(server.url("a.png"))
+    handler.fetch_input_ref(server.url("c.png"))
+    assert list(handler._input_ref_cache) == [server.url("a.png"), server.url("c.png")]
+
+
+def test_evicted_file_is_forgotten(handler, server, monkeypatch):
+    cached = handler.fetch_input_ref(server.url("a.png"))
+    monkeypatch.setattr(handler, "INPUT_CACHE_MAX_BYTES", 0)
+    handler.evict_input_cache(force=True)
+    assert not os.path.exists(cached)
+    assert server.url("a.png") not in handler._input_ref_cache
+
+    assert handler.fetch_input_ref(server.url("a.png")) == cached
+    assert server.requests == [("/a.png", 200), ("/a.png", 200)]
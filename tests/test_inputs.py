@@ -0,0 +1,79 @@
+import base64
+import os
+import struct
+import zlib
+
+
+def png(shade: int) -> str:
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    raw = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+    raw += chunk(b"IDAT", zlib.compress(b"\x00" + bytes([shade]) * 3)) + chunk(b"IEND", b"")
+    return base64.b64encode(raw).decode("ascii")
+
+
+def test_same_name_different_images_get_separate_files(handler):
+    first, first_pins = handler.save_input_images([("john-wick_cut.png", png(10))])
+    second, second_pins = handler.save_input_images([("john-wick_cut.png", png(200))])
+    try:
+        path_a, path_b = first[0], second[0]
+        assert path_a != path_b
+        assert os.path.basename(path_a).startswith("john-wick_cut_")
+        # 두 번째 job 이 저장해도 첫 번째 job 의 파일은 그대로
+        with open(path_a, "rb") as f:
+            assert f.read() == base64.b64decode(png(10))
+    finally:
+        handler.release_input_images(first_pins)
+        handler.release_input_images(second_pins)
+
+
+def test_load_image_inputs_are_renamed(handler):
+    workflow = {
+        "1": {"class_type": "LoadImage", "inputs": {"image": "john-wick_cut.png"}},
+        "2": {"class_type": "LoadImage", "inputs": {"image": "other.png"}},
+        "3": {"class_type": "KSampler", "inputs": {"seed": 1}},
+    }
+    renamed = handler.rename_input_images(workflow, {"john-wick_cut.png": "john-wick_cut_0123456789abcdef.png"})
+    assert renamed["1"]["inputs"]["image"] == "john-wick_cut_0123456789abcdef.png"
+    assert renamed["2"]["inputs"]["image"] == "other.png"
+    # 원본 워크플로우는 바꾸지 않음
+    assert workflow["1"]["inputs"]["image"] == "john-wick_cut.png"
+
+
+def test_every_input_naming_an_uploaded_file_is_renamed(handler):
+    workflow = {
+        "1": {"class_type": "VHS_LoadVideo", "inputs": {"video": "clip.mp4", "frame_rate": 16}},
+        "2": {"class_type": "LoadImageMask", "inputs": {"image": "mask.png", "channel": "alpha"}},
+        "3": {"class_type": "WanVideoStartEnd", "inputs": {"start_image": "clip.mp4", "end_image": ["1", 0], "mode": "mask.png x"}},
+    }
+    renamed = handler.rename_input_images(workflow, {"clip.mp4": "clip_0123.mp4", "mask.png": "mask_4567.png"})
+    assert renamed["1"]["inputs"] == {"video": "clip_0123.mp4", "frame_rate": 16}
+    assert renamed["2"]["inputs"] == {"image": "mask_4567.png", "channel": "alpha"}
+    # 링크와 이름이 정확히 같지 않은 문자열은 그대로
+    assert renamed["3"]["inputs"] == {"start_image": "clip_0123.mp4", "end_image": ["1", 0], "mode": "mask.png x"}
+
+
+def test_release_unpins_exactly_the_pinned_blobs(handler):
+    paths, pins = handler.save_input_images([("pin.png", png(30)), (None, png(31))])
+    assert all(handler._input_cache_pins.get(pin) for pin in pins)
+    # INPUT_DIR 의 이름이 다른 파일로 바뀌어도 고정한 캐시 파일 기준으로 풂
+    os.remove(paths[0])
+    other, other_pins = handler.save_input_images([(None, png(32))])
+    os.link(other[0], paths[0])
+    handler.release_input_images(pins)
+    assert not any(pin in handler._input_cache_pins for pin in pins)
+    assert handler._input_cache_pins.get(other_pins[0]) == 1
+    handler.release_input_images(other_pins)
+    assert other_pins[0] not in handler._input_cache_pins
+
+
+def test_failed_save_releases_its_pins(handler):
+    before = dict(handler._input_cache_pins)
+    try:
+        handler.save_input_images([(None, png(40)), ("bad.png", "not base64!")])
+    except Exception:
+        pass
+    else:
+        raise AssertionError("잘못된 입력인데 저장됨")
+    assert handler._input_cache_pins == before
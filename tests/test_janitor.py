@@ -0,0 +1,67 @@
+import asyncio
+import os
+import threading
+
+from test_inputs import png
+
+
+def test_concurrent_sweeps_count_every_removed_file(handler, tmp_path):
+    janitor = handler.OutputJanitor([str(tmp_path)])
+    paths = []
+    for i in range(200):
+        path = tmp_path / f"out_{i:03d}.mp4"
+        path.write_bytes(b"x" * 10)
+        paths.append(str(path))
+    kept = tmp_path / "kept.mp4"
+    kept.write_bytes(b"y")
+    janitor.release(paths)
+
+    # 여러 스레드가 같은 파일을 지우려 해도 stats 는 실제로 지운 만큼만 늘어남
+    threads = [threading.Thread(target=janitor.sweep) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert janitor.summary() == {"sweeps": 4, "files_removed": 200, "bytes_reclaimed": 2000}
+    assert [p.name for p in tmp_path.iterdir()] == ["kept.mp4"]
+
+
+def test_pinned_output_survives_until_unpinned(handler, tmp_path, monkeypatch):
+    monkeypatch.setattr(handler, "OUTPUT_QUOTA_BYTES", 0)
+    monkeypatch.setattr(handler, "OUTPUT_GRACE_SECONDS", 0)
+    janitor = handler.OutputJanitor([str(tmp_path)])
+    in_use = tmp_path / "in_use.mp4"
+    in_use.write_bytes(b"x" * 10)
+    other = tmp_path / "other.mp4"
+    other.write_bytes(b"y" * 10)
+
+    with janitor.pinned([str(in_use)]):
+        # 반환이 끝나 release 돼도, 용량 한도를 넘어도 고정된 동안은 지우지 않음
+        janitor.release([str(in_use)])
+        janitor.sweep()
+        assert [p.name for p in tmp_path.iterdir()] == ["in_use.mp4"]
+
+    # 고정이 풀리면 release 된 파일은 다음 정리 때 삭제
+    monkeypatch.setattr(handler, "OUTPUT_QUOTA_BYTES", 1024)
+    janitor.sweep()
+    assert list(tmp_path.iterdir()) == []
+    assert janitor._pins == {}
+
+
+def test_job_outputs_are_pinned_while_they_are_returned(handler, fake_comfy, monkeypatch):
+    pinned = []
+    finish_job = handler.finish_job
+
+    def recording_finish_job(job_input, outputs, *args):
+        pinned.append({p: handler.janitor._pins.get(os.path.abspath(p)) for p in handler.output_paths(outputs)})
+        return finish_job(job_input, outputs, *args)
+
+    monkeypatch.setattr(handler, "finish_job", recording_finish_job)
+    job_input = {"image_base64": png(50), "prompt": "pin", "seed": 5, "steps": 2, "length": 5}
+    result = asyncio.run(handler.handler({"id": "pin-test", "input": job_input}))
+    assert "error" not in result, result
+
+    (counts,) = pinned
+    assert counts and set(counts.values()) == {1}
+    assert not any(p in handler.janitor._pins for p in map(os.path.abspath, counts))
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def volume(tmp_path):
+    """네트워크 볼륨 흉내: loras 폴더에 100 바이트짜리 모델 파일"""
+    folder = tmp_path / "volume" / "loras"
+    folder.mkdir(parents=True)
+
+    def add(name: str, size: int = 100) -> str:
+        path = folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(os.urandom(size))
+        return str(path)
+
+    add.folder = str(folder)
+    return add
+
+
+@pytest.fixture
+def stage(handler, volume, tmp_path, monkeypatch):
+    monkeypatch.setattr(handler, "MODEL_STAGE_MIN_FREE_BYTES", 0)
+    monkeypatch.setattr(handler, "MODEL_STAGE_FOLDERS", set())
+    stage = handler.ModelStage([("loras", volume.folder)], str(tmp_path / "models"), max_bytes=250)
+    yield stage
+    stage._executor.shutdown(wait=True)
+
+
+def settle(stage):
+    """예약된 복사가 끝날 때까지 대기 (복사 스레드는 하나)"""
+    stage._executor.submit(lambda: None).result(timeout=30)
+
+
+def lora_workflow(*names) -> dict:
+    return {str(i): {"class_type": "LoraLoader", "inputs": {"lora": name, "strength": 1.0}} for i, name in enumerate(names)}
+
+
+def staged_names(stage) -> list[str]:
+    return sorted(os.path.relpath(path, stage.models_dir) for _, _, path, _ in stage._entries())
+
+
+def stage_copy(stage, *names):
+    """복사를 예약하고 끝날 때까지 기다린 뒤, 이름 순서대로 마지막 사용 시각을 1초씩 벌려둠"""
+    workflow, pinned = stage.apply(lora_workflow(*names))
+    assert pinned == []
+    settle(stage)
+    for i, name in enumerate(names):
+        _, meta_path = stage._paths("loras", name)
+        os.utime(meta_path, (1000 + i, 1000 + i))
+
+
+def test_apply_rewrites_to_the_local_copy(stage, volume):
+    source = volume("wan/high.safetensors")
+    workflow = lora_workflow("wan/high.safetensors", "missing.safetensors")
+
+    # 처음에는 원래 이름 그대로 (이번 job 은 볼륨에서 읽음) + 백그라운드 복사
+    first, pinned = stage.apply(workflow)
+    assert first is workflow and pinned == []
+    settle(stage)
+
+    second, pinned = stage.apply(workflow)
+    staged = os.path.join(stage.models_dir, "loras", "_staged", "wan", "high.safetensors")
+    assert second["0"]["inputs"] == {"lora": "_staged/wan/high.safetensors", "strength": 1.0}
+    assert second["1"] == workflow["1"]
+    assert workflow["0"]["inputs"]["lora"] == "wan/high.safetensors"
+    assert pinned == [staged]
+    with open(staged, "rb") as a, open(source, "rb") as b:
+        assert a.read() == b.read()
+    stage.release(pinned)
+    assert stage._in_use == {}
+    assert (stage.stats["hits"], stage.stats["misses"], stage.stats["copies"]) == (1, 1, 1)
+
+    # 원본이 바뀌면 사본을 쓰지 않음
+    volume("wan/high.safetensors", size=120)
+    assert stage.apply(workflow)[0]["0"]["inputs"]["lora"] == "wan/high.safetensors"
+    settle(stage)
+
+
+def test_least_recently_used_copy_is_evicted_first(stage, volume):
+    for name in ("a.safetensors", "b.safetensors", "c.safetensors"):
+        volume(name)
+    stage_copy(stage, "a.safetensors", "b.safetensors")
+    # a 를 다시 쓰면 가장 오래 안 쓰인 사본은 b
+    _, pinned = stage.apply(lora_workflow("a.safetensors"))
+    stage.release(pinned)
+
+    stage_copy(stage, "c.safetensors")
+    assert staged_names(stage) == ["loras/_staged/a.safetensors", "loras/_staged/c.safetensors"]
+    assert (stage.stats["evictions"], stage.stats["bytes_evicted"]) == (1, 100)
+
+
+def test_eviction_skips_copies_in_use(stage, volume):
+    for name in ("a.safetensors", "b.safetensors", "c.safetensors", "d.safetensors"):
+        volume(name)
+    stage_copy(stage, "a.safetensors", "b.safetensors")
+    # a 가 가장 오래됐지만 큐에 넣은 prompt 가 쓰는 중
+    _, pinned = stage.apply(lora_workflow("a.safetensors"))
+    _, meta_path = stage._paths("loras", "a.safetensors")
+    os.utime(meta_path, (1, 1))
+
+    stage_copy(stage, "c.safetensors")
+    assert staged_names(stage) == ["loras/_staged/a.safetensors", "loras/_staged/c.safetensors"]
+
+    # 쓰는 중인 사본만 남아 자리를 만들 수 없으면 복사하지 않음
+    _, more = stage.apply(lora_workflow("c.safetensors"))
+    stage.apply(lora_workflow("d.safetensors"))
+    settle(stage)
+    assert staged_names(stage) == ["loras/_staged/a.safetensors", "loras/_staged/c.safetensors"]
+    stage.release(pinned + more)
@@ -0,0 +1,101 @@
+import base64
+import os
+import subprocess
+import sys
+import tracemalloc
+
+import pytest
+
+from conftest import REPO_DIR
+
+
+def write_output(tmp_path, name: str, data: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("size", [0, 1, 5, 6, 7, 1000])
+def test_data_url_matches_base64_across_chunks(handler, monkeypatch, tmp_path, size):
+    # 청크 경계(3의 배수)에 걸리는 크기 / 안 걸리는 크기 모두 한 번에 인코딩한 것과 같아야 함
+    monkeypatch.setattr(handler, "OUTPUT_CHUNK_SIZE", 6)
+    data = os.urandom(size)
+    path = write_output(tmp_path, "clip.mp4", data)
+    url = handler.encode_file_to_data_url(path)
+    assert url == "data:video/mp4;base64," + base64.b64encode(data).decode("ascii")
+
+
+def inline_cap(**env) -> int:
+    """환경 변수 env 로 handler 를 새로 import 했을 때의 MAX_INLINE_OUTPUT_BYTES"""
+    env = {k: v for k, v in {**os.environ, **env}.items() if v is not None}
+    code = "import handler; print(handler.MAX_INLINE_OUTPUT_BYTES)"
+    out = subprocess.run([sys.executable, "-c", code], env=env, cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    return int(out.stdout.split()[-1])
+
+
+def test_inline_cap_defaults_to_unlimited_without_s3():
+    # S3 가 없으면 큰 출력도 예전처럼 data URL 로 반환
+    assert inline_cap(S3_BUCKET=None, MAX_INLINE_OUTPUT_MB=None) == 0
+    assert inline_cap(S3_BUCKET="outputs", MAX_INLINE_OUTPUT_MB=None) == 16 * 1024 * 1024
+    assert inline_cap(S3_BUCKET=None, MAX_INLINE_OUTPUT_MB="4") == 4 * 1024 * 1024
+
+
+def test_large_output_is_inlined_without_s3(handler, monkeypatch, tmp_path):
+    monkeypatch.setattr(handler, "s3_uploader", None)
+    monkeypatch.setattr(handler, "MAX_INLINE_OUTPUT_BYTES", 0)
+    data = os.urandom(64 * 1024)
+    path = write_output(tmp_path, "large.mp4", data)
+    result = finish(handler, {"videos": {"9": [path]}})
+    assert result["videoUrl"] == "data:video/mp4;base64," + base64.b64encode(data).decode("ascii")
+
+
+def test_data_url_is_built_without_a_second_copy(handler, monkeypatch, tmp_path):
+    monkeypatch.setattr(handler, "OUTPUT_CHUNK_SIZE", 3 * 1024)
+    path = write_output(tmp_path, "clip.mp4", os.urandom(3 * 1024 * 1024))
+    tracemalloc.start()
+    try:
+        url = handler.encode_file_to_data_url(path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # 청크 목록 + 이어 붙인 결과(약 2배)가 아니라 결과 크기 정도만 씀
+    assert peak < len(url) * 1.2
+
+
+def test_output_over_inline_cap_is_rejected(handler, monkeypatch, tmp_path):
+    monkeypatch.setattr(handler, "MAX_INLINE_OUTPUT_BYTES", 10)
+    path = write_output(tmp_path, "clip.mp4", b"x" * 11)
+    with pytest.raises(ValueError, match="S3_BUCKET"):
+        handler.encode_file_to_data_url(path)
+
+
+class RecordingUploader:
+    def __init__(self):
+        self.uploaded = []
+
+    def upload(self, path: str, key_prefix: str) -> str:
+        self.uploaded.append(path)
+        return f"https://bucket.example/{key_prefix}/{os.path.basename(path)}"
+
+
+def finish(handler, outputs: dict, output_mode: str = "inline") -> dict:
+    timer = handler.JobTimer()
+    profiler = handler.ExecutionProfiler({}, timer)
+    return handler.finish_job({}, outputs, None, {"video"}, timer, profiler, output_mode, None, False)
+
+
+def test_output_over_inline_cap_falls_back_to_s3(handler, monkeypatch, tmp_path):
+    uploader = RecordingUploader()
+    monkeypatch.setattr(handler, "s3_uploader", uploader)
+    monkeypatch.setattr(handler, "MAX_INLINE_OUTPUT_BYTES", 10)
+    small = write_output(tmp_path, "small.mp4", b"x" * 10)
+    large = write_output(tmp_path, "large.mp4", b"x" * 11)
+
+    result = finish(handler, {"videos": {"9": [large]}})
+    assert result["videoUrl"].startswith("https://bucket.example/")
+    assert uploader.uploaded == [large]
+
+    # 한도 이하 파일은 그대로 data URL
+    result = finish(handler, {"videos": {"9": [small]}})
+    assert result["videoUrl"].startswith("data:video/mp4;base64,")
+    assert uploader.uploaded == [large]
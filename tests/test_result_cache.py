@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def cache(handler, tmp_path, monkeypatch):
+    monkeypatch.setattr(handler, "RESULT_CACHE_WAIT_INTERVAL", 0.05)
+    return handler.ResultCache(str(tmp_path / "cache"), max_bytes=250)
+
+
+@pytest.fixture
+def output(tmp_path):
+    """size 바이트짜리 출력 파일을 만들어 {"videos": {"1": [path]}} 로 반환"""
+
+    def make(name: str, size: int = 100) -> dict:
+        path = tmp_path / "outputs" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(os.urandom(size))
+        return {"videos": {"1": [str(path)]}}
+
+    return make
+
+
+def in_thread(target, *args):
+    result = {}
+
+    def run():
+        try:
+            result["value"] = target(*args)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_miss_then_hit(cache, output):
+    assert cache.acquire("key-a") is None
+    cache.store("key-a", output("a.mp4"))
+
+    hit = cache.acquire("key-a")
+    (path,) = hit["videos"]["1"]
+    assert path.startswith(cache.root) and os.path.getsize(path) == 100
+    cache.release("key-a")
+    assert (cache.stats["hits"], cache.stats["misses"], cache.stats["stores"]) == (1, 1, 1)
+    assert cache.hit_rate() == 0.5
+
+
+def test_same_key_is_computed_once(cache, output):
+    assert cache.acquire("key-b") is None
+    waiter, result = in_thread(cache.acquire, "key-b")
+    time.sleep(0.2)
+    # 먼저 잡은 job 이 저장할 때까지 기다림
+    assert waiter.is_alive()
+
+    cache.store("key-b", output("b.mp4"))
+    waiter.join(5)
+    assert result["value"]["videos"]["1"]
+    cache.release("key-b")
+    assert (cache.stats["hits"], cache.stats["misses"]) == (1, 1)
+
+
+def test_abandoned_key_is_handed_to_a_waiter(cache):
+    assert cache.acquire("key-c") is None
+    waiter, result = in_thread(cache.acquire, "key-c")
+    cache.abandon("key-c")
+    waiter.join(5)
+    # 기다리던 job 이 직접 실행하는 쪽이 됨
+    assert result == {"value": None}
+    assert cache.stats["misses"] == 2
+    cache.abandon("key-c")
+
+
+@pytest.mark.parametrize("stop", ["cancel", "deadline"])
+def test_waiting_stops_with_the_job(handler, cache, stop):
+    assert cache.acquire("key-d") is None
+    control = handler.JobControl(deadline=time.monotonic() + 0.3 if stop == "deadline" else None)
+    waiter, result = in_thread(cache.acquire, "key-d", control)
+    if stop == "cancel":
+        time.sleep(0.1)
+        control.cancel()
+    waiter.join(5)
+    assert isinstance(result["error"], handler.JobCancelled)
+    cache.abandon("key-d")
+
+
+def test_eviction_skips_entries_in_use(cache, output):
+    for key in ("old", "middle"):
+        assert cache.acquire(key) is None
+        cache.store(key, output(f"{key}.mp4"))
+        time.sleep(0.05)
+    # 가장 오래된 항목을 응답에 쓰는 중
+    assert cache.acquire("old") is not None
+    time.sleep(0.05)
+    os.utime(os.path.join(cache.root, "old", "manifest.json"), (1, 1))
+
+    assert cache.acquire("new") is None
+    cache.store("new", output("new.mp4"))
+    assert sorted(os.listdir(cache.root)) == ["new", "old"]
+    assert (cache.stats["evictions"], cache.stats["bytes_evicted"]) == (1, 100)
+
+    cache.release("old")
+    cache.max_bytes = 150
+    cache.evict()
+    # 다 쓴 뒤에는 다시 가장 오래 안 쓰인 항목부터 지움
+    assert sorted(os.listdir(cache.root)) == ["new"]
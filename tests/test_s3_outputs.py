@@ -0,0 +1,77 @@
+import asyncio
+import urllib.parse
+
+import pytest
+
+from test_inputs import png
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+BUCKET = "wan22-test-outputs"
+
+
+@pytest.fixture
+def s3(handler, monkeypatch):
+    """moto 로 띄운 가짜 S3 와 그 버킷을 쓰는 S3Uploader"""
+    for name, value in {
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_SESSION_TOKEN": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(handler, "S3_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        monkeypatch.setattr(handler, "s3_uploader", handler.S3Uploader(BUCKET))
+        yield client
+
+
+def run(handler, **job_input) -> dict:
+    job_input = {"image_base64": png(60), "prompt": "s3 test", "seed": 3, "steps": 2, "length": 5, **job_input}
+    return asyncio.run(handler.handler({"id": "s3-test", "input": job_input}))
+
+
+def key_of(url: str) -> str:
+    path = urllib.parse.urlparse(url).path
+    return urllib.parse.unquote(path.split(f"/{BUCKET}/", 1)[-1].lstrip("/"))
+
+
+def test_s3_output_mode_returns_urls_of_uploaded_files(handler, fake_comfy, s3):
+    result = run(handler, output_mode="s3", **{"return": ["video", "videos"]})
+    assert "error" not in result, result
+
+    url = result["videoUrl"]
+    # 기본 설정(S3_PRESIGN_EXPIRES)이면 presigned URL
+    assert url.startswith("https://") and "Signature=" in url
+    key = key_of(url)
+    assert key.startswith(handler.S3_PREFIX) and key.endswith(".mp4")
+
+    head = s3.head_object(Bucket=BUCKET, Key=key)
+    assert head["ContentType"] == "video/mp4"
+    assert head["ContentLength"] > 0
+    uploaded = {item["Key"] for item in s3.list_objects_v2(Bucket=BUCKET)["Contents"]}
+    assert {key_of(u) for urls in result["videos"].values() for u in urls} <= uploaded
+    # videoUrl 과 videos 에 같이 나오는 파일도 한 번만 올림
+    assert handler.s3_uploader.stats["files"] == len(uploaded)
+
+
+def test_inline_mode_does_not_upload_small_outputs(handler, fake_comfy, s3):
+    result = run(handler, output_mode="inline")
+    assert result["videoUrl"].startswith("data:video/mp4;base64,")
+    assert s3.list_objects_v2(Bucket=BUCKET).get("KeyCount", 0) == 0
+
+
+def test_upload_failure_fails_the_job(handler, fake_comfy, s3, monkeypatch):
+    monkeypatch.setattr(handler, "s3_uploader", handler.S3Uploader("bucket-that-does-not-exist"))
+    # 다른 실행 오류처럼 handler 밖으로 올라가서 RunPod 가 job 을 FAILED 로 처리
+    with pytest.raises(boto3.exceptions.S3UploadFailedError, match="NoSuchBucket"):
+        run(handler, output_mode="s3")
+
+
+def test_s3_output_mode_needs_a_bucket(handler, fake_comfy, monkeypatch):
+    monkeypatch.setattr(handler, "s3_uploader", None)
+    result = run(handler, output_mode="s3")
+    assert "S3_BUCKET" in result["error"]
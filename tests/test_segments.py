@@ -0,0 +1,108 @@
+import asyncio
+import base64
+import os
+
+import pytest
+
+from test_inputs import png
+
+
+@pytest.fixture
+def segmenting(handler, fake_comfy):
+    if not handler.FFMPEG_BIN:
+        pytest.skip("세그먼트 생성에는 ffmpeg 가 필요합니다.")
+    return handler
+
+
+def run(handler, seed: int) -> dict:
+    # 15 프레임을 5 프레임 세그먼트 3개로 생성
+    job_input = {"image_base64": png(90), "prompt": "segments", "seed": seed, "steps": 2, "length": 15, "segment_length": 5}
+    return asyncio.run(handler.handler({"id": f"segments-{seed}", "input": job_input}))
+
+
+def checkpoints(handler) -> dict[str, list[str]]:
+    root = handler.SEGMENT_CHECKPOINT_DIR
+    if not os.path.isdir(root):
+        return {}
+    return {key: sorted(os.listdir(os.path.join(root, key))) for key in os.listdir(root)}
+
+
+def frame_count(tmp_path, data_url: str) -> int:
+    import imageio_ffmpeg
+
+    path = tmp_path / "result.mp4"
+    path.write_bytes(base64.b64decode(data_url.split(",", 1)[1]))
+    return imageio_ffmpeg.count_frames_and_secs(str(path))[0]
+
+
+class CountingRunWorkflow:
+    """handler.run_workflow 를 감싸서 호출 횟수를 세고, fail_on 번째 호출에서 실패"""
+
+    def __init__(self, handler, fail_on: int | None = None):
+        self.run_workflow = handler.run_workflow
+        self.fail_on = fail_on
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise Exception("ComfyUI 실행 실패 (테스트)")
+        return self.run_workflow(*args, **kwargs)
+
+
+def test_segments_are_generated_and_joined(segmenting, tmp_path):
+    result = run(segmenting, seed=101)
+    assert "error" not in result, result
+
+    assert [(s["index"], s["frames"], s["resumed"]) for s in result["segments"]] == [(0, 5, False), (1, 5, False), (2, 5, False)]
+    assert frame_count(tmp_path, result["videoUrl"]) == 15
+    assert "concat" in result["timings"]["phases"]
+    # 결과를 돌려준 요청의 체크포인트는 지움
+    assert checkpoints(segmenting) == {}
+
+
+def test_failed_segment_resumes_from_checkpoint(segmenting, monkeypatch, tmp_path):
+    failing = CountingRunWorkflow(segmenting, fail_on=2)
+    monkeypatch.setattr(segmenting, "run_workflow", failing)
+    with pytest.raises(Exception, match="테스트"):
+        run(segmenting, seed=202)
+    # 첫 세그먼트는 체크포인트로 남음
+    (saved,) = checkpoints(segmenting).values()
+    assert saved == ["segment_000.mp4", "segment_000_last.png"]
+
+    retry = CountingRunWorkflow(segmenting)
+    monkeypatch.setattr(segmenting, "run_workflow", retry)
+    result = run(segmenting, seed=202)
+    assert "error" not in result, result
+    assert [s["resumed"] for s in result["segments"]] == [True, False, False]
+    assert retry.calls == 2
+    assert frame_count(tmp_path, result["videoUrl"]) == 15
+    assert checkpoints(segmenting) == {}
+
+
+def test_failed_concat_keeps_every_segment(segmenting, monkeypatch, tmp_path):
+    concat_videos = segmenting.concat_videos
+
+    def broken_concat(paths, output_path):
+        raise Exception("ffmpeg 실패 (테스트)")
+
+    monkeypatch.setattr(segmenting, "concat_videos", broken_concat)
+    with pytest.raises(Exception, match="테스트"):
+        run(segmenting, seed=303)
+    (saved,) = checkpoints(segmenting).values()
+    assert [name for name in saved if name.endswith(".mp4")] == ["segment_000.mp4", "segment_001.mp4", "segment_002.mp4"]
+
+    # 다시 오면 ComfyUI 를 거치지 않고 이어붙이기만 함
+    monkeypatch.setattr(segmenting, "concat_videos", concat_videos)
+    retry = CountingRunWorkflow(segmenting)
+    monkeypatch.setattr(segmenting, "run_workflow", retry)
+    result = run(segmenting, seed=303)
+    assert [s["resumed"] for s in result["segments"]] == [True, True, True]
+    assert retry.calls == 0
+    assert frame_count(tmp_path, result["videoUrl"]) == 15
+
+
+def test_segments_need_a_start_image(handler):
+    job_input = {"prompt": "segments", "seed": 404, "steps": 2, "length": 15, "segment_length": 5}
+    result = asyncio.run(handler.handler({"id": "segments-no-image", "input": job_input}))
+    assert "시작 이미지" in result["error"]
@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from generate_video_client import GenerateVideoClient
+
+
+class StubStatus:
+    """
+    RunPod /status 대역. job 마다 정해둔 상태를 차례로 돌려주고 (마지막 상태는 반복), 요청 시각을 기록.
+    /stream 은 404 라서 poller 는 /status 만 씀
+    """
+
+    def __init__(self):
+        self.scripts: dict[str, list[dict]] = {}
+        self.polls: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+        api = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                kind, job_id = self.path.strip("/").split("/")[-2:]
+                if kind != "status" or job_id not in api.scripts:
+                    self.reply(404, {"error": "not found"})
+                    return
+                with api._lock:
+                    api.polls.setdefault(job_id, []).append(time.monotonic())
+                    script = api.scripts[job_id]
+                    data = script.pop(0) if len(script) > 1 else script[0]
+                self.reply(200, {"id": job_id, **data})
+
+            def reply(self, code: int, data: dict):
+                payload = json.dumps(data).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v2/stub"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def job(self, job_id: str, *statuses: str, output=None) -> str:
+        script = [{"status": status} for status in statuses]
+        if statuses[-1] == "COMPLETED":
+            script[-1]["output"] = output or {"job": job_id}
+        self.scripts[job_id] = script
+        return job_id
+
+    def gaps(self, job_id: str) -> list[float]:
+        times = self.polls.get(job_id, [])
+        return [b - a for a, b in zip(times, times[1:])]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    stub = StubStatus()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def client(stub):
+    client = GenerateVideoClient("stub", "test-key")
+    client.status_url = f"{stub.base_url}/status"
+    client.stream_url = f"{stub.base_url}/stream"
+    yield client
+    client.close()
+
+
+def poller_with(client, **intervals):
+    for name, value in intervals.items():
+        setattr(client.poller, name, value)
+    return client.poller
+
+
+def job_state(status: str, interval: float, max_interval: float = 30.0, **fields) -> dict:
+    return {
+        "status": status, "interval": interval, "max_interval": max_interval, "fallback_interval": None,
+        "running_since": time.time(), "eta": None, **fields,
+    }
+
+
+def test_queued_interval_backs_off_up_to_the_queue_cap(client):
+    poller = poller_with(client, min_interval=1.0, queue_interval=15.0)
+    job = job_state("IN_QUEUE", 1.0)
+    intervals = [poller._next_interval(job) for _ in range(10)]
+    assert intervals[:4] == [1.5, 2.25, 3.375, 5.0625]
+    assert intervals[-1] == 15.0 and intervals == sorted(intervals)
+
+
+def test_running_interval_follows_the_expected_finish(client):
+    poller = poller_with(client, min_interval=1.0)
+    # ETA 가 있으면 남은 시간의 절반, 끝날 때가 되면 최소 간격
+    assert poller._next_interval(job_state("IN_PROGRESS", 5.0, eta=20)) == 10
+    assert poller._next_interval(job_state("IN_PROGRESS", 5.0, eta=0.5)) == 1.0
+    # ETA 가 없으면 이전 job 들의 실행 시간으로 추정
+    poller.expected_duration = 60
+    assert poller._next_interval(job_state("IN_PROGRESS", 5.0, running_since=time.time() - 20)) == pytest.approx(20, abs=0.1)
+
+
+def test_per_job_max_interval_clamps_every_state(client):
+    poller = poller_with(client, min_interval=0.1, queue_interval=15.0)
+    assert poller._next_interval(job_state("IN_QUEUE", 10.0, max_interval=2.0)) == 2.0
+    assert poller._next_interval(job_state("IN_PROGRESS", 10.0, max_interval=2.0, eta=600)) == 2.0
+
+
+def test_polling_backs_off_and_respects_max_interval(client, stub):
+    poller_with(client, min_interval=0.05, max_interval=30.0, queue_interval=30.0)
+    job_id = stub.job("job-backoff", *["IN_QUEUE"] * 6, *["IN_PROGRESS"] * 3, "COMPLETED")
+    result = client.poller.track(job_id, max_interval=0.3).result(timeout=30)
+    assert result["status"] == "COMPLETED" and result["output"] == {"job": job_id}
+
+    gaps = stub.gaps(job_id)
+    assert len(gaps) == 9
+    # 큐에 있는 동안 간격이 늘어나고, job 의 max_interval(0.3초)을 넘지 않음
+    assert gaps[0] < gaps[3]
+    assert max(gaps) < 0.3 + 0.2
+
+
+@pytest.mark.parametrize("max_wait_time", [0.5, None])
+def test_timeout_resolution(client, stub, max_wait_time):
+    poller_with(client, min_interval=0.05, max_interval=0.1)
+    job_id = stub.job(f"job-stuck-{max_wait_time}", "IN_QUEUE")
+    future = client.poller.track(job_id, max_wait_time=max_wait_time)
+    if max_wait_time is None:
+        # 제한이 없으면 끝날 때까지 계속 기다림
+        time.sleep(1)
+        assert not future.done()
+        stub.scripts[job_id] = [{"status": "COMPLETED", "output": {}}]
+        assert future.result(timeout=10)["status"] == "COMPLETED"
+    else:
+        started = time.monotonic()
+        assert future.result(timeout=10) == {"status": "TIMEOUT", "job_id": job_id}
+        assert time.monotonic() - started < max_wait_time + 0.5
+    # 끝난 job 은 더 폴링하지 않음
+    polls = len(stub.polls[job_id])
+    time.sleep(0.3)
+    assert len(stub.polls[job_id]) == polls
+
+
+def test_concurrent_track_from_many_threads(client, stub):
+    poller_with(client, min_interval=0.05, max_interval=0.2)
+    job_ids = [stub.job(f"job-{i:02d}", *["IN_PROGRESS"] * (i % 4), "COMPLETED") for i in range(24)]
+    before = set(threading.enumerate())
+    # 같은 job 을 여러 스레드가 동시에 track 해도 future 는 하나
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        futures = list(pool.map(client.poller.track, job_ids * 2))
+    assert all(a is b for a, b in zip(futures[:24], futures[24:]))
+
+    results = [future.result(timeout=30) for future in futures[:24]]
+    assert [r["output"] for r in results] == [{"job": job_id} for job_id in job_ids]
+    assert client.poller._jobs == {}
+    # 폴링 스레드는 client 하나에 하나
+    assert [t.name for t in set(threading.enumerate()) - before] == ["runpod-status-poller"]
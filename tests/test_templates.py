@@ -0,0 +1,56 @@
+import pytest
+
+
+def resolve(workflow: dict, value):
+    """[node_id, 0] 링크를 INTConstant 값으로 풂"""
+    while isinstance(value, list):
+        value = workflow[value[0]]["inputs"]["value"]
+    return value
+
+
+def sampler_steps(workflow: dict) -> dict[str, tuple[int, int, int]]:
+    """WanVideoSampler 별 (steps, start_step, end_step)"""
+    return {
+        node_id: tuple(resolve(workflow, node["inputs"][key]) for key in ("steps", "start_step", "end_step"))
+        for node_id, node in workflow.items()
+        if node.get("class_type") == "WanVideoSampler"
+    }
+
+
+def test_warm_up_runs_both_samplers(handler):
+    params = {**handler.WARMUP_DEFAULT_PARAMS, "image": "warmup.png"}
+    for name in ("i2v", "flf2v"):
+        workflow = handler.TEMPLATES[name].apply({**params, **({"end_image": "end.png"} if name == "flf2v" else {})})
+        samplers = sampler_steps(workflow)
+        high_steps, _, high_end = samplers["220"]
+        low_steps, low_start, _ = samplers["540"]
+        # high-noise 는 0 ~ 경계, low-noise 는 경계 ~ 끝: 둘 다 1 스텝 이상 실행
+        assert 0 < high_end < high_steps
+        assert low_start < low_steps
+
+
+def split_of(handler, **params) -> tuple[int, int]:
+    workflow = handler.TEMPLATES["i2v"].apply({"image": "in.png", **params})
+    samplers = sampler_steps(workflow)
+    assert samplers["220"][2] == samplers["540"][1]
+    return samplers["220"][0], samplers["220"][2]
+
+
+def test_split_step_follows_steps(handler):
+    # 템플릿 기본값 (8 스텝, 경계 4) 비율대로
+    assert split_of(handler) == (8, 4)
+    assert split_of(handler, steps=10) == (10, 5)
+    assert split_of(handler, steps=4) == (4, 2)
+    assert split_of(handler, steps=3) == (3, 2)
+    assert split_of(handler, steps=2) == (2, 1)
+
+
+def test_split_step_can_be_set(handler):
+    assert split_of(handler, steps=10, split_step=7) == (10, 7)
+    assert split_of(handler, split_step=2) == (8, 2)
+
+
+@pytest.mark.parametrize("params", [{"steps": 1}, {"steps": 6, "split_step": 6}, {"split_step": 0}, {"steps": "x"}])
+def test_split_step_must_leave_steps_for_both_models(handler, params):
+    with pytest.raises(ValueError):
+        handler.TEMPLATES["i2v"].apply({"image": "in.png", **params})
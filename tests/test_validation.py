@@ -0,0 +1,125 @@
+import pytest
+
+# 작은 /object_info: 로더 -> 샘플러 -> 저장
+SCHEMA = {
+    "ModelLoader": {
+        "input": {"required": {"model": [["wan-high.safetensors", "wan-low.safetensors"]]}},
+        "output": ["WANVIDEOMODEL"],
+    },
+    "LoadImage": {
+        "input": {"required": {"image": ["COMBO", {"options": ["example.png"]}]}},
+        "output": ["IMAGE", "MASK"],
+    },
+    "WanVideoSampler": {
+        "input": {
+            "required": {
+                "model": ["WANVIDEOMODEL"],
+                "image": ["IMAGE"],
+                "steps": ["INT", {"default": 8, "min": 1, "max": 100}],
+                "scheduler": [["unipc", "dpm++"]],
+            },
+            "optional": {"num_frames": ["INT", {"min": 1}], "cfg": ["FLOAT", {"min": 0.0, "max": 30.0}]},
+        },
+        "output": ["LATENT"],
+    },
+    "SaveVideo": {"input": {"required": {"samples": ["LATENT,IMAGE"]}}, "output": []},
+}
+
+
+def workflow(**sampler_inputs) -> dict:
+    inputs = {"model": ["1", 0], "image": ["2", 0], "steps": 8, "scheduler": "unipc", "num_frames": 81, **sampler_inputs}
+    return {
+        "1": {"class_type": "ModelLoader", "inputs": {"model": "wan-high.safetensors"}},
+        "2": {"class_type": "LoadImage", "inputs": {"image": "example.png"}},
+        "3": {"class_type": "WanVideoSampler", "inputs": {k: v for k, v in inputs.items() if v is not None}},
+        "4": {"class_type": "SaveVideo", "inputs": {"samples": ["3", 0]}},
+    }
+
+
+def test_valid_workflow_passes(handler):
+    assert handler.validate_workflow(workflow(), SCHEMA) == []
+
+
+@pytest.mark.parametrize(
+    "inputs, error",
+    [
+        ({"steps": None}, "필수 입력 steps 없음"),
+        ({"model": ["1", 0, 0]}, "링크 형식이 잘못됨"),
+        ({"model": ["9", 0]}, "없는 노드 9"),
+        ({"model": ["1", 1]}, "없는 출력 1"),
+        ({"model": ["2", 0]}, "WANVIDEOMODEL 인데 노드 2 의 출력은 IMAGE"),
+        ({"scheduler": "euler"}, "scheduler 값 'euler'"),
+        ({"steps": 0}, "최솟값 1"),
+        ({"cfg": 31.5}, "최댓값 30.0"),
+        ({"num_frames": 80}, "4n+1"),
+    ],
+)
+def test_invalid_inputs_are_reported(handler, inputs, error):
+    (message,) = handler.validate_workflow(workflow(**inputs), SCHEMA)
+    assert message.startswith("노드 3 (WanVideoSampler)") and error in message
+
+
+def test_unknown_class_and_files(handler):
+    wf = workflow()
+    wf["2"]["inputs"]["image"] = "upload_0123.png"
+    wf["5"] = {"class_type": "NotInstalled", "inputs": {}}
+    assert handler.validate_workflow(wf, SCHEMA) == [
+        "노드 2 (LoadImage): image 값 'upload_0123.png' 이(가) 사용 가능한 목록에 없습니다",
+        "노드 5: 설치되지 않은 노드 클래스 NotInstalled",
+    ]
+    # 이 job 이 저장한 입력 이미지는 스키마 목록에 없어도 통과
+    assert handler.validate_workflow(wf, SCHEMA, {"upload_0123.png"}) == ["노드 5: 설치되지 않은 노드 클래스 NotInstalled"]
+
+
+def test_templates_pass_against_comfyui_schema(handler, fake_comfy):
+    cache = handler.ObjectInfoCache()
+    schema = cache.get()
+    assert schema and "WanVideoSampler" in schema
+    for name, template in handler.TEMPLATES.items():
+        params = {"image": "in.png", "end_image": "end.png"} if name == "flf2v" else {"image": "in.png"}
+        assert handler.validate_workflow(template.apply(params), schema, {"in.png", "end.png"}) == [], name
+
+
+class CountingComfy:
+    def __init__(self, schemas):
+        self.schemas = list(schemas)
+        self.calls = 0
+
+    def get_json(self, path):
+        assert path == "/object_info"
+        self.calls += 1
+        schema = self.schemas.pop(0)
+        if isinstance(schema, Exception):
+            raise schema
+        return schema
+
+
+def test_schema_is_refetched_only_after_the_interval(handler, monkeypatch):
+    comfy = CountingComfy([SCHEMA, {**SCHEMA, "NotInstalled": {"input": {}, "output": []}}])
+    monkeypatch.setattr(handler, "comfy", comfy)
+    cache = handler.ObjectInfoCache()
+    assert cache.get() is cache.get()
+    assert comfy.calls == 1
+    assert not cache.refresh()
+
+    monkeypatch.setattr(handler, "OBJECT_INFO_REFRESH_INTERVAL", 0)
+    assert cache.refresh()
+    assert "NotInstalled" in cache.get()
+    assert comfy.calls == 2
+
+
+def test_preflight_retries_with_a_fresh_schema(handler, monkeypatch):
+    # 방금 설치한 노드: 캐시된 스키마에는 없고 새로 받은 스키마에는 있음
+    comfy = CountingComfy([SCHEMA, {**SCHEMA, "NotInstalled": {"input": {}, "output": []}}])
+    monkeypatch.setattr(handler, "comfy", comfy)
+    monkeypatch.setattr(handler, "object_info", handler.ObjectInfoCache())
+    monkeypatch.setattr(handler, "OBJECT_INFO_REFRESH_INTERVAL", 0)
+    wf = {**workflow(), "5": {"class_type": "NotInstalled", "inputs": {}}}
+    assert handler.preflight(wf) == []
+    assert comfy.calls == 2
+
+
+def test_preflight_is_skipped_without_a_schema(handler, monkeypatch):
+    monkeypatch.setattr(handler, "comfy", CountingComfy([ConnectionRefusedError("down")]))
+    monkeypatch.setattr(handler, "object_info", handler.ObjectInfoCache())
+    assert handler.preflight({"1": {"class_type": "NotInstalled", "inputs": {}}}) == []
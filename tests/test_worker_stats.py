@@ -0,0 +1,15 @@
+def test_prefetch_and_warm_up_are_reported_to_jobs(handler, fake_comfy, monkeypatch, tmp_path):
+    model = tmp_path / "wan2.2_test_model.safetensors"
+    model.write_bytes(b"\0" * (3 * 1024 * 1024 + 5))
+    monkeypatch.setattr(handler, "template_model_files", lambda: [(model.name, str(model))])
+    monkeypatch.setattr(handler, "WARMUP", True)
+
+    handler.prefetch_models()
+    handler.warm_up()
+
+    worker = handler.count_worker_job()
+    assert worker["prefetch_bytes"] == model.stat().st_size
+    assert worker["prefetch_seconds"] is not None
+    assert worker["comfy_ready_seconds"] is not None
+    assert worker["warmup_seconds"] is not None
+    assert handler.WORKER_STATS["warmup_ok"] is True